@@ -13,12 +13,15 @@ def create_app():
             os.makedirs(data_dir)
     
     # Initialize database
-    from app.models.database import init_database, seed_default_passwords
+    from app.models.database import init_database, seed_default_passwords, init_request_scope
     with app.app_context():
         init_database()
         # Seed default passwords for any players missing one
         seed_default_passwords(default_password='svdo@2025')
 
+    # One connection + transaction per request, shared by all model calls
+    init_request_scope(app)
+
     # Jinja filter for Dutch date formatting (dd-MM-yyyy)
     def date_nl(value):
         try:
@@ -47,6 +50,9 @@ def create_app():
     app.register_blueprint(debug, url_prefix='/debug')
     app.register_blueprint(test, url_prefix='/test')
     
+    # The job worker thread (app.services.jobs) is started by gunicorn.conf.py
+    # or the dev server in run.py, not here
+
     # Expose app version in templates
     @app.context_processor
     def inject_app_version():
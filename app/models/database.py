@@ -1,25 +1,436 @@
+import os
+import atexit
+import threading
 import psycopg
-from flask import current_app
+from psycopg_pool import ConnectionPool
+from flask import current_app, g, has_request_context, jsonify, request, session
 from datetime import datetime
 from config import Config
 
-def get_db_connection():
-    """Get a PostgreSQL database connection."""
+# Process-wide connection pool (one per gunicorn worker, recreated after fork)
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _conninfo():
+    """Build the libpq connection string from Config.DB_CONFIG."""
+    return f"host={Config.DB_CONFIG['host']} port={Config.DB_CONFIG['port']} dbname={Config.DB_CONFIG['database']} user={Config.DB_CONFIG['user']} password={Config.DB_CONFIG['password']}"
+
+
+def _reset_pool_after_fork():
+    """Forget the parent's pool in a forked child (e.g. gunicorn --preload workers).
+
+    The inherited sockets belong to the parent, so we must not close them here;
+    the child simply builds its own pool on first use.
+    """
+    global _pool, _pool_pid
+    _pool = None
+    _pool_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def get_pool():
+    """Return the connection pool for this process, creating it on first use."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ConnectionPool(
+                _conninfo(),
+                kwargs={'row_factory': psycopg.rows.dict_row},
+                min_size=Config.DB_POOL_MIN_SIZE,
+                max_size=Config.DB_POOL_MAX_SIZE,
+                max_lifetime=Config.DB_POOL_MAX_LIFETIME,
+                max_idle=Config.DB_POOL_MAX_IDLE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                check=ConnectionPool.check_connection,
+                name=f'svdo-{pid}',
+                open=True,
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def close_pool():
+    """Close the pool of this process (no-op when not created or inherited from a parent)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            try:
+                _pool.close()
+            except Exception as e:
+                print(f"Error closing connection pool: {e}")
+        _pool = None
+        _pool_pid = None
+
+
+atexit.register(close_pool)
+
+
+def get_pool_stats():
+    """Return usage and wait statistics of this process' connection pool."""
+    if not Config.DB_POOL_ENABLED:
+        return {'enabled': False}
+    pool = _pool if _pool_pid == os.getpid() else None
+    stats = {
+        'enabled': True,
+        'pid': os.getpid(),
+        'min_size': Config.DB_POOL_MIN_SIZE,
+        'max_size': Config.DB_POOL_MAX_SIZE,
+        'max_lifetime': Config.DB_POOL_MAX_LIFETIME,
+        'open': pool is not None,
+    }
+    if pool is not None:
+        stats.update(pool.get_stats())
+    return stats
+
+
+class PooledConnection:
+    """A pooled psycopg connection that returns itself to the pool on close().
+
+    Models keep using the familiar conn.cursor()/commit()/rollback()/close()
+    pattern; close() hands the connection back (the pool rolls back anything
+    left uncommitted) instead of tearing down the TCP session.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._pid = os.getpid()
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise psycopg.OperationalError('the connection is closed')
+        return getattr(conn, name)
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._pid != os.getpid():
+            # Inherited over fork: the socket belongs to the parent process
+            return
+        # Read-only model calls never commit; end their transaction quietly
+        # instead of letting the pool warn about it on every return.
+        if not conn.closed and conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        self._pool.putconn(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._conn is not None and not self._conn.closed:
+                if exc_type is None:
+                    self._conn.commit()
+                else:
+                    self._conn.rollback()
+        finally:
+            self.close()
+
+    def __del__(self):
+        # Safety net for code paths that forget to close their connection
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class RequestConnection:
+    """Connection handle shared by all model calls within one Flask request.
+
+    The request is one unit of work: commit() and close() from the models are
+    deferred to the after_request handler, which commits once (or rolls back
+    on errors). rollback() aborts the unit of work right away and marks the
+    request as failed: it answers with a server error instead of committing
+    the half that is left.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['_conn'], name)
+
+    @property
+    def closed(self):
+        return self._conn.closed
+
+    def commit(self):
+        # Committed once in the after_request handler
+        pass
+
+    def rollback(self):
+        self._conn.rollback()
+        g._db_rollback_only = True
+
+    def close(self):
+        # Returned to the pool in the teardown handler
+        pass
+
+
+class SavepointConnection(RequestConnection):
+    """Request connection handle of one service call, inside a SAVEPOINT.
+
+    rollback() undoes only the work of this call (ROLLBACK TO SAVEPOINT), so
+    the rest of the request can still be committed; commit() releases the
+    savepoint, its work is committed with the request.
+    """
+
+    def __init__(self, conn, name):
+        super().__init__(conn)
+        self._name = name
+        self._open = True
+        conn.execute(f'SAVEPOINT {name}')
+
+    def commit(self):
+        if self._open:
+            self._open = False
+            self._conn.execute(f'RELEASE SAVEPOINT {self._name}')
+
+    def rollback(self):
+        if self._open:
+            self._open = False
+            self._conn.execute(f'ROLLBACK TO SAVEPOINT {self._name}')
+            self._conn.execute(f'RELEASE SAVEPOINT {self._name}')
+
+
+def _open_connection():
+    """Open a connection outside the request scope (pooled unless disabled)."""
+    if not Config.DB_POOL_ENABLED:
+        return psycopg.connect(_conninfo(), row_factory=psycopg.rows.dict_row)
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
+
+
+def get_db_connection(savepoint=False):
+    """Get a PostgreSQL database connection.
+
+    Inside a Flask request all callers share one connection and transaction
+    (see init_request_scope); scripts, CLI tools and startup code outside a
+    request get their own connection from the pool.
+
+    Args:
+        savepoint: inside a request, run the caller's work in a SAVEPOINT so
+            that its rollback() does not discard the rest of the request
+            (for services that roll back their own errors and carry on)
+    """
     try:
-        # PostgreSQL connection with psycopg3
-        conn_str = f"host={Config.DB_CONFIG['host']} port={Config.DB_CONFIG['port']} dbname={Config.DB_CONFIG['database']} user={Config.DB_CONFIG['user']} password={Config.DB_CONFIG['password']}"
-        conn = psycopg.connect(conn_str, row_factory=psycopg.rows.dict_row)
-        return conn
+        if has_request_context():
+            handle = g.get('_db_conn')
+            if handle is None:
+                handle = RequestConnection(_open_connection())
+                g._db_conn = handle
+            if savepoint:
+                g._db_savepoints = g.get('_db_savepoints', 0) + 1
+                return SavepointConnection(handle._conn, f'request_sp_{g._db_savepoints}')
+            return handle
+        return _open_connection()
     except Exception as e:
         print(f"Database connection error: {e}")
         raise
 
+
+def _failed_response(message):
+    """Server error response for a request whose writes were not saved."""
+    # Success messages flashed by the view are not true anymore
+    session.pop('_flashes', None)
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'success': False, 'error': message}), 500
+    return message, 500
+
+
+def _commit_request_transaction(response):
+    """Commit the request's unit of work before the response goes out.
+
+    A failed commit, a rollback by one of the models or a swallowed SQL error
+    turns the response into a server error, so the client never sees a
+    success for writes that were not saved.
+    """
+    handle = g.get('_db_conn')
+    if handle is None or handle.closed:
+        return response
+    conn = handle._conn
+    g._db_finished = True
+    failed = conn.info.transaction_status == psycopg.pq.TransactionStatus.INERROR
+    if response.status_code >= 500:
+        conn.rollback()
+        return response
+    if failed or g.get('_db_rollback_only'):
+        conn.rollback()
+        return current_app.make_response(_failed_response('De wijzigingen konden niet worden opgeslagen.'))
+    try:
+        conn.commit()
+    except Exception as e:
+        print(f"❌ Error committing request transaction: {e}")
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        return current_app.make_response(_failed_response('Opslaan mislukt, probeer het opnieuw.'))
+    return response
+
+
+def _teardown_request_connection(exc=None):
+    """Roll back whatever the after_request handler did not commit and release the connection."""
+    handle = g.pop('_db_conn', None)
+    finished = g.pop('_db_finished', False)
+    g.pop('_db_rollback_only', None)
+    if handle is None:
+        return
+    conn = handle._conn
+    try:
+        if not conn.closed and not finished:
+            conn.rollback()
+    except Exception as e:
+        print(f"Error rolling back request transaction: {e}")
+    finally:
+        conn.close()
+
+
+def init_request_scope(app):
+    """Register the per-request unit-of-work handlers on the Flask app."""
+    app.after_request(_commit_request_transaction)
+    app.teardown_request(_teardown_request_connection)
+
+def insert_planning_rows(cursor, rows, planning_version_id=1, on_conflict='nothing'):
+    """Insert many match_planning rows in one batch.
+
+    Args:
+        cursor: cursor of the caller's connection/transaction
+        rows: iterable of (match_id, player_id) or
+              (match_id, player_id, is_pinned, actually_played) tuples
+        planning_version_id: planning version (single planning uses 1)
+        on_conflict: 'nothing' keeps existing rows, 'update' overwrites their
+                     is_pinned/actually_played flags, None raises on duplicates
+
+    The rows are sent with executemany, which psycopg runs in pipeline mode:
+    the whole batch costs a single network round trip instead of one per row.
+
+    Returns:
+        Number of rows sent.
+    """
+    params = []
+    for row in rows:
+        if len(row) == 2:
+            match_id, player_id = row
+            is_pinned, actually_played = False, False
+        else:
+            match_id, player_id, is_pinned, actually_played = row
+        params.append((planning_version_id, match_id, player_id, bool(is_pinned), bool(actually_played)))
+    if not params:
+        return 0
+
+    query = '''
+        INSERT INTO match_planning (planning_version_id, match_id, player_id, is_pinned, actually_played)
+        VALUES (%s, %s, %s, %s, %s)
+    '''
+    if on_conflict == 'nothing':
+        query += ' ON CONFLICT (planning_version_id, match_id, player_id) DO NOTHING'
+    elif on_conflict == 'update':
+        query += '''
+            ON CONFLICT (planning_version_id, match_id, player_id)
+            DO UPDATE SET is_pinned = EXCLUDED.is_pinned, actually_played = EXCLUDED.actually_played
+        '''
+    cursor.executemany(query, params)
+    return len(params)
+
+# Tables whose writes bump a data_versions counter (table, counter name)
+DATA_VERSION_TABLES = (
+    ('player_availability', 'availability'),
+    ('matches', 'matches'),
+    ('players', 'players'),
+    ('match_planning', 'planning'),
+)
+
+# NOTIFY channel with '<name>:<version>' payloads (app.services.data_cache listens)
+DATA_VERSION_CHANNEL = 'data_versions'
+
+# pg advisory lock key: one schema setup at a time (workers booting together)
+SCHEMA_LOCK_KEY = 0x5644_4F00
+
+
+def create_data_versions(cursor, tracked=DATA_VERSION_TABLES):
+    """Create the data_versions counters and the triggers that bump them.
+
+    Every INSERT/UPDATE/DELETE/TRUNCATE statement on a tracked table sets the
+    counter of its name to a fresh value from data_version_seq, in the same
+    transaction, and sends a NOTIFY that is delivered when it commits.
+    Sequence values are never handed out twice, so a version seen inside a
+    transaction that is rolled back never comes back with other data:
+    in-process caches can safely use (name, version) as their key.
+    """
+    cursor.execute('CREATE SEQUENCE IF NOT EXISTS data_version_seq')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+        DECLARE
+            new_version BIGINT := nextval('data_version_seq');
+        BEGIN
+            INSERT INTO data_versions (name, version)
+            VALUES (TG_ARGV[0], new_version)
+            ON CONFLICT (name) DO UPDATE
+            SET version = EXCLUDED.version, updated_at = CURRENT_TIMESTAMP;
+            PERFORM pg_notify('{DATA_VERSION_CHANNEL}', TG_ARGV[0] || ':' || new_version);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    for table, name in tracked:
+        trigger = f'{table}_data_version'
+        cursor.execute('SELECT 1 FROM pg_trigger WHERE tgname = %s', (trigger,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'''
+                CREATE TRIGGER {trigger}
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version('{name}')
+            ''')
+
+
+def get_data_version(cursor, name):
+    """Current version of a data_versions counter (0 when never bumped)."""
+    cursor.execute('SELECT version FROM data_versions WHERE name = %s', (name,))
+    row = cursor.fetchone()
+    return row['version'] if row else 0
+
+
+def get_data_versions(cursor, names):
+    """Versions of several counters with one query, as a tuple in the order of names."""
+    names = list(names)
+    cursor.execute('SELECT name, version FROM data_versions WHERE name = ANY(%s)', (names,))
+    versions = {row['name']: row['version'] for row in cursor.fetchall()}
+    return tuple(versions.get(name, 0) for name in names)
+
 def init_database():
     """Initialize the database with required tables."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
+        # Concurrent CREATE ... IF NOT EXISTS can still collide: serialize the setup
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_KEY,))
+
         # PostgreSQL syntax - Enhanced schema with planning features
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS players (
@@ -139,6 +550,19 @@ def init_database():
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_player_availability_player ON player_availability(player_id)
         ''')
+
+        # Version counters for the in-process caches (app.services.availability)
+        create_data_versions(cursor)
+
+        # Memoized planner results shared between processes (app.services.plan_cache)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS plan_cache (
+                key TEXT PRIMARY KEY,
+                result JSONB NOT NULL,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                used_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
         
         # Issue #22: Create single planning version (ID=1) for new single planning system
         print("🔧 Setting up single planning system (Issue #22)...")
@@ -1,4 +1,5 @@
 from app.models.database import get_db_connection
+from app.services import data_cache
 from datetime import datetime, date
 
 class Match:
@@ -13,17 +14,26 @@ class Match:
 
     @staticmethod
     def get_all():
-        """Get all matches ordered by date."""
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        """Get all matches ordered by date (cached, see app.services.data_cache)."""
+        return data_cache.get('matches', 'all', Match._load_all)
+
+    @staticmethod
+    def _load_all(cursor):
         cursor.execute('''
             SELECT * FROM matches 
             ORDER BY match_date ASC, match_time ASC
         ''')
-        matches = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return matches
+        return cursor.fetchall()
+
+    @staticmethod
+    def get_season(cursor=None):
+        """Get all matches in season order (date, id), as the planner reads them (cached)."""
+        return data_cache.get('matches', 'season', Match._load_season, cursor)
+
+    @staticmethod
+    def _load_season(cursor):
+        cursor.execute('SELECT * FROM matches ORDER BY match_date, id')
+        return cursor.fetchall()
 
     @staticmethod
     def get_by_id(match_id):
@@ -116,6 +126,7 @@ class Match:
                 # Do not fail match creation if seeding availability has an issue; log and continue
                 print(f"Warning: could not seed default availability for match {match_id}: {se}")
             conn.commit()
+            data_cache.invalidate('matches')
             cursor.close()
             conn.close()
             return match_id
@@ -162,6 +173,7 @@ class Match:
         cursor = conn.cursor()
         cursor.execute(query, params)
         conn.commit()
+        data_cache.invalidate('matches')
         cursor.close()
         conn.close()
 
@@ -181,6 +193,7 @@ class Match:
         cursor.execute('DELETE FROM matches WHERE id = %s', (match_id,))
         
         conn.commit()
+        data_cache.invalidate('matches')
         cursor.close()
         conn.close()
 
@@ -193,7 +206,7 @@ class Match:
         query = '''
             SELECT * FROM matches 
             WHERE match_date >= %s 
-            ORDER BY match_date ASC, match_time ASC
+            ORDER BY match_date ASC, match_time ASC, id ASC
         '''
         
         params = [date.today()]
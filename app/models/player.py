@@ -1,4 +1,5 @@
 from app.models.database import get_db_connection
+from app.services import availability, data_cache
 from werkzeug.security import generate_password_hash, check_password_hash
 
 class Player:
@@ -10,9 +11,11 @@ class Player:
     
     @staticmethod
     def get_all():
-        """Get all active players with partner names."""
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        """Get all active players with partner names (cached, see app.services.data_cache)."""
+        return data_cache.get('players', 'all', Player._load_all)
+
+    @staticmethod
+    def _load_all(cursor):
         cursor.execute('''
             SELECT p.*, partner.name as partner_name
             FROM players p
@@ -20,10 +23,17 @@ class Player:
             WHERE p.is_active = true
             ORDER BY p.name
         ''')
-        players = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return players
+        return cursor.fetchall()
+
+    @staticmethod
+    def get_active(cursor=None):
+        """Get all active players ordered by name and id (cached, as the planner reads them)."""
+        return data_cache.get('players', 'active', Player._load_active, cursor)
+
+    @staticmethod
+    def _load_active(cursor):
+        cursor.execute('SELECT * FROM players WHERE is_active = TRUE ORDER BY name, id')
+        return cursor.fetchall()
     
     @staticmethod
     def get_by_id(player_id):
@@ -38,6 +48,19 @@ class Player:
         conn.close()
         return player
 
+    @staticmethod
+    def get_by_id_cached(player_id):
+        """Get a player by ID (active or not) from the cached roster, see app.services.data_cache."""
+        for player in data_cache.get('players', 'everyone', Player._load_everyone):
+            if player['id'] == player_id:
+                return player
+        return None
+
+    @staticmethod
+    def _load_everyone(cursor):
+        cursor.execute('SELECT * FROM players ORDER BY id')
+        return cursor.fetchall()
+
     @staticmethod
     def get_by_email(email):
         """Get a player by email (case-insensitive)."""
@@ -65,6 +88,7 @@ class Player:
             WHERE id = %s
         ''', (hashed, force_change, player_id))
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
 
@@ -79,6 +103,7 @@ class Player:
             WHERE id = %s
         ''', (player_id,))
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
 
@@ -106,6 +131,7 @@ class Player:
         result = cursor.fetchone()
         player_id = result['id']
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
         return player_id
@@ -145,6 +171,7 @@ class Player:
         cursor = conn.cursor()
         cursor.execute(query, params)
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
 
@@ -158,7 +185,7 @@ class Player:
         - If B had an old partner D (and D != A), we clear B -> D and D -> B if it was reciprocal.
         - When unlinking (partner_id is None), we clear A -> None and clear B -> None if B was pointing to A.
         """
-        conn = get_db_connection()
+        conn = get_db_connection(savepoint=True)
         cursor = conn.cursor()
         try:
             # Prevent self-link
@@ -205,6 +232,7 @@ class Player:
                         cursor.execute('UPDATE players SET partner_id = NULL WHERE id = %s', (current_partner,))
 
             conn.commit()
+            data_cache.invalidate('players')
         except Exception:
             conn.rollback()
             raise
@@ -215,7 +243,7 @@ class Player:
     @staticmethod
     def set_partner_preference_bidirectional(player_id, prefer_together=True):
         """Set prefer_partner_together for player and mirror to their partner if present."""
-        conn = get_db_connection()
+        conn = get_db_connection(savepoint=True)
         cursor = conn.cursor()
         try:
             cursor.execute('UPDATE players SET prefer_partner_together = %s WHERE id = %s', (prefer_together, player_id))
@@ -225,6 +253,7 @@ class Player:
             if row and row['partner_id']:
                 cursor.execute('UPDATE players SET prefer_partner_together = %s WHERE id = %s', (prefer_together, row['partner_id']))
             conn.commit()
+            data_cache.invalidate('players')
         except Exception:
             conn.rollback()
             raise
@@ -265,6 +294,7 @@ class Player:
             WHERE id = %s
         ''', (prefer_together, player_id))
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
     
@@ -288,6 +318,7 @@ class Player:
         cursor = conn.cursor()
         cursor.execute('DELETE FROM players WHERE id = %s', (player_id,))
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
 
@@ -302,6 +333,7 @@ class Player:
             WHERE id = %s
         ''', (player_id,))
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
 
@@ -316,6 +348,7 @@ class Player:
             WHERE id = %s
         ''', (player_id,))
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
 
@@ -350,37 +383,14 @@ class Player:
     @staticmethod
     def get_availability_stats(player_id):
         """Get availability statistics for a player."""
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) as total_matches,
-                   SUM(CASE WHEN is_available = true THEN 1 ELSE 0 END) as available,
-                   SUM(CASE WHEN is_available = false THEN 1 ELSE 0 END) as unavailable
-            FROM player_availability 
-            WHERE player_id = %s
-        ''', (player_id,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        if result:
-            total = result['total_matches'] or 0
-            available = result['available'] or 0
-            unavailable = result['unavailable'] or 0
-            
-            return {
-                'total_matches': total,
-                'available': available,
-                'unavailable': unavailable,
-                'availability_rate': (available / total * 100) if total > 0 else 0
-            }
-        else:
-            return {
-                'total_matches': 0,
-                'available': 0,
-                'unavailable': 0,
-                'availability_rate': 0
-            }
+        available, unavailable = availability.get_matrix().counts(player_id)
+        total = available + unavailable
+        return {
+            'total_matches': total,
+            'available': available,
+            'unavailable': unavailable,
+            'availability_rate': (available / total * 100) if total > 0 else 0
+        }
 
     @staticmethod
     def get_availability(player_id, match_id):
@@ -408,6 +418,7 @@ class Player:
             DO UPDATE SET is_available = %s, notes = %s, updated_at = CURRENT_TIMESTAMP
         ''', (player_id, match_id, is_available, notes, is_available, notes))
         conn.commit()
+        data_cache.invalidate('availability')
         cursor.close()
         conn.close()
 
@@ -499,36 +510,84 @@ class Player:
 
     @staticmethod
     def get_availability(player_id, match_id):
-        """Get player availability for a specific match."""
+        """Get player availability for a specific match ({'is_available', 'notes'} or None)."""
+        return availability.get_matrix().entry(player_id, match_id)
+
+    @staticmethod
+    def set_availability(player_id, match_id, is_available, notes=None):
+        """Set player availability for a specific match."""
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT is_available, notes
-            FROM player_availability 
-            WHERE player_id = %s AND match_id = %s
-        ''', (player_id, match_id))
-        result = cursor.fetchone()
+            INSERT INTO player_availability (player_id, match_id, is_available, notes)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (player_id, match_id)
+            DO UPDATE SET 
+                is_available = EXCLUDED.is_available,
+                notes = EXCLUDED.notes,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (player_id, match_id, is_available, notes))
+        conn.commit()
+        data_cache.invalidate('availability')
         cursor.close()
         conn.close()
+
+    @staticmethod
+    def get_availability_bulk(player_ids, match_ids):
+        """Get availability for a block of the availability matrix (e.g. one player's row or one match's column).
+
+        Returns:
+            {player_id: {match_id: {'is_available', 'notes'}}}, answered cells only
+        """
+        matrix = availability.get_matrix()
+        result = {}
+        match_ids = list(match_ids)
+        for player_id in player_ids:
+            row = {}
+            for match_id in match_ids:
+                entry = matrix.entry(player_id, match_id)
+                if entry is not None:
+                    row[match_id] = entry
+            result[player_id] = row
         return result
 
     @staticmethod
-    def set_availability(player_id, match_id, is_available, notes=None):
-        """Set player availability for a specific match."""
+    def set_availability_bulk(updates):
+        """Upsert many availability answers in one statement.
+
+        Args:
+            updates: iterable of (player_id, match_id, is_available, notes);
+                     a later answer for the same cell wins
+
+        Returns:
+            Number of cells written.
+        """
+        cells = {}
+        for player_id, match_id, is_available, notes in updates:
+            cells[(int(player_id), int(match_id))] = (bool(is_available), notes)
+        if not cells:
+            return 0
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('''
             INSERT INTO player_availability (player_id, match_id, is_available, notes)
-            VALUES (%s, %s, %s, %s)
+            SELECT * FROM unnest(%s::integer[], %s::integer[], %s::boolean[], %s::text[])
             ON CONFLICT (player_id, match_id)
             DO UPDATE SET 
                 is_available = EXCLUDED.is_available,
                 notes = EXCLUDED.notes,
                 updated_at = CURRENT_TIMESTAMP
-        ''', (player_id, match_id, is_available, notes))
+        ''', (
+            [player_id for player_id, _ in cells],
+            [match_id for _, match_id in cells],
+            [is_available for is_available, _ in cells.values()],
+            [notes for _, notes in cells.values()],
+        ))
         conn.commit()
+        data_cache.invalidate('availability')
         cursor.close()
         conn.close()
+        return len(cells)
 
     @staticmethod
     def update_role(player_id, role):
@@ -541,6 +600,7 @@ class Player:
             WHERE id = %s
         ''', (role, player_id))
         conn.commit()
+        data_cache.invalidate('players')
         cursor.close()
         conn.close()
 
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify
 from config import Config
 from app.utils.db_adapter import get_database_info
+from app.models.database import get_pool_stats
 
 debug = Blueprint('debug', __name__)
 
@@ -19,3 +20,11 @@ def database_info():
             'has_database_url': bool(Config.DATABASE_URL)
         }
     })
+
+@debug.route('/debug/pool')
+def pool_info():
+    """Debug route to show connection pool usage and wait statistics"""
+    if not Config.SECRET_KEY.endswith('2025'):
+        return jsonify({'error': 'Access denied'}), 403
+
+    return jsonify({'pool': get_pool_stats()})
@@ -1,10 +1,11 @@
-from flask import Blueprint, render_template, flash, redirect, url_for
+from flask import Blueprint, render_template, flash, redirect, url_for, session
 from app.utils.auth import roles_required, login_required
 from app.models.player import Player
 from app.models.match import Match
-from app.services.import_service import ImportService
 from app.services.scraper import TeamBeheerScraper
 from app.services.single_planning import SinglePlanning
+from app.services import data_cache
+from app.services.jobs import JobQueue
 
 main = Blueprint('main', __name__)
 
@@ -13,14 +14,11 @@ main = Blueprint('main', __name__)
 def index():
     """Homepage with overview."""
     players = Player.get_all()
-    upcoming_matches = Match.get_upcoming()[:5]  # Next 5 matches
-    # Fetch planned players for each upcoming match
+    upcoming_matches = Match.get_upcoming(limit=5)  # Next 5 matches
+    # Fetch planned players for all upcoming matches in one query
     planning_by_match = {}
     try:
-        for m in upcoming_matches:
-            match_id = m.id if hasattr(m, 'id') else m.get('id')
-            if match_id is not None:
-                planning_by_match[match_id] = SinglePlanning.get_match_planning(match_id)
+        planning_by_match = SinglePlanning.get_planning_for_matches(m['id'] for m in upcoming_matches)
     except Exception:
         # Fail-safe: if planning fetch fails, leave it empty to not break homepage
         planning_by_match = {}
@@ -30,49 +28,30 @@ def index():
                          upcoming_matches=upcoming_matches,
                          planning_by_match=planning_by_match)
 
-@main.route('/import_matches')
-@roles_required('captain', 'reserve captain')
-def import_matches():
-    """Import matches from teambeheer.nl"""
+def _queue_import(kind, label):
+    """Queue an import job (the worker runs it; a long scrape must not block the request)."""
     try:
-        service = ImportService()
-        result = service.import_matches(use_static_fallback=True)
-        
-        if result['success']:
-            if result['imported'] > 0:
-                flash(f"Successfully imported {result['imported']} matches! (Skipped {result['skipped']} existing)", 'success')
-            else:
-                flash('No new matches found to import.', 'info')
+        job, created = JobQueue.enqueue(kind, {'use_static_fallback': True} if kind == 'import_matches' else {},
+                                        created_by=session.get('player_id'))
+        if created:
+            flash(f"Importing {label} in the background (job #{job['id']}). Refresh the page in a moment to see the result.", 'info')
         else:
-            error_msg = result['messages'][-1] if result['messages'] else 'Unknown error occurred'
-            flash(f'Error importing matches: {error_msg}', 'error')
-            
+            flash(f"An import of {label} is already running (job #{job['id']}).", 'warning')
     except Exception as e:
-        flash(f'Error importing matches: {str(e)}', 'error')
-    
+        flash(f'Error importing {label}: {str(e)}', 'error')
     return redirect(url_for('main.index'))
 
+@main.route('/import_matches')
+@roles_required('captain', 'reserve captain')
+def import_matches():
+    """Import matches from teambeheer.nl (as a background job)"""
+    return _queue_import('import_matches', 'matches')
+
 @main.route('/import_players')
 @roles_required('captain', 'reserve captain')
 def import_players():
-    """Import players from teambeheer.nl"""
-    try:
-        service = ImportService()
-        result = service.import_players()
-        
-        if result['success']:
-            if result['imported'] > 0:
-                flash(f"Successfully imported {result['imported']} players! (Skipped {result['skipped']} existing)", 'success')
-            else:
-                flash('No new players found to import.', 'info')
-        else:
-            error_msg = result['messages'][-1] if result['messages'] else 'Unknown error occurred'
-            flash(f'Error importing players: {error_msg}', 'error')
-            
-    except Exception as e:
-        flash(f'Error importing players: {str(e)}', 'error')
-    
-    return redirect(url_for('main.index'))
+    """Import players from teambeheer.nl (as a background job)"""
+    return _queue_import('import_players', 'players')
 
 @main.route('/clear_all_matches', methods=['POST'])
 @roles_required('captain', 'reserve captain')
@@ -98,6 +77,7 @@ def clear_all_matches():
         deleted_matches = cursor.rowcount
         
         conn.commit()
+        data_cache.invalidate('matches')
         cursor.close()
         conn.close()
         
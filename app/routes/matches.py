@@ -116,13 +116,14 @@ def match_availability(match_id):
         return redirect(url_for('matches.list_matches'))
     
     players = Player.get_all()
+    # This match's column of the availability matrix
+    column = Player.get_availability_bulk([p['id'] for p in players], [match_id])
     availability_data = []
     
     for player in players:
-        availability = Player.get_availability(player['id'], match_id)
         availability_data.append({
             'player': player,
-            'availability': availability
+            'availability': column[player['id']].get(match_id)
         })
     
     return render_template('matches/availability.html', 
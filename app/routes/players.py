@@ -4,6 +4,8 @@ from app.utils.auth import login_required, roles_required, get_current_user
 from app.models.player import Player
 from app.models.match import Match
 from app.services.single_planning import SinglePlanning
+from app.services import player_stats as player_stats_service
+from config import Config
 
 players = Blueprint('players', __name__)
 
@@ -19,17 +21,14 @@ def list_players():
     # Single planning system info
     active_planning_name = "Single Planning System"
     
-    # Get availability and match stats for each player
+    # Get availability and match stats for all players (one grouped query)
+    stats = player_stats_service.get_stats(p['id'] for p in all_players)
     players_with_stats = []
     for player in all_players:
-        availability_stats = Player.get_availability_stats(player['id'])
-        match_stats = Player.get_match_stats(player['id'])  # Played matches (all time)
-        active_planning_stats = Player.get_active_planning_stats(player['id'])  # Planned matches (active only)
-        
         player_dict = dict(player)
-        player_dict['availability_stats'] = availability_stats
-        player_dict['match_stats'] = match_stats
-        player_dict['active_planning_stats'] = active_planning_stats  # Add active planning stats
+        player_dict['availability_stats'] = stats[player['id']]['availability']
+        player_dict['match_stats'] = stats[player['id']]['history']  # Played matches (all time)
+        player_dict['active_planning_stats'] = stats[player['id']]['planning']  # Planned matches (active only)
         players_with_stats.append(player_dict)
 
     return render_template('players/list.html', 
@@ -132,6 +131,13 @@ def deactivate_player(player_id):
     
     return redirect(url_for('players.list_players'))
 
+def _auto_repair(cells):
+    """Repair the planning around newly unavailable cells (if PLANNING_AUTO_REPAIR); None when skipped."""
+    unavailable_cells = [(pid, mid) for pid, mid, is_available, _ in cells if not is_available]
+    if not Config.PLANNING_AUTO_REPAIR or not unavailable_cells:
+        return None
+    return SinglePlanning.repair_planning(unavailable_cells)
+
 @players.route('/<int:player_id>/availability', methods=['GET', 'POST'])
 @login_required
 def player_availability(player_id):
@@ -153,39 +159,42 @@ def player_availability(player_id):
             try:
                 data = request.get_json()
                 updates = data.get('updates', [])
+                cells = [
+                    (player_id, int(update.get('match_id')), bool(update.get('is_available', False)), update.get('notes', ''))
+                    for update in updates
+                ]
+                Player.set_availability_bulk(cells)
                 
-                for update in updates:
-                    match_id = update.get('match_id')
-                    is_available = update.get('is_available', False)
-                    notes = update.get('notes', '')
-                    
-                    Player.set_availability(player_id, match_id, is_available, notes)
-                
-                return jsonify({'success': True, 'message': f'Beschikbaarheid bijgewerkt voor {len(updates)} wedstrijden'})
+                response = {'success': True, 'message': f'Beschikbaarheid bijgewerkt voor {len(updates)} wedstrijden'}
+                repair = _auto_repair(cells)
+                if repair is not None:
+                    response['repair'] = repair
+                return jsonify(response)
                 
             except Exception as e:
                 return jsonify({'success': False, 'error': str(e)})
         
         # Handle regular form submission
+        cells = []
         for key, value in request.form.items():
             if key.startswith('availability_'):
                 match_id = key.replace('availability_', '')
                 is_available = value == 'on'
                 notes = request.form.get(f'notes_{match_id}', '')
-                Player.set_availability(player_id, match_id, is_available, notes)
+                cells.append((player_id, match_id, is_available, notes))
+        Player.set_availability_bulk(cells)
         
         flash('Beschikbaarheid succesvol bijgewerkt!', 'success')
+        repair = _auto_repair(cells)
+        if repair and repair.get('changes'):
+            flash(f"Planning aangepast: {repair['changes']} wijzigingen door de nieuwe beschikbaarheid.", 'info')
         return redirect(url_for('players.player_availability', player_id=player_id))
     
     # GET request - show availability form
     matches = Match.get_all()
     
-    # Get current availability data
-    availability_data = {}
-    for match in matches:
-        availability = Player.get_availability(player_id, match['id'])
-        if availability:
-            availability_data[match['id']] = availability
+    # Get current availability data (this player's row of the matrix)
+    availability_data = Player.get_availability_bulk([player_id], [m['id'] for m in matches])[player_id]
     
     return render_template('players/availability.html', 
                          player=player, 
@@ -203,9 +212,10 @@ def player_stats(player_id):
         return redirect(url_for('players.list_players'))
     
     # Collect statistics
-    sp_stats = SinglePlanning.get_player_stats(player_id)  # active planning stats
-    availability = Player.get_availability_stats(player_id)
-    history = Player.get_match_stats(player_id)  # actually played over time
+    stats = player_stats_service.get_stats([player_id])[player_id]
+    sp_stats = stats['planning']  # active planning stats
+    availability_stats = stats['availability']
+    history = stats['history']  # actually played over time
 
     # Compute simple ratios
     planned = sp_stats.get('matches_planned', 0) if sp_stats else 0
@@ -225,11 +235,7 @@ def player_stats(player_id):
 
     # For availability tab
     matches = Match.get_all()
-    availability_data = {}
-    for m in matches:
-        av = Player.get_availability(player_id, m['id'])
-        if av:
-            availability_data[m['id']] = av
+    availability_data = Player.get_availability_bulk([player_id], [m['id'] for m in matches])[player_id]
 
     # For overview tab: list matches this player is planned to play (upcoming)
     planning_rows = SinglePlanning.get_planning() or []
@@ -300,7 +306,7 @@ def player_stats(player_id):
     return render_template('players/stats.html', 
                            player=player, 
                            sp_stats=sp_stats,
-                           availability=availability,
+                           availability=availability_stats,
                            history=history,
                            percent_played=int(percent_played),
                            partner_name=partner_name,
@@ -2,20 +2,37 @@
 Single Planning Routes - Issue #22
 Routes for the simplified single planning system.
 """
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
-from app.utils.auth import login_required, roles_required
+import os
+import threading
+from collections import OrderedDict
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, session, make_response, current_app
+from app.utils.auth import login_required, roles_required, get_current_user
 from app.services.single_planning import SinglePlanning
+from app.services.jobs import JobQueue, JOB_KINDS
+from app.services import scoring, availability, data_cache, player_stats as player_stats_service
+from config import Config
 from app.models.database import get_db_connection
 from app.models.match import Match
 from app.models.player import Player
 
 single_planning = Blueprint('single_planning', __name__, url_prefix='/planning')
 
+# The matrix depends on these data_versions counters (see app.services.data_cache)
+MATRIX_DATA_NAMES = ('availability', 'matches', 'players', 'planning')
+MATRIX_PAGE_CACHE_SIZE = 32
+
+# Rendered matrix pages by ETag (data version, user, templates)
+_matrix_pages = OrderedDict()
+_matrix_pages_lock = threading.Lock()
+
 # Helper to build matrix data for reuse across views
-def _build_matrix_data():
+def _build_matrix_data(cursor=None):
+    """Matrix data and version; all queries run on the given cursor (one connection) if any."""
     service = SinglePlanning()
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    own = cursor is None
+    if own:
+        conn = get_db_connection()
+        cursor = conn.cursor()
 
     # Matches
     cursor.execute('''
@@ -49,21 +66,11 @@ def _build_matrix_data():
     ''')
     assignments = cursor.fetchall()
 
-    # Availability
-    cursor.execute('''
-        SELECT 
-            pa.player_id,
-            pa.match_id,
-            pa.is_available,
-            pa.notes
-        FROM player_availability pa
-        WHERE EXISTS (
-            SELECT 1 FROM matches m WHERE m.id = pa.match_id
-        )
-    ''')
-    availability_data = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    # Availability (shared matrix; templates read it as {player_id: {match_id: entry}})
+    availability_matrix = availability.get_matrix(cursor)
+    if own:
+        cursor.close()
+        conn.close()
 
     # Build maps
     player_assignments = {}
@@ -82,29 +89,29 @@ def _build_matrix_data():
         if a['actually_played']:
             actually_played[pid].add(mid)
 
-    availability_map = {}
-    for av in availability_data:
-        pid = av['player_id']
-        mid = av['match_id']
-        availability_map.setdefault(pid, {})[mid] = {
-            'is_available': av['is_available'],
-            'notes': av['notes']
-        }
+    # Stats (players×matches matrices, see app.services.scoring)
+    player_ids = [p['id'] for p in players]
+    match_ids = [m['id'] for m in matches]
+    planned = scoring.build_matrix(player_ids, match_ids, ((a['match_id'], a['player_id']) for a in assignments))
+    pinned = scoring.build_matrix(player_ids, match_ids, ((a['match_id'], a['player_id']) for a in assignments if a['is_pinned']))
+    played = scoring.build_matrix(player_ids, match_ids, ((a['match_id'], a['player_id']) for a in assignments if a['actually_played']))
+    total_counts = scoring.match_counts(planned)
+    home_counts, away_counts = scoring.home_away_counts(planned, scoring.home_mask(matches))
+    pinned_counts = scoring.match_counts(pinned)
+    played_counts = scoring.match_counts(played)
 
-    # Stats
     player_stats = {}
     total_possible_matches = len(matches)
-    for p in players:
-        pid = p['id']
-        total_matches = len(player_assignments.get(pid, set()))
-        total_pinned = len(pinned_assignments.get(pid, set()))
-        total_played = len(actually_played.get(pid, set()))
+    for i, pid in enumerate(player_ids):
+        total_matches = int(total_counts[i])
         percentage = (total_matches / total_possible_matches * 100) if total_possible_matches else 0
         player_stats[pid] = {
             'total_matches': total_matches,
             'percentage': percentage,
-            'total_pinned': total_pinned,
-            'total_played': total_played
+            'total_pinned': int(pinned_counts[i]),
+            'total_played': int(played_counts[i]),
+            'home_matches': int(home_counts[i]),
+            'away_matches': int(away_counts[i])
         }
 
     matrix_data = {
@@ -113,7 +120,7 @@ def _build_matrix_data():
         'assignments': player_assignments,
         'pinned_assignments': pinned_assignments,
         'actually_played': actually_played,
-        'availability': availability_map,
+        'availability': availability_matrix,
         'stats': player_stats
     }
 
@@ -127,6 +134,56 @@ def _build_matrix_data():
 
     return matrix_data, version
 
+def _cached_matrix_data():
+    """(data_version, (matrix_data, version)); rebuilt only after planning data changed."""
+    return data_cache.get_versioned(MATRIX_DATA_NAMES, 'matrix_data', _build_matrix_data)
+
+def _matrix_etag(data_version, user, template):
+    """Weak ETag of a rendered matrix page: data version, viewer and template files."""
+    stamps = []
+    for name in (template, 'base.html'):
+        try:
+            stamps.append(int(os.path.getmtime(os.path.join(current_app.root_path, 'templates', name))))
+        except OSError:
+            stamps.append(0)
+    app_version = getattr(Config, 'APP_VERSION', None) or os.environ.get('APP_VERSION') or ''
+    parts = ['.'.join(map(str, data_version)), str((user or {}).get('id')), '.'.join(map(str, stamps)), app_version]
+    return 'matrix-' + '-'.join(parts)
+
+def _render_matrix_page(template):
+    """
+    Render a matrix template with ETag / If-None-Match support.
+
+    Unchanged planning data gives a 304 without building the matrix or
+    rendering; rendered pages are reused per ETag.
+    """
+    if session.get('_flashes'):
+        # Pending flash messages end up in the page: render it fresh, uncached
+        _, (matrix_data, version) = _cached_matrix_data()
+        return render_template(template, version=version, matrix_data=matrix_data)
+
+    data_version, (matrix_data, version) = _cached_matrix_data()
+    etag = _matrix_etag(data_version, get_current_user(), template)
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        with _matrix_pages_lock:
+            html = _matrix_pages.get(etag)
+            if html is not None:
+                _matrix_pages.move_to_end(etag)
+        if html is None:
+            print("✅ Rendering matrix template...")
+            html = render_template(template, version=version, matrix_data=matrix_data)
+            with _matrix_pages_lock:
+                _matrix_pages[etag] = html
+                while len(_matrix_pages) > MATRIX_PAGE_CACHE_SIZE:
+                    _matrix_pages.popitem(last=False)
+        response = make_response(html)
+    response.set_etag(etag, weak=True)
+    # Per user; the browser has to revalidate, which is cheap with the ETag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @single_planning.route('/')
 @login_required
 def dashboard():
@@ -153,10 +210,8 @@ def dashboard():
 
         # Spelers en statistieken
         all_players = Player.get_all()
-        player_stats = {}
-        for player in all_players:
-            if player.get('is_active', True):
-                player_stats[player['id']] = SinglePlanning.get_player_stats(player['id'])
+        stats = player_stats_service.get_stats(p['id'] for p in all_players if p.get('is_active', True))
+        player_stats = {pid: s['planning'] for pid, s in stats.items()}
 
         # Bepaal aantal gespeelde wedstrijden
         played_count = sum(1 for m in matches if m.get('is_played'))
@@ -199,11 +254,12 @@ def match_detail(match_id):
         unassigned_players = [p for p in active_players if p['id'] not in assigned_player_ids]
 
         # Split unassigned players by availability for this match
+        column = Player.get_availability_bulk([p['id'] for p in unassigned_players], [match_id])
         available_players = []
         unavailable_players = []
         for p in unassigned_players:
-            avail = Player.get_availability(p['id'], match_id)
-            if avail and avail.get('is_available'):
+            entry = column[p['id']].get(match_id)
+            if entry and entry['is_available']:
                 available_players.append(p)
             else:
                 unavailable_players.append(p)
@@ -362,36 +418,226 @@ def api_regenerate():
     try:
         print("🔄 Starting regeneration...")
         data = request.get_json(silent=True) or {}
-        plan_mode = data.get('plan_mode', 'all')  # 'all' | 'until_date' | 'from_date'/'rest'
+        plan_mode = data.get('plan_mode', 'all')  # 'all' | 'until_date' | 'from_date'/'rest' | 'solver'
         cutoff_date = data.get('cutoff_date')     # 'YYYY-MM-DD' or None
+        try:
+            restarts = int(data.get('restarts', 1))   # K seeded runs, best plan is kept
+            time_budget = data.get('time_budget')     # seconds (wall clock) or None
+            time_budget = float(time_budget) if time_budget not in (None, '') else None
+            seed = data.get('seed')                   # int for a reproducible run, or None
+            seed = int(seed) if seed not in (None, '') else None
+            optimize_time = data.get('optimize_time')              # seconds of local search, or None
+            optimize_time = float(optimize_time) if optimize_time not in (None, '') else None
+            optimize_iterations = data.get('optimize_iterations')  # move cap (reproducible with a seed)
+            optimize_iterations = int(optimize_iterations) if optimize_iterations not in (None, '') else None
+            solver_time_limit = data.get('time_limit')              # seconds for plan_mode 'solver'
+            solver_time_limit = float(solver_time_limit) if solver_time_limit not in (None, '') else None
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Ongeldige restarts, time_budget, seed, time_limit of optimize-parameters'}), 400
+        if seed is not None and not (0 <= seed < 2 ** 63):
+            return jsonify({'success': False, 'error': 'Seed moet tussen 0 en 2^63 liggen'}), 400
+        dry_run = bool(data.get('dry_run', False))  # preview: diff + token, match_planning untouched
+        allocation = data.get('allocation') or None  # 'flow' | 'greedy' (default: Config.PLANNER_ALLOCATION)
+        if allocation not in (None, 'flow', 'greedy'):
+            return jsonify({'success': False, 'error': "allocation moet 'flow' of 'greedy' zijn"}), 400
+
+        # Previews run inline unless a background job is asked for explicitly
+        if data.get('background', Config.PLANNING_BACKGROUND_JOBS and not dry_run):
+            # Queue the regeneration and answer right away; poll the job for progress
+            job, created = JobQueue.enqueue('regenerate', {
+                'plan_mode': plan_mode,
+                'cutoff_date': cutoff_date,
+                'restarts': restarts,
+                'time_budget': time_budget,
+                'seed': seed,
+                'optimize_time': optimize_time,
+                'optimize_iterations': optimize_iterations,
+                'solver_time_limit': solver_time_limit,
+                'dry_run': dry_run,
+                'allocation': allocation,
+            }, created_by=session.get('player_id'))
+            return jsonify(_job_payload(job, created=created)), (202 if created else 409)
 
         # Call the static method correctly
         result = SinglePlanning.regenerate_planning(
             exclude_pinned=True,
             plan_mode=plan_mode,
-            cutoff_date=cutoff_date
+            cutoff_date=cutoff_date,
+            restarts=restarts,
+            time_budget=time_budget,
+            seed=seed,
+            optimize_time=optimize_time,
+            optimize_iterations=optimize_iterations,
+            solver_time_limit=solver_time_limit,
+            dry_run=dry_run,
+            allocation=allocation
         )
         
         print(f"🎯 Regeneration result: {result}")
         
+        if dry_run and result.get('success'):
+            return jsonify(result)
         if result.get('success', True):  # Assume success if no explicit result
             message = f"Planning geregenereerd! {result.get('regenerated_matches', 0)} wedstrijden bijgewerkt."
             return jsonify({
                 'success': True, 
                 'message': message,
-                'regenerated_matches': result.get('regenerated_matches', 0)
+                'regenerated_matches': result.get('regenerated_matches', 0),
+                'objective': result.get('objective'),
+                'restarts_completed': result.get('restarts_completed', 1),
+                'seed': result.get('seed'),
+                'optimizer': result.get('optimizer'),
+                'solver': result.get('solver'),
+                'cached': result.get('cached', False),
+                'feasibility': result.get('feasibility'),
+                'allocation': result.get('allocation')
             })
         else:
             return jsonify({
                 'success': False, 
                 'error': result.get('message', 'Onbekende fout bij regenereren')
-            }), 500
+            }), 409 if result.get('busy') else 500
     except Exception as e:
         print(f"❌ Error in regeneration: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@single_planning.route('/api/feasibility')
+@roles_required('captain', 'reserve captain')
+def api_feasibility():
+    """API: Instant feasibility/bottleneck report for a regeneration (no planning is run)."""
+    result = SinglePlanning.check_feasibility(
+        plan_mode=request.args.get('plan_mode', 'all'),
+        cutoff_date=request.args.get('cutoff_date') or None,
+    )
+    if not result.get('success'):
+        return jsonify({'success': False, 'error': result.get('message')}), 500
+    return jsonify(result)
+
+@single_planning.route('/api/regenerate/apply', methods=['POST'])
+@roles_required('captain', 'reserve captain')
+def api_apply_preview():
+    """API: Apply the diff of a regeneration preview (dry run) by its token."""
+    data = request.get_json(silent=True) or {}
+    token = data.get('preview_token') or data.get('token')
+    if not token:
+        return jsonify({'success': False, 'error': 'Geen preview_token opgegeven'}), 400
+    result = SinglePlanning.apply_preview(str(token))
+    if result.get('success'):
+        return jsonify({
+            'success': True,
+            'message': f"Preview toegepast: {result['changes']} wijzigingen.",
+            'changes': result['changes'],
+            'seed': result['seed'],
+        })
+    status = 404 if result.get('not_found') else 409 if (result.get('stale') or result.get('busy')) else 500
+    return jsonify({'success': False, 'error': result.get('message'), 'stale': bool(result.get('stale'))}), status
+
+def _job_payload(job, created=None):
+    """JSON view of a planning_jobs row (without the result)."""
+    payload = {
+        'success': True,
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'message': job['message'],
+        'error': job['error'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'started_at': job['started_at'].isoformat() if job['started_at'] else None,
+        'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None,
+        'status_url': url_for('single_planning.api_job_status', job_id=job['id']),
+        'result_url': url_for('single_planning.api_job_result', job_id=job['id']),
+    }
+    if created is not None:
+        payload['created'] = created
+        if not created:
+            payload['success'] = False
+            payload['error'] = 'Er staat al een taak van dit type in de wachtrij of loopt nog'
+    return payload
+
+@single_planning.route('/api/jobs', methods=['POST'])
+@roles_required('captain', 'reserve captain')
+def api_submit_job():
+    """API: Queue a background job (regenerate | import_matches | import_players)."""
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    if kind not in JOB_KINDS:
+        return jsonify({'success': False, 'error': f"Onbekend taaktype, kies uit: {', '.join(JOB_KINDS)}"}), 400
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return jsonify({'success': False, 'error': 'params moet een object zijn'}), 400
+    job, created = JobQueue.enqueue(kind, params, created_by=session.get('player_id'))
+    return jsonify(_job_payload(job, created=created)), (202 if created else 409)
+
+@single_planning.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job_status(job_id):
+    """API: Status and progress of a background job."""
+    job = JobQueue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Taak niet gevonden'}), 404
+    return jsonify(_job_payload(job))
+
+@single_planning.route('/api/jobs/<int:job_id>/result')
+@login_required
+def api_job_result(job_id):
+    """API: Result of a finished job (202 while it is still queued or running)."""
+    job = JobQueue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Taak niet gevonden'}), 404
+    payload = _job_payload(job)
+    if job['status'] in ('queued', 'running'):
+        return jsonify(payload), 202
+    payload['success'] = job['status'] == 'done'
+    payload['result'] = job['result']
+    return jsonify(payload)
+
+@single_planning.route('/api/repair', methods=['POST'])
+@roles_required('captain', 'reserve captain')
+def api_repair():
+    """API: Incrementally repair the planning after changed (player, match) cells."""
+    data = request.get_json(silent=True) or {}
+    try:
+        cells = [(int(c['player_id']), int(c['match_id'])) for c in data.get('cells', [])]
+        neighbourhood = data.get('neighbourhood')
+        neighbourhood = int(neighbourhood) if neighbourhood not in (None, '') else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Ongeldige cellen: verwacht [{player_id, match_id}, ...]'}), 400
+    if not cells:
+        return jsonify({'success': False, 'error': 'Geen cellen opgegeven'}), 400
+
+    result = SinglePlanning.repair_planning(cells, neighbourhood=neighbourhood)
+    if result.get('success'):
+        return jsonify(result)
+    return jsonify({'success': False, 'error': result.get('message', 'Herstel mislukt')}), 500
+
+@single_planning.route('/api/match/<int:match_id>/substitutes/<int:player_id>', methods=['GET'])
+@login_required
+def api_substitutes(match_id, player_id):
+    """API: Ranked substitutes for a planned player in a match."""
+    limit = request.args.get('limit', 5, type=int)
+    result = SinglePlanning.suggest_substitutes(match_id, player_id, limit=limit)
+    if result.get('success'):
+        return jsonify(result)
+    return jsonify({'success': False, 'error': result.get('message')}), 400
+
+@single_planning.route('/api/match/<int:match_id>/substitutes/<int:player_id>', methods=['POST'])
+@roles_required('captain', 'reserve captain')
+def api_apply_substitute(match_id, player_id):
+    """API: Replace a planned player by the best (or a chosen) substitute."""
+    data = request.get_json(silent=True) or {}
+    substitute_id = data.get('substitute_id')
+    try:
+        substitute_id = int(substitute_id) if substitute_id not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Ongeldige substitute_id'}), 400
+    result = SinglePlanning.suggest_substitutes(match_id, player_id, apply=True, substitute_id=substitute_id)
+    if result.get('success'):
+        return jsonify(result)
+    return jsonify({'success': False, 'error': result.get('message')}), 400
+
 @single_planning.route('/api/undo', methods=['POST'])
 @roles_required('captain', 'reserve captain')
 def api_undo():
@@ -405,6 +651,19 @@ def api_undo():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Undo fout: {e}'}), 500
 
+@single_planning.route('/api/redo', methods=['POST'])
+@roles_required('captain', 'reserve captain')
+def api_redo():
+    """API: Redo the last undone regeneration."""
+    try:
+        result = SinglePlanning.redo_last_undo()
+        if result.get('success'):
+            return jsonify({'success': True, 'message': f"Redo uitgevoerd. Opnieuw toegepast: {result.get('reapplied', 0)} items."})
+        else:
+            return jsonify({'success': False, 'message': result.get('message', 'Redo mislukt')}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Redo fout: {e}'}), 500
+
 @single_planning.route('/matrix')
 @login_required
 def matrix():
@@ -416,12 +675,7 @@ def matrix():
 def matrix_view():
     """Show matrix view of single planning."""
     try:
-        print("🔍 Starting matrix view...")
-        matrix_data, version = _build_matrix_data()
-        print("✅ Rendering matrix template...")
-        return render_template('single_planning/matrix.html', 
-                               version=version, 
-                               matrix_data=matrix_data)
+        return _render_matrix_page('single_planning/matrix.html')
     except Exception as e:
         print(f"❌ Error in matrix_view: {e}")
         import traceback
@@ -443,106 +697,38 @@ def edit_matrix_cell():
         if not player_id or not match_id:
             return jsonify({'error': 'Player ID and Match ID required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check current assignment state (version_id = 1 for single planning)
-        cursor.execute('''
-            SELECT id, is_pinned, actually_played FROM match_planning 
-            WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
-        ''', (match_id, player_id))
-        
-        existing = cursor.fetchone()
-        
-        # Cycle through states: niet -> wel -> pinned -> niet
-        if not existing:
-            # State 1: niet -> wel (assigned, not pinned)
-            cursor.execute('''
-                INSERT INTO match_planning (planning_version_id, match_id, player_id, is_pinned, actually_played)
-                VALUES (1, %s, %s, FALSE, FALSE)
-            ''', (match_id, player_id))
-            assigned = True
-            is_pinned = False
-            actually_played = False
-            state = 'assigned'
-            
-        elif existing and not existing['is_pinned']:
-            # State 2: wel -> pinned (assigned and pinned)
-            cursor.execute('''
-                UPDATE match_planning 
-                SET is_pinned = TRUE, actually_played = FALSE
-                WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
-            ''', (match_id, player_id))
-            assigned = True
-            is_pinned = True
-            actually_played = False
-            state = 'pinned'
-            
-        else:
-            # State 3: pinned -> niet (remove assignment)
-            cursor.execute('''
-                DELETE FROM match_planning 
-                WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
-            ''', (match_id, player_id))
-            assigned = False
-            is_pinned = False
-            actually_played = False
-            state = 'not_assigned'
-        
-        conn.commit()
-        
-        # Check if this match now has more than 4 players (rule violation)
-        cursor.execute('''
-            SELECT COUNT(*) as player_count FROM match_planning 
-            WHERE planning_version_id = 1 AND match_id = %s
-        ''', (match_id,))
-        match_player_count = cursor.fetchone()['player_count']
-        
-        # Get updated statistics for this player
-        cursor.execute('''
-            SELECT COUNT(*) as total FROM match_planning mp
-            WHERE mp.planning_version_id = 1 AND mp.player_id = %s
-        ''', (player_id,))
-        total_matches = cursor.fetchone()['total']
-        
-        cursor.execute('''
-            SELECT COUNT(*) as total_pinned FROM match_planning mp
-            WHERE mp.planning_version_id = 1 AND mp.player_id = %s AND mp.is_pinned = TRUE
-        ''', (player_id,))
-        total_pinned = cursor.fetchone()['total_pinned']
-        
-        cursor.execute('''
-            SELECT COUNT(*) as total_played FROM match_planning mp
-            WHERE mp.planning_version_id = 1 AND mp.player_id = %s AND mp.actually_played = TRUE
-        ''', (player_id,))
-        total_played = cursor.fetchone()['total_played']
-        
-        cursor.execute('SELECT COUNT(*) as total FROM matches')
-        total_possible = cursor.fetchone()['total']
-        percentage = (total_matches / total_possible * 100) if total_possible > 0 else 0
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'assigned': assigned,
-            'is_pinned': is_pinned,
-            'actually_played': actually_played,
-            'state': state,
-            'match_player_count': match_player_count,
-            'rule_violation': match_player_count > 4,
-            'stats': {
-                'total_matches': total_matches,
-                'total_pinned': total_pinned,
-                'total_played': total_played,
-                'percentage': percentage
-            }
-        })
+        result = SinglePlanning.cycle_matrix_cell(match_id, player_id)
+        return jsonify(dict(result, success=True))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Upper bound of edits in one batch request
+MATRIX_BATCH_LIMIT = 500
+
+@single_planning.route('/matrix/edit_batch', methods=['POST'])
+@roles_required('captain', 'reserve captain')
+def edit_matrix_batch():
+    """Apply a batch of matrix edits in one transaction (coalesced clicks from the matrix page)."""
+    data = request.get_json(silent=True) or {}
+    edits = data.get('edits')
+    if not isinstance(edits, list) or not edits:
+        return jsonify({'success': False, 'error': 'Lijst met wijzigingen (edits) vereist'}), 400
+    if len(edits) > MATRIX_BATCH_LIMIT:
+        return jsonify({'success': False, 'error': f'Maximaal {MATRIX_BATCH_LIMIT} wijzigingen per keer'}), 400
+    try:
+        parsed = []
+        for edit in edits:
+            if not isinstance(edit, dict) or not edit.get('player_id') or not edit.get('match_id'):
+                raise ValueError('Player ID and Match ID required')
+            parsed.append((edit['player_id'], edit['match_id'], edit.get('action', 'cycle')))
+        result = SinglePlanning.apply_matrix_edits(parsed)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify(dict(result, success=True))
+
 @single_planning.route('/api/generate_initial', methods=['POST'])
 def generate_initial_planning():
     """API endpoint to generate initial planning."""
@@ -609,10 +795,7 @@ def single_matrix():
 def matrix_handdrawn():
     """Hand-drawn style printable matrix (catchy, like handwritten)."""
     try:
-        matrix_data, version = _build_matrix_data()
-        return render_template('single_planning/handdrawn_matrix.html',
-                               version=version,
-                               matrix_data=matrix_data)
+        return _render_matrix_page('single_planning/handdrawn_matrix.html')
     except Exception as e:
         flash(f'Fout bij laden handgetekende matrix: {e}', 'error')
         return redirect(url_for('single_planning.matrix_view'))
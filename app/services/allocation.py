@@ -0,0 +1,303 @@
+"""
+Min-cost-flow allocation stage for the season planner.
+
+Instead of filling matches one by one with progressive caps and fallbacks,
+"how many matches each player gets, and in which matches" is solved globally
+as a min-cost max-flow:
+
+    source ──(k-th unit: fairness cost)──► player
+    player ──(cap 1)──► (player, date)               one match per date
+    (player, date) ──(cap 1, edge cost)──► match     only available players
+    match ──(cap 4 - pinned)──► sink
+
+The k-th match of a player costs FAIRNESS_WEIGHT * (2c - 1), with c the
+player's count over the season including pins and kept lineups. That is the
+marginal cost of the sum of squared counts, so the cheapest maximum flow gives
+the most even spread the availability allows. The flow is maximum first, so
+every slot that can be filled is filled.
+
+Partner, spacing and home/away preferences are pairwise and cannot be flow
+costs exactly; they become linear edge costs against the fixed context
+(pins, kept lineups) and, in later rounds, against the previous round's
+allocation. The best round under planner.evaluate_plan is refined per match
+with a short seeded local search (app.services.local_search).
+
+The solver is successive shortest paths with Dijkstra on reduced costs
+(potentials from Bellman-Ford, as edge costs may be negative): polynomial in
+the number of slots and edges.
+"""
+import heapq
+import random
+
+from app.services import planner, local_search
+
+# Integer costs (scaled) keep the reduced costs exact
+SCALE = 1000
+FAIRNESS_WEIGHT = 5 * SCALE
+SPACING_WEIGHT = 1 * SCALE
+PARTNER_WEIGHT = 1 * SCALE
+HOME_AWAY_WEIGHT = SCALE // 2
+JITTER = SCALE // 100
+
+
+class MinCostFlow:
+    """Min-cost max-flow by successive shortest paths (Dijkstra with potentials)."""
+
+    def __init__(self, num_nodes):
+        self.num_nodes = num_nodes
+        # Edge: [to, capacity, cost, index of the reverse edge]
+        self.graph = [[] for _ in range(num_nodes)]
+
+    def add_edge(self, u, v, capacity, cost):
+        """Add an edge; returns a handle for flow_on."""
+        self.graph[u].append([v, capacity, cost, len(self.graph[v])])
+        self.graph[v].append([u, 0, -cost, len(self.graph[u]) - 1])
+        return u, len(self.graph[u]) - 1
+
+    def flow_on(self, handle):
+        u, i = handle
+        to, _, _, rev = self.graph[u][i]
+        return self.graph[to][rev][1]
+
+    def _initial_potentials(self, source):
+        inf = float('inf')
+        potential = [inf] * self.num_nodes
+        potential[source] = 0
+        for _ in range(self.num_nodes):
+            updated = False
+            for u in range(self.num_nodes):
+                if potential[u] == inf:
+                    continue
+                for v, capacity, cost, _ in self.graph[u]:
+                    if capacity > 0 and potential[u] + cost < potential[v]:
+                        potential[v] = potential[u] + cost
+                        updated = True
+            if not updated:
+                break
+        # Nodes unreachable from the source stay unreachable in the residual graph
+        return [0 if p == inf else p for p in potential]
+
+    def solve(self, source, sink):
+        """Send the maximum flow at minimum cost; returns (flow, cost)."""
+        inf = float('inf')
+        potential = self._initial_potentials(source)
+        total_flow = total_cost = 0
+        while True:
+            dist = [inf] * self.num_nodes
+            prev = [None] * self.num_nodes
+            dist[source] = 0
+            heap = [(0, source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                for i, (v, capacity, cost, _) in enumerate(self.graph[u]):
+                    if capacity <= 0:
+                        continue
+                    nd = d + cost + potential[u] - potential[v]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        prev[v] = (u, i)
+                        heapq.heappush(heap, (nd, v))
+            if dist[sink] == inf:
+                break
+            for v in range(self.num_nodes):
+                if dist[v] < inf:
+                    potential[v] += dist[v]
+            pushed = inf
+            v = sink
+            while v != source:
+                u, i = prev[v]
+                pushed = min(pushed, self.graph[u][i][1])
+                v = u
+            v = sink
+            while v != source:
+                u, i = prev[v]
+                edge = self.graph[u][i]
+                edge[1] -= pushed
+                self.graph[v][edge[3]][1] += pushed
+                total_cost += pushed * edge[2]
+                v = u
+            total_flow += pushed
+        return total_flow, total_cost
+
+
+def _allocate(plan_kwargs, season_matches, fixed_lineups, context, rng):
+    """
+    One min-cost-flow allocation.
+
+    Args:
+        context: {match_id: set(player_ids)} assumed for the pairwise costs
+            (pins and kept lineups, plus the previous round's allocation)
+
+    Returns:
+        {match_id: [player_ids]} new selections per target match
+    """
+    targets = plan_kwargs['target_matches']
+    players = plan_kwargs['active_players']
+    availability = plan_kwargs['availability']
+    pinned = plan_kwargs['pinned_assignments']
+    bookings = plan_kwargs.get('date_bookings') or {}
+    players_by_id = {p['id']: p for p in players}
+    player_ids = [p['id'] for p in players]
+
+    season_ids = [m['id'] for m in season_matches]
+    season_pos = {mid: i for i, mid in enumerate(season_ids)}
+    is_home = {m['id']: bool(m.get('is_home', False)) for m in season_matches}
+    is_home.update({m['id']: bool(m.get('is_home', False)) for m in targets})
+    target_ids = {m['id'] for m in targets}
+
+    # Season counts that are already fixed: pins in scope and kept lineups outside it
+    base = {pid: 0 for pid in player_ids}
+    fixed = dict(fixed_lineups or {})
+    for mid in target_ids:
+        fixed[mid] = pinned.get(mid, [])
+    for mid, pids in fixed.items():
+        if mid not in season_pos and mid not in target_ids:
+            continue
+        for pid in pids:
+            if pid in base:
+                base[pid] += 1
+
+    # Home/away lean of each player in the context (previous round or fixed only)
+    lean = {}
+    for pid in player_ids:
+        total = sum(1 for mid, pids in context.items() if pid in pids)
+        home = sum(1 for mid, pids in context.items() if pid in pids and is_home.get(mid, False))
+        lean[pid] = (home > total - home) - (home < total - home)
+
+    def partner_of(pid):
+        q = players_by_id[pid].get('partner_id')
+        if q in players_by_id and players_by_id[pid].get('prefer_partner_together', True) \
+                and players_by_id[q].get('prefer_partner_together', True):
+            return q
+        return None
+
+    def edge_cost(pid, mid):
+        cost = rng.randrange(JITTER) if JITTER else 0
+        pos = season_pos.get(mid)
+        if pos is not None:
+            for other in (pos - 1, pos + 1):
+                if 0 <= other < len(season_ids) and pid in context.get(season_ids[other], ()):
+                    cost += SPACING_WEIGHT
+        partner = partner_of(pid)
+        if partner is not None and partner in context.get(mid, ()):
+            cost -= PARTNER_WEIGHT
+        if is_home.get(mid, False):
+            cost += HOME_AWAY_WEIGHT * lean[pid]
+        else:
+            cost -= HOME_AWAY_WEIGHT * lean[pid]
+        return cost
+
+    # Candidate (player, match) edges grouped per (player, date)
+    date_of = {m['id']: planner._date_key(m.get('match_date')) for m in targets}
+    groups = {}
+    for m in targets:
+        mid = m['id']
+        pins = set(pinned.get(mid, []))
+        needed = planner.PLAYERS_PER_MATCH - len(pins)
+        if needed <= 0:
+            continue
+        date = date_of[mid]
+        for pid in player_ids:
+            if pid in pins or not availability.get(pid, {}).get(mid, True):
+                continue
+            if date is not None and any(other != mid for other in bookings.get((pid, date), ())):
+                continue
+            key = (pid, date if date is not None else ('match', mid))
+            groups.setdefault(key, []).append(mid)
+
+    # Nodes in topological order: source, players, (player, date) groups, matches, sink
+    source = 0
+    player_node = {pid: 1 + i for i, pid in enumerate(player_ids)}
+    group_node = {key: 1 + len(player_ids) + i for i, key in enumerate(sorted(groups, key=repr))}
+    match_node = {m['id']: 1 + len(player_ids) + len(groups) + i for i, m in enumerate(targets)}
+    sink = 1 + len(player_ids) + len(groups) + len(targets)
+    graph = MinCostFlow(sink + 1)
+
+    groups_per_player = {}
+    for (pid, _) in groups:
+        groups_per_player[pid] = groups_per_player.get(pid, 0) + 1
+    for pid in player_ids:
+        for k in range(1, groups_per_player.get(pid, 0) + 1):
+            count = base[pid] + k
+            graph.add_edge(source, player_node[pid], 1, FAIRNESS_WEIGHT * (2 * count - 1))
+
+    handles = []
+    for key in sorted(groups, key=repr):
+        pid = key[0]
+        graph.add_edge(player_node[pid], group_node[key], 1, 0)
+        for mid in groups[key]:
+            handles.append((pid, mid, graph.add_edge(group_node[key], match_node[mid], 1, edge_cost(pid, mid))))
+    for m in targets:
+        needed = planner.PLAYERS_PER_MATCH - len(set(pinned.get(m['id'], [])))
+        if needed > 0:
+            graph.add_edge(match_node[m['id']], sink, needed, 0)
+
+    graph.solve(source, sink)
+
+    order = {pid: i for i, pid in enumerate(player_ids)}
+    assignments = {m['id']: [] for m in targets}
+    for pid, mid, handle in handles:
+        if graph.flow_on(handle) > 0:
+            assignments[mid].append(pid)
+    for mid in assignments:
+        assignments[mid].sort(key=order.get)
+    return assignments
+
+
+def plan_season_flow(plan_kwargs, season_matches, fixed_lineups=None, rng=None,
+                     rounds=2, refine_iterations=2000):
+    """
+    Plan the target matches with the min-cost-flow allocation stage.
+
+    Args:
+        plan_kwargs: the plan_season keyword arguments
+        season_matches: match dicts in season order used for scoring
+        fixed_lineups: {match_id: [player_ids]} of matches outside the scope
+        rng: random.Random-like source (tie-breaking and refinement)
+        rounds: allocation rounds; each later round prices partner, spacing
+            and home/away against the previous round's allocation
+        refine_iterations: local-search moves for the per-match lineup
+            refinement afterwards (0 to skip)
+
+    Returns:
+        A plan_season-style result (assignments and statistics) with
+        'objective' and an 'allocation' report.
+    """
+    rng = rng or random.Random()
+    targets = plan_kwargs['target_matches']
+    pinned = plan_kwargs['pinned_assignments']
+    players = plan_kwargs['active_players']
+
+    context = {mid: set(pids) for mid, pids in (fixed_lineups or {}).items()}
+    for m in targets:
+        context[m['id']] = set(pinned.get(m['id'], []))
+
+    best = None
+    best_round = 0
+    objectives = []
+    for round_no in range(1, max(1, rounds) + 1):
+        assignments = _allocate(plan_kwargs, season_matches, fixed_lineups, context, rng)
+        lineups = planner.build_lineups(targets, pinned, assignments, fixed_lineups)
+        objective = planner.evaluate_plan(season_matches, lineups, players)
+        objectives.append(objective['total'])
+        if best is None or objective['total'] < best[1]['total']:
+            best = (assignments, objective)
+            best_round = round_no
+        context = {mid: set(pids) for mid, pids in lineups.items()}
+
+    assignments, objective = best
+    result = {'assignments': assignments}
+    result.update(planner.summarize_assignments(assignments, plan_kwargs))
+    result['objective'] = objective
+    report = {'rounds': objectives, 'best_round': best_round, 'flow_objective': objective['total'],
+              'refined': None}
+    if refine_iterations:
+        result = local_search.optimize_plan(
+            result, plan_kwargs, season_matches, fixed_lineups,
+            time_budget=60.0, rng=rng, max_iterations=refine_iterations, initial_temperature=0.5,
+        )
+        report['refined'] = result.pop('optimizer')
+    result['allocation'] = report
+    return result
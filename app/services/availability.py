@@ -0,0 +1,239 @@
+"""
+Compact, shared view of player_availability.
+
+All availability of the season is loaded with a single query into one
+AvailabilityMatrix: per player two bitsets over the season's match index (bit
+j set = an explicit available / unavailable answer for match j) plus a
+side-table with the (few) notes. No answer means "unknown"; the planner treats
+that as available, the views decide for themselves.
+
+The matrix is immutable and kept in an in-process cache keyed by the
+'availability' counter in data_versions, which a trigger on player_availability
+bumps on every write (see app.models.database.create_data_versions). A lookup
+costs one primary-key query for the version; the matrix itself is only
+reloaded after availability changed, in any process.
+"""
+import hashlib
+import threading
+
+from app.models.database import get_db_connection, get_data_version
+
+VERSION_NAME = 'availability'
+
+_cached = None
+_lock = threading.Lock()
+
+
+class AvailabilityMatrix:
+    """Availability of all players for all matches with an answer (read-only)."""
+
+    def __init__(self, version, rows):
+        """
+        Args:
+            version: data version the rows belong to
+            rows: (player_id, match_id, is_available, notes) in season order
+        """
+        self.version = version
+        self.match_ids = []
+        self.index = {}
+        self.available = {}
+        self.unavailable = {}
+        self.notes = {}
+        for player_id, match_id, is_available, notes in rows:
+            j = self.index.get(match_id)
+            if j is None:
+                j = self.index[match_id] = len(self.match_ids)
+                self.match_ids.append(match_id)
+            bits = self.available if is_available else self.unavailable
+            bits[player_id] = bits.get(player_id, 0) | (1 << j)
+            if notes:
+                self.notes[(player_id, match_id)] = notes
+        self._planner_view = None
+        self._fingerprint = None
+
+    def __len__(self):
+        """Number of explicit answers."""
+        return sum(bits.bit_count() for bits in self.available.values()) + \
+            sum(bits.bit_count() for bits in self.unavailable.values())
+
+    @property
+    def player_ids(self):
+        return sorted(set(self.available) | set(self.unavailable))
+
+    def status(self, player_id, match_id):
+        """True (available), False (unavailable) or None (no answer)."""
+        j = self.index.get(match_id)
+        if j is None:
+            return None
+        if (self.available.get(player_id, 0) >> j) & 1:
+            return True
+        if (self.unavailable.get(player_id, 0) >> j) & 1:
+            return False
+        return None
+
+    def is_available(self, player_id, match_id, default=True):
+        """Availability with a default for players without an answer."""
+        status = self.status(player_id, match_id)
+        return default if status is None else status
+
+    def note(self, player_id, match_id):
+        return self.notes.get((player_id, match_id))
+
+    def entry(self, player_id, match_id):
+        """{'is_available', 'notes'} like a player_availability row, or None without an answer."""
+        status = self.status(player_id, match_id)
+        if status is None:
+            return None
+        return {'is_available': status, 'notes': self.notes.get((player_id, match_id))}
+
+    def get(self, player_id, default=None):
+        """Mapping view {match_id: entry} of one player (for templates)."""
+        if player_id not in self.available and player_id not in self.unavailable:
+            return default
+        return _PlayerRow(self, player_id)
+
+    def for_player(self, player_id):
+        """{match_id: is_available} of one player, answered matches only."""
+        result = {}
+        available = self.available.get(player_id, 0)
+        unavailable = self.unavailable.get(player_id, 0)
+        for j, match_id in enumerate(self.match_ids):
+            if (available >> j) & 1:
+                result[match_id] = True
+            elif (unavailable >> j) & 1:
+                result[match_id] = False
+        return result
+
+    def for_match(self, match_id):
+        """{player_id: is_available} of one match, players with an answer only."""
+        j = self.index.get(match_id)
+        if j is None:
+            return {}
+        result = {}
+        for player_id in self.player_ids:
+            status = self.status(player_id, match_id)
+            if status is not None:
+                result[player_id] = status
+        return result
+
+    def counts(self, player_id):
+        """(available, unavailable) answers of a player."""
+        return (self.available.get(player_id, 0).bit_count(),
+                self.unavailable.get(player_id, 0).bit_count())
+
+    def planner_view(self):
+        """
+        {player_id: {match_id: False}} for the planner, which treats a missing
+        answer as available: only the unavailable cells need to be spelled out.
+        Built once per matrix; callers must not modify it.
+        """
+        if self._planner_view is None:
+            view = {}
+            for player_id, bits in self.unavailable.items():
+                view[player_id] = {self.match_ids[j]: False for j in _bit_indices(bits)}
+            self._planner_view = view
+        return self._planner_view
+
+    @property
+    def fingerprint(self):
+        """Content hash of the matrix (the version also changes on no-op writes)."""
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            digest.update(repr(self.match_ids).encode())
+            for player_id in self.player_ids:
+                digest.update(repr((player_id, self.available.get(player_id, 0),
+                                    self.unavailable.get(player_id, 0))).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+
+class _PlayerRow:
+    """Read-only {match_id: entry} view of one player in an AvailabilityMatrix."""
+
+    __slots__ = ('matrix', 'player_id')
+
+    def __init__(self, matrix, player_id):
+        self.matrix = matrix
+        self.player_id = player_id
+
+    def get(self, match_id, default=None):
+        entry = self.matrix.entry(self.player_id, match_id)
+        return default if entry is None else entry
+
+    def __getitem__(self, match_id):
+        entry = self.matrix.entry(self.player_id, match_id)
+        if entry is None:
+            raise KeyError(match_id)
+        return entry
+
+    def __contains__(self, match_id):
+        return self.matrix.status(self.player_id, match_id) is not None
+
+
+def _bit_indices(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def load(cursor):
+    """Build the matrix with a single query (rows and version from one snapshot)."""
+    cursor.execute('''
+        SELECT pa.player_id, pa.match_id, pa.is_available, pa.notes,
+               (SELECT version FROM data_versions WHERE name = %s) AS version
+        FROM player_availability pa
+        JOIN matches m ON m.id = pa.match_id
+        ORDER BY m.match_date, m.id, pa.player_id
+    ''', (VERSION_NAME,))
+    rows = cursor.fetchall()
+    version = (rows[0]['version'] or 0) if rows else get_data_version(cursor, VERSION_NAME)
+    return AvailabilityMatrix(version, (
+        (r['player_id'], r['match_id'], r['is_available'], r['notes']) for r in rows
+    ))
+
+
+def _wrote_in_transaction(cursor):
+    """True when the cursor's transaction has written anything (it has a transaction id)."""
+    cursor.execute('SELECT txid_current_if_assigned() IS NOT NULL AS wrote')
+    return cursor.fetchone()['wrote']
+
+
+def get_matrix(cursor=None):
+    """
+    The availability matrix, from the cache when availability did not change.
+
+    Args:
+        cursor: optional cursor of the caller's transaction (sees its own writes)
+    """
+    global _cached
+    own = cursor is None
+    if own:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+    try:
+        version = get_data_version(cursor, VERSION_NAME)
+        matrix = _cached
+        if matrix is not None and matrix.version == version:
+            return matrix
+        matrix = load(cursor)
+        print(f"🧮 Availability matrix loaded (version {matrix.version}, {len(matrix)} answers)")
+        if _wrote_in_transaction(cursor):
+            # May hold this transaction's uncommitted rows and version, which can
+            # still roll back: not shared with other requests
+            return matrix
+        with _lock:
+            if _cached is None or _cached.version <= matrix.version:
+                _cached = matrix
+        return matrix
+    finally:
+        if own:
+            cursor.close()
+            conn.close()
+
+
+def clear():
+    """Drop the cached matrix."""
+    global _cached
+    with _lock:
+        _cached = None
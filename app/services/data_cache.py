@@ -0,0 +1,263 @@
+"""
+Read-through cache of the season's matches and players (and values built from them).
+
+Match.get_all(), Player.get_all() and the planner's active-player list run on
+almost every page, while the data changes a few times per season. Their rows
+are cached per process under (name, variant), e.g. ('matches', 'all').
+
+Invalidation:
+- Triggers on matches and players bump a data_versions counter and NOTIFY
+  '<name>:<version>' on commit (app.models.database.create_data_versions).
+  A listener thread per process (LISTEN data_versions) drops the entries of
+  that name, so other gunicorn workers never keep serving an old roster.
+- The model methods that write (Match.create/update/delete, Player.create/
+  update/activate/deactivate, ...) call invalidate() right away, so their own
+  process does not wait for the notification. Inside a request the name stays
+  uncached until the request ends: the request may read its own uncommitted
+  writes, which must not end up in the cache.
+- While the listener is not connected, entries are checked against the
+  data_versions counter instead (one primary-key query per read).
+
+Besides rows, get_versioned() caches values derived from several names (the
+planning matrix data depends on availability, matches, players and planning)
+together with the data version they were built at, e.g. for ETags.
+
+A load that raced with an invalidation is returned but not stored.
+"""
+import os
+import threading
+
+import psycopg
+from flask import g, has_request_context
+
+from app.models.database import (
+    get_db_connection, get_data_version, get_data_versions, _conninfo, DATA_VERSION_CHANNEL,
+)
+from config import Config
+
+_entries = {}
+_values = {}
+_generation = {}
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'notifications': 0}
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _with_cursor(cursor, fn):
+    """Run fn(cursor) on the given cursor, or on a connection opened only now."""
+    if cursor is not None:
+        return fn(cursor)
+    conn = get_db_connection()
+    own = conn.cursor()
+    try:
+        return fn(own)
+    finally:
+        own.close()
+        conn.close()
+
+
+def get(name, variant, loader, cursor=None):
+    """
+    Cached rows of a collection (shallow copies, callers may modify them).
+
+    A hit while the listener is connected does not touch the database.
+
+    Args:
+        name: data_versions name the rows depend on ('matches', 'players')
+        variant: which query of that name (e.g. 'all', 'active')
+        loader: loader(cursor) -> list of rows
+        cursor: optional cursor of the caller's transaction
+    """
+    if not Config.DATA_CACHE_ENABLED or _written_in_request(name):
+        return _with_cursor(cursor, loader)
+    _ensure_listener()
+    generation = _generation.get(name, 0)
+    listening = _listening()
+    entry = _entries.get((name, variant))
+    if listening and entry is not None and entry[0] == ('notify', generation):
+        with _lock:
+            _stats['hits'] += 1
+        return [dict(row) for row in entry[1]]
+
+    def load(cur):
+        token = ('notify', generation) if listening else ('version', get_data_version(cur, name))
+        if entry is not None and entry[0] == token:
+            return token, entry[1], True
+        return token, loader(cur), False
+
+    token, rows, hit = _with_cursor(cursor, load)
+    with _lock:
+        if hit:
+            _stats['hits'] += 1
+        else:
+            _stats['misses'] += 1
+            if _generation.get(name, 0) == generation:
+                _entries[(name, variant)] = (token, rows)
+    return [dict(row) for row in rows]
+
+
+def get_versioned(names, key, loader, cursor=None):
+    """
+    A value built from the data of several names, cached until any of them changes.
+
+    The value is shared, not copied: callers must treat it as read-only. A hit
+    while the listener is connected does not touch the database.
+
+    Args:
+        names: data_versions names the value depends on
+        key: cache key of the value
+        loader: loader(cursor) -> value
+        cursor: optional cursor of the caller's transaction
+
+    Returns:
+        (version, value): version is the tuple of the counters of names; the
+        value is at least as new as that version
+    """
+    names = tuple(names)
+    if not Config.DATA_CACHE_ENABLED or any(_written_in_request(n) for n in names):
+        return _with_cursor(cursor, lambda cur: (get_data_versions(cur, names), loader(cur)))
+    _ensure_listener()
+    generations = tuple(_generation.get(n, 0) for n in names)
+    listening = _listening()
+    entry = _values.get(key)
+    if listening and entry is not None and entry[1] == ('notify', generations):
+        with _lock:
+            _stats['hits'] += 1
+        return entry[2], entry[3]
+
+    def load(cur):
+        # Version first: the value loaded after it is at least as new
+        version = get_data_versions(cur, names)
+        token = ('notify', generations) if listening else ('version', version)
+        if entry is not None and entry[1] == token:
+            return token, entry[2], entry[3], True
+        return token, version, loader(cur), False
+
+    token, version, value, hit = _with_cursor(cursor, load)
+    with _lock:
+        if hit:
+            _stats['hits'] += 1
+        else:
+            _stats['misses'] += 1
+            if tuple(_generation.get(n, 0) for n in names) == generations:
+                _values[key] = (names, token, version, value)
+    return version, value
+
+
+def invalidate(name=None):
+    """Drop the entries of a name (or all); inside a request the name stays uncached until it ends."""
+    with _lock:
+        if name is not None:
+            names = {name}
+        else:
+            names = set(_generation) | {n for n, _ in _entries} | {n for v in _values.values() for n in v[0]}
+        for n in names:
+            _generation[n] = _generation.get(n, 0) + 1
+        for key in [k for k in _entries if k[0] in names]:
+            del _entries[key]
+        for key in [k for k, v in _values.items() if names.intersection(v[0])]:
+            del _values[key]
+    if name is not None and has_request_context():
+        g._data_cache_written = g.get('_data_cache_written', frozenset()) | {name}
+
+
+def _written_in_request(name):
+    return has_request_context() and name in g.get('_data_cache_written', ())
+
+
+def stats():
+    """Hit/miss counters, cached entries and listener state of this process."""
+    with _lock:
+        return dict(_stats, entries=sorted('/'.join(k) for k in _entries), values=sorted(map(str, _values)),
+                    listening=_listening())
+
+
+class _Listener(threading.Thread):
+    """LISTEN for data_versions notifications and invalidate the matching entries."""
+
+    def __init__(self, retry_interval=5.0):
+        super().__init__(name='data-cache-listener', daemon=True)
+        self.retry_interval = retry_interval
+        self.connected = threading.Event()
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                with psycopg.connect(_conninfo(), autocommit=True) as conn:
+                    conn.execute(f'LISTEN {DATA_VERSION_CHANNEL}')
+                    # Anything could have changed while nobody was listening
+                    invalidate()
+                    self.connected.set()
+                    print(f"👂 Data cache listening on '{DATA_VERSION_CHANNEL}' (pid {os.getpid()})")
+                    while not self.stopping.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            name = notify.payload.split(':', 1)[0]
+                            invalidate_local(name)
+            except Exception as e:
+                print(f"⚠️ Data cache listener error: {e}")
+            finally:
+                self.connected.clear()
+            self.stopping.wait(self.retry_interval)
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+def invalidate_local(name):
+    """Invalidate for a notification (no request bookkeeping)."""
+    with _lock:
+        _stats['notifications'] += 1
+        _generation[name] = _generation.get(name, 0) + 1
+        for key in [k for k in _entries if k[0] == name]:
+            del _entries[key]
+        for key in [k for k, v in _values.items() if name in v[0]]:
+            del _values[key]
+
+
+def _listening():
+    listener = _listener
+    return listener is not None and _listener_pid == os.getpid() and listener.connected.is_set()
+
+
+def _ensure_listener():
+    """Start the listener thread of this process (again after a fork)."""
+    global _listener, _listener_pid
+    if not Config.DATA_CACHE_LISTEN:
+        return
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener is None or _listener_pid != os.getpid():
+            _listener = _Listener()
+            _listener_pid = os.getpid()
+            _listener.start()
+
+
+def stop_listener(timeout=5):
+    """Stop the listener thread of this process (the next read starts a new one)."""
+    global _listener, _listener_pid
+    with _listener_lock:
+        listener, _listener, _listener_pid = _listener, None, None
+    if listener is not None:
+        listener.stop(timeout)
+
+
+def _reset_after_fork():
+    # The parent's entries may be stale by the time the child serves them;
+    # the locks may have been held by another thread of the parent
+    global _entries, _values, _generation, _lock, _listener_lock
+    _entries = {}
+    _values = {}
+    _generation = {}
+    _lock = threading.Lock()
+    _listener_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
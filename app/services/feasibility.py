@@ -0,0 +1,169 @@
+"""
+Feasibility pre-check for a regeneration.
+
+Before the planner searches, a few vectorized counts over the availability
+and pin data show what cannot work out, whatever the search does:
+
+- matches with fewer candidates than open slots (pins count as filled),
+- dates with several matches that need more distinct players than are
+  available on that date (a player plays at most once per date),
+- players whose fairness cap cannot be met: pinned more often than the cap,
+  or available on fewer dates than their fair share,
+- whether the remaining slots fit under the cap at all.
+
+C is the players×matches candidate matrix (available, not pinned, not booked
+elsewhere on the same date), D the matches×dates one-hot matrix; per-date
+counts follow from C·D.
+"""
+import numpy as np
+
+from app.services import planner
+from app.services.scoring import build_matrix, PLAYERS_PER_MATCH
+
+
+def _date_columns(targets):
+    """Column index per target match into the date list (undated matches get their own column)."""
+    dates = []
+    index = {}
+    columns = []
+    for m in targets:
+        key = planner._date_key(m.get('match_date'))
+        if key is None:
+            key = ('match', m['id'])
+        if key not in index:
+            index[key] = len(dates)
+            dates.append(key)
+        columns.append(index[key])
+    return dates, np.array(columns, dtype=np.int64)
+
+
+def check_feasibility(plan_kwargs):
+    """
+    Bottleneck report for plan_kwargs (the plan_season keyword arguments).
+
+    Returns:
+        dict with 'feasible', 'total_shortfall', 'matches' (only problem
+        matches), 'dates' (only dates short of players), 'players' (only players
+        whose cap or fair share cannot be met) and 'fairness' (cap, fair share,
+        capacity under the cap).
+    """
+    targets = plan_kwargs['target_matches']
+    players = plan_kwargs['active_players']
+    availability = plan_kwargs['availability']
+    pinned = plan_kwargs['pinned_assignments']
+    bookings = plan_kwargs.get('date_bookings') or {}
+
+    player_ids = [p['id'] for p in players]
+    match_ids = [m['id'] for m in targets]
+    names = {p['id']: p.get('name') for p in players}
+    n_players, n_matches = len(player_ids), len(match_ids)
+    col = {mid: j for j, mid in enumerate(match_ids)}
+
+    pins = build_matrix(player_ids, match_ids, {mid: pinned.get(mid, []) for mid in match_ids})
+    available = np.ones((n_players, n_matches), dtype=bool)
+    for i, pid in enumerate(player_ids):
+        for mid, is_available in availability.get(pid, {}).items():
+            j = col.get(mid)
+            if j is not None and not is_available:
+                available[i, j] = False
+    # Booked in another match on the same date (pins elsewhere, kept rows outside the scope)
+    blocked = np.zeros((n_players, n_matches), dtype=bool)
+    row = {pid: i for i, pid in enumerate(player_ids)}
+    columns_by_date = {}
+    for j, m in enumerate(targets):
+        date = planner._date_key(m.get('match_date'))
+        if date is not None:
+            columns_by_date.setdefault(date, []).append(j)
+    for (pid, date), booked in bookings.items():
+        if pid not in row:
+            continue
+        for j in columns_by_date.get(date, ()):
+            if any(other != match_ids[j] for other in booked):
+                blocked[row[pid], j] = True
+    candidates = available & ~blocked & ~pins
+
+    # Per match
+    pinned_count = pins.sum(axis=0)
+    needed = np.maximum(0, PLAYERS_PER_MATCH - pinned_count)
+    candidate_count = candidates.sum(axis=0)
+    match_shortfall = np.maximum(0, needed - candidate_count)
+
+    # Per date: C·D counts the matches a player could play on each date
+    dates, date_col = _date_columns(targets)
+    D = np.zeros((n_matches, len(dates)), dtype=np.int64)
+    D[np.arange(n_matches), date_col] = 1
+    on_date = (candidates.astype(np.int64) @ D) > 0
+    distinct = on_date.sum(axis=0)
+    slots = needed @ D
+    date_shortfall = np.maximum(slots - distinct, match_shortfall @ D)
+
+    # Per player: at most one match per date, pinned or as a candidate
+    playable_dates = (((candidates | pins).astype(np.int64) @ D) > 0).sum(axis=1)
+    pinned_per_player = pins.sum(axis=1)
+    total_slots = n_matches * PLAYERS_PER_MATCH
+    cap = -(-total_slots // max(1, n_players))
+    fair_share = total_slots // max(1, n_players)
+    capacity = np.minimum(playable_dates, cap)
+    total_shortfall = int(date_shortfall.sum())
+    fillable = total_slots - total_shortfall
+
+    report_matches = []
+    for j in np.flatnonzero((match_shortfall > 0) | ((candidate_count == needed) & (needed > 0))):
+        m = targets[j]
+        report_matches.append({
+            'match_id': m['id'],
+            'match_date': str(planner._date_key(m.get('match_date'))),
+            'home_team': m.get('home_team'),
+            'away_team': m.get('away_team'),
+            'pinned': int(pinned_count[j]),
+            'needed': int(needed[j]),
+            'candidates': int(candidate_count[j]),
+            'shortfall': int(match_shortfall[j]),
+            'status': 'infeasible' if match_shortfall[j] > 0 else 'tight',
+        })
+
+    report_dates = []
+    for k in np.flatnonzero((date_shortfall > 0) & (D.sum(axis=0) > 1)):
+        report_dates.append({
+            'date': str(dates[k]),
+            'matches': [match_ids[j] for j in np.flatnonzero(date_col == k)],
+            'slots': int(slots[k]),
+            'available_players': int(distinct[k]),
+            'shortfall': int(date_shortfall[k]),
+        })
+
+    report_players = []
+    for i in np.flatnonzero((pinned_per_player > cap) | (playable_dates < fair_share)):
+        pid = player_ids[i]
+        issues = []
+        if pinned_per_player[i] > cap:
+            issues.append('pinned_over_cap')
+        if playable_dates[i] < fair_share:
+            issues.append('below_fair_share')
+        report_players.append({
+            'player_id': pid,
+            'name': names.get(pid),
+            'pinned': int(pinned_per_player[i]),
+            'playable_dates': int(playable_dates[i]),
+            'fair_share': int(fair_share),
+            'cap': int(cap),
+            'missing': int(max(0, fair_share - playable_dates[i])),
+            'issues': issues,
+        })
+
+    return {
+        'feasible': total_shortfall == 0,
+        'total_shortfall': total_shortfall,
+        'matches': report_matches,
+        'dates': report_dates,
+        'players': report_players,
+        'fairness': {
+            'slots': int(total_slots),
+            'players': int(n_players),
+            'cap': int(cap),
+            'fair_share': int(fair_share),
+            'capacity_under_cap': int(capacity.sum()),
+            # Slots that can only be filled by players going over the cap
+            'over_cap_slots': int(max(0, fillable - capacity.sum())),
+        },
+    }
@@ -0,0 +1,367 @@
+"""
+Background jobs for long-running planning work (regenerations, imports).
+
+The queue is the planning_jobs table: the API inserts a job and returns its id
+right away, a worker thread in every web worker process (started by
+gunicorn.conf.py, or run.py for the dev server) claims queued jobs with
+SELECT ... FOR UPDATE SKIP LOCKED (so each job runs exactly once, whichever
+process picks it up) and writes progress and the result back to the row.
+
+At most one job per kind is queued or running at a time (partial unique
+index), so two regenerations never run at once; submitting another one
+returns the active job instead.
+
+A standalone worker (no web server) can be started with:
+    python -m app.services.jobs
+"""
+import os
+import json
+import socket
+import threading
+import traceback
+
+from psycopg.types.json import Jsonb
+
+from app.models.database import get_db_connection, _open_connection
+from config import Config
+
+JOB_KINDS = ('regenerate', 'import_matches', 'import_players')
+
+# Parameters a regenerate job passes on to SinglePlanning.regenerate_planning
+REGENERATE_PARAMS = (
+    'plan_mode', 'cutoff_date', 'restarts', 'time_budget', 'seed',
+    'optimize_time', 'optimize_iterations', 'solver_time_limit', 'dry_run', 'allocation',
+)
+
+
+def _jsonb(value):
+    # Results may hold dates or decimals; store those as strings
+    return Jsonb(value, dumps=lambda obj: json.dumps(obj, default=str))
+
+
+class JobQueue:
+    """Postgres-backed job queue (table planning_jobs)."""
+
+    _table_ready = False
+
+    @staticmethod
+    def create_table(cursor):
+        """Create the jobs table if it doesn't exist."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS planning_jobs (
+                id SERIAL PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params JSONB NOT NULL DEFAULT '{}'::jsonb,
+                status TEXT NOT NULL DEFAULT 'queued',
+                progress INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                result JSONB,
+                error TEXT,
+                created_by INTEGER,
+                worker TEXT,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP WITHOUT TIME ZONE,
+                updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP WITHOUT TIME ZONE
+            )
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS planning_jobs_one_active_per_kind
+            ON planning_jobs (kind) WHERE status IN ('queued', 'running')
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS planning_jobs_queued
+            ON planning_jobs (id) WHERE status = 'queued'
+        ''')
+
+    @staticmethod
+    def ensure_table():
+        """Create the table once per process (outside the request transaction)."""
+        if JobQueue._table_ready:
+            return
+        conn = _open_connection()
+        cursor = conn.cursor()
+        try:
+            JobQueue.create_table(cursor)
+            conn.commit()
+            JobQueue._table_ready = True
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def enqueue(kind, params=None, created_by=None):
+        """
+        Queue a job.
+
+        Returns:
+            (job, created): the new job, or the job of this kind that is already
+            queued or running (created=False)
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        JobQueue.ensure_table()
+        # Own connection: the job must be visible to the workers before the
+        # request that submitted it has finished
+        conn = _open_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO planning_jobs (kind, params, created_by)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (kind) WHERE status IN ('queued', 'running') DO NOTHING
+                RETURNING *
+            ''', (kind, _jsonb(params or {}), created_by))
+            job = cursor.fetchone()
+            created = job is not None
+            if not created:
+                cursor.execute('''
+                    SELECT * FROM planning_jobs
+                    WHERE kind = %s AND status IN ('queued', 'running')
+                ''', (kind,))
+                job = cursor.fetchone()
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        if created:
+            print(f"📥 Job {job['id']} queued ({kind})")
+            wake_worker()
+        return job, created
+
+    @staticmethod
+    def get(job_id):
+        """Get a job by id (None when unknown)."""
+        JobQueue.ensure_table()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT * FROM planning_jobs WHERE id = %s', (job_id,))
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def claim_next(worker_name=None):
+        """Claim the oldest queued job; jobs locked by other workers are skipped."""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT id FROM planning_jobs
+                WHERE status = 'queued'
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            ''')
+            row = cursor.fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            cursor.execute('''
+                UPDATE planning_jobs
+                SET status = 'running', worker = %s, progress = 0,
+                    started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                RETURNING *
+            ''', (worker_name, row['id']))
+            job = cursor.fetchone()
+            conn.commit()
+            return job
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def update_progress(job_id, progress, message=None):
+        """Store progress (0-100) and a short status message."""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                UPDATE planning_jobs
+                SET progress = %s, message = COALESCE(%s, message), updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND status = 'running'
+            ''', (max(0, min(100, int(progress))), message, job_id))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def finish(job_id, result=None, error=None):
+        """Mark a job done (or failed when error is given or the result says so)."""
+        failed = error is not None or (isinstance(result, dict) and not result.get('success', True))
+        message = error or (result.get('message') if isinstance(result, dict) else None)
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                UPDATE planning_jobs
+                SET status = %s, progress = 100, result = %s, error = %s,
+                    message = COALESCE(%s, message),
+                    finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', ('failed' if failed else 'done', _jsonb(result) if result is not None else None,
+                  error, message, job_id))
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def fail_stale(max_age_seconds=None):
+        """Fail running jobs without a progress update for too long (their worker died)."""
+        max_age = max_age_seconds if max_age_seconds is not None else Config.JOBS_STALE_AFTER
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                UPDATE planning_jobs
+                SET status = 'failed', error = 'Worker gestopt tijdens uitvoeren',
+                    finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running'
+                  AND updated_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                RETURNING id
+            ''', (max_age,))
+            ids = [r['id'] for r in cursor.fetchall()]
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        for job_id in ids:
+            print(f"⚠️ Job {job_id} marked failed (stale)")
+        return ids
+
+    @staticmethod
+    def run(job):
+        """Execute a claimed job and store its result."""
+        job_id = job['id']
+        params = job.get('params') or {}
+
+        def progress(pct, message=None):
+            JobQueue.update_progress(job_id, pct, message)
+
+        print(f"⚙️ Job {job_id} started ({job['kind']})")
+        try:
+            if job['kind'] == 'regenerate':
+                from app.services.single_planning import SinglePlanning
+                kwargs = {k: params[k] for k in REGENERATE_PARAMS if params.get(k) is not None}
+                result = SinglePlanning.regenerate_planning(exclude_pinned=True, progress=progress, **kwargs)
+            elif job['kind'] == 'import_matches':
+                from app.services.import_service import ImportService
+                progress(10, 'Wedstrijden importeren...')
+                result = ImportService().import_matches(use_static_fallback=params.get('use_static_fallback', True))
+            elif job['kind'] == 'import_players':
+                from app.services.import_service import ImportService
+                progress(10, 'Spelers importeren...')
+                result = ImportService().import_players()
+            else:
+                raise ValueError(f"Unknown job kind '{job['kind']}'")
+            JobQueue.finish(job_id, result=result)
+            print(f"✅ Job {job_id} finished")
+        except Exception as e:
+            traceback.print_exc()
+            JobQueue.finish(job_id, error=str(e))
+            print(f"❌ Job {job_id} failed: {e}")
+
+
+class JobWorker(threading.Thread):
+    """Daemon thread that claims and runs queued jobs, one at a time."""
+
+    def __init__(self, app=None, poll_interval=None):
+        super().__init__(name='planning-job-worker', daemon=True)
+        self.app = app
+        self.poll_interval = poll_interval if poll_interval is not None else Config.JOBS_POLL_INTERVAL
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def run_once(self):
+        """Claim and run at most one job; returns True when a job ran."""
+        job = JobQueue.claim_next(self.worker_name)
+        if job is None:
+            return False
+        if self.app is not None:
+            # Imports read the team settings from the app config
+            with self.app.app_context():
+                JobQueue.run(job)
+        else:
+            JobQueue.run(job)
+        return True
+
+    def run(self):
+        print(f"👷 Job worker started ({self.worker_name})")
+        try:
+            JobQueue.ensure_table()
+        except Exception as e:
+            print(f"❌ Job worker could not prepare the jobs table: {e}")
+        while not self.stopping.is_set():
+            try:
+                JobQueue.fail_stale()
+                while not self.stopping.is_set() and self.run_once():
+                    pass
+            except Exception as e:
+                print(f"❌ Job worker error: {e}")
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+_worker = None
+_worker_pid = None
+_worker_app = None
+_worker_lock = threading.Lock()
+
+
+def start_worker(app=None):
+    """Start the worker thread of this process (again after a fork)."""
+    global _worker, _worker_pid, _worker_app
+    with _worker_lock:
+        if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+            return _worker
+        _worker_app = app
+        _worker = JobWorker(app)
+        _worker_pid = os.getpid()
+        _worker.start()
+        return _worker
+
+
+def stop_worker(timeout=5):
+    """Stop the worker thread of this process (if any)."""
+    global _worker, _worker_pid
+    with _worker_lock:
+        worker, _worker, _worker_pid = _worker, None, None
+    if worker is not None:
+        worker.stop(timeout)
+
+
+def wake_worker():
+    """Let the local worker pick up a new job now instead of at its next poll."""
+    worker = _worker
+    if worker is not None and _worker_pid == os.getpid():
+        worker.wakeup.set()
+    elif worker is not None:
+        # Forked after the worker was started (e.g. gunicorn --preload)
+        start_worker(_worker_app)
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    flask_app = create_app()
+    print("👷 Running standalone job worker (Ctrl+C to stop)")
+    worker = JobWorker(flask_app)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,476 @@
+"""
+Local-search post-optimizer for a generated season plan.
+
+The greedy planner (app.services.planner.plan_season) fills matches one by one
+and cannot revisit earlier choices. This module takes its plan and improves it
+with simulated annealing over three neighbourhoods:
+
+- fill:    add an available player to an in-scope match that is short
+- replace: swap a planned player in a match for someone who is not playing
+- swap:    exchange two planned players between two in-scope matches
+
+Pinned players, matches outside the scope, availability and the same-date rule
+are always respected. The objective is the one of planner.evaluate_plan
+(scoring.SeasonScorer): the state starts from the scorer's evaluation and
+masks, and every move updates it incrementally, touching only the affected
+players, pairs and the neighbouring matches (O(team size)).
+"""
+import math
+import time
+import random
+
+from app.services import planner, scoring
+
+
+class _SeasonState:
+    """Mutable season plan with the scoring.SeasonScorer components maintained incrementally."""
+
+    def __init__(self, season_matches, lineups, players, availability):
+        self.players_by_id = {p['id']: p for p in players}
+        self.availability = availability
+        self.matches = list(season_matches)
+        self.index_by_id = {m['id']: i for i, m in enumerate(self.matches)}
+        self.dates = [planner._date_key(m.get('match_date')) for m in self.matches]
+        self.lineups = [list(lineups.get(m['id'], [])) for m in self.matches]
+        self.sets = [set(l) for l in self.lineups]
+
+        scorer = scoring.SeasonScorer(self.matches, players)
+        self.player_ids = scorer.player_ids
+        self.row = {pid: r for r, pid in enumerate(self.player_ids)}
+        self.is_home = scorer.home_mask.tolist()
+        self.num_players = max(1, len(self.player_ids))
+        A = scorer.matrix(dict(zip(scorer.match_ids, self.lineups)))
+        comp = scorer.evaluate(A, lineup_sizes=[len(team) for team in self.lineups])
+        self.shortfall = comp['shortfall']
+        self.home_away = comp['home_away']
+        self.pair_sq = comp['pair_cooccurrence']
+        self.spacing = comp['spacing']
+        self.partner_hits = comp['partner_hits']
+        # Plain lists: per-move updates on single cells are cheaper than on arrays
+        self.together = scoring.cooccurrence(A).tolist()
+        self.partner = scorer.partner_mask.tolist()
+        self.prefer = scorer.prefer_mask.tolist()
+        home, _ = scoring.home_away_counts(A, scorer.home_mask)
+        self.counts = dict(zip(self.player_ids, scoring.match_counts(A).tolist()))
+        self.home = dict(zip(self.player_ids, home.tolist()))
+
+        self.bookings = {}
+        for i, team in enumerate(self.lineups):
+            if self.dates[i] is not None:
+                for pid in team:
+                    if pid in self.counts:
+                        self.bookings.setdefault((pid, self.dates[i]), set()).add(i)
+
+        self.sum_counts = sum(self.counts.values())
+        self.sum_sq = sum(c * c for c in self.counts.values())
+        self.hist = {}
+        for c in self.counts.values():
+            self.hist[c] = self.hist.get(c, 0) + 1
+
+    # --- objective -------------------------------------------------------
+
+    def is_partner_pair(self, a, b):
+        return bool(self.partner[self.row[a]][self.row[b]])
+
+    def times_together(self, a, b):
+        return self.together[self.row[a]][self.row[b]]
+
+    def _pair_add(self, a, b, step):
+        i, j = self.row[a], self.row[b]
+        n = self.together[i][j]
+        self.together[i][j] = self.together[j][i] = n + step
+        if self.partner[i][j]:
+            if self.prefer[i][j]:
+                self.partner_hits += step
+        else:
+            self.pair_sq += (n + step) ** 2 - n * n
+
+    def _count_add(self, pid, step, home):
+        c = self.counts[pid]
+        h = self.home[pid]
+        self.hist[c] -= 1
+        if not self.hist[c]:
+            del self.hist[c]
+        self.hist[c + step] = self.hist.get(c + step, 0) + 1
+        self.sum_sq += (c + step) ** 2 - c * c
+        self.sum_counts += step
+        new_h = h + (step if home else 0)
+        self.home_away += abs(2 * new_h - (c + step)) - abs(2 * h - c)
+        self.counts[pid] = c + step
+        self.home[pid] = new_h
+
+    def components(self):
+        values = self.hist
+        mean_sq = (self.sum_counts * self.sum_counts) / self.num_players
+        return {
+            'shortfall': self.shortfall,
+            'fairness_spread': (max(values) - min(values)) if values else 0,
+            'fairness_variance': round(self.sum_sq - mean_sq, 4),
+            'home_away': self.home_away,
+            'pair_cooccurrence': self.pair_sq,
+            'spacing': self.spacing,
+            'partner_hits': self.partner_hits,
+        }
+
+    def total(self):
+        comp = self.components()
+        return sum(planner.OBJECTIVE_WEIGHTS[k] * comp[k] for k in planner.OBJECTIVE_WEIGHTS)
+
+    # --- primitive moves -------------------------------------------------
+
+    def can_add(self, i, pid):
+        if pid in self.sets[i]:
+            return False
+        if not self.availability.get(pid, {}).get(self.matches[i]['id'], True):
+            return False
+        date = self.dates[i]
+        if date is not None and self.bookings.get((pid, date)):
+            return False
+        return True
+
+    def add(self, i, pid):
+        team = self.lineups[i]
+        self.shortfall += abs(planner.PLAYERS_PER_MATCH - len(team) - 1) - abs(planner.PLAYERS_PER_MATCH - len(team))
+        for other in team:
+            if other in self.counts:
+                self._pair_add(pid, other, +1)
+        if i > 0 and pid in self.sets[i - 1]:
+            self.spacing += 1
+        if i + 1 < len(self.sets) and pid in self.sets[i + 1]:
+            self.spacing += 1
+        self._count_add(pid, +1, self.is_home[i])
+        team.append(pid)
+        self.sets[i].add(pid)
+        if self.dates[i] is not None:
+            self.bookings.setdefault((pid, self.dates[i]), set()).add(i)
+
+    def remove(self, i, pid):
+        team = self.lineups[i]
+        team.remove(pid)
+        self.sets[i].discard(pid)
+        self.shortfall += abs(planner.PLAYERS_PER_MATCH - len(team)) - abs(planner.PLAYERS_PER_MATCH - len(team) - 1)
+        for other in team:
+            if other in self.counts:
+                self._pair_add(pid, other, -1)
+        if i > 0 and pid in self.sets[i - 1]:
+            self.spacing -= 1
+        if i + 1 < len(self.sets) and pid in self.sets[i + 1]:
+            self.spacing -= 1
+        self._count_add(pid, -1, self.is_home[i])
+        if self.dates[i] is not None:
+            self.bookings[(pid, self.dates[i])].discard(i)
+
+
+def _build_state(season_matches, lineups, plan_kwargs):
+    state = _SeasonState(season_matches, lineups, plan_kwargs['active_players'], plan_kwargs['availability'])
+    # Bookings on matches outside the season (e.g. already played) also block a date
+    for (pid, date), match_ids in (plan_kwargs.get('date_bookings') or {}).items():
+        for mid in match_ids:
+            if mid not in state.index_by_id:
+                state.bookings.setdefault((pid, date), set()).add(('external', mid))
+    return state
+
+
+def _anneal(state, targets, locked, time_budget=1.0, rng=None, max_iterations=None,
+            initial_temperature=2.0, final_temperature=0.01):
+    """
+    Simulated annealing over the matches at indices `targets` of the state.
+
+    Returns:
+        (best_lineups {index: [player_ids]}, objective before, best objective,
+        iterations, accepted moves)
+    """
+    rng = rng or random
+
+    def movable(i):
+        pins = locked.get(i, ())
+        return [pid for pid in state.lineups[i] if pid not in pins and pid in state.counts]
+
+    start = time.monotonic()
+    current = state.total()
+    before = current
+    best = current
+    best_lineups = {i: list(state.lineups[i]) for i in targets}
+    iterations = 0
+    accepted = 0
+
+    if targets and state.player_ids:
+        temperature = initial_temperature
+        while True:
+            if max_iterations is not None and iterations >= max_iterations:
+                break
+            if iterations % 128 == 0:
+                elapsed = time.monotonic() - start
+                if time_budget and elapsed >= time_budget:
+                    break
+                if max_iterations:
+                    progress = iterations / max_iterations
+                else:
+                    progress = elapsed / time_budget if time_budget else 1.0
+                    if progress >= 1.0:
+                        break
+                temperature = initial_temperature * (final_temperature / initial_temperature) ** progress
+            iterations += 1
+
+            i = rng.choice(targets)
+            undo = []
+            if len(state.lineups[i]) < planner.PLAYERS_PER_MATCH:
+                # fill: add a player to a short lineup
+                q = rng.choice(state.player_ids)
+                if not state.can_add(i, q):
+                    continue
+                state.add(i, q)
+                undo.append(('remove', i, q))
+            elif rng.random() < 0.5:
+                # replace: planned player out, someone else in
+                candidates = movable(i)
+                if not candidates:
+                    continue
+                p = rng.choice(candidates)
+                q = rng.choice(state.player_ids)
+                state.remove(i, p)
+                if not state.can_add(i, q) or q == p:
+                    state.add(i, p)
+                    continue
+                state.add(i, q)
+                undo += [('remove', i, q), ('add', i, p)]
+            else:
+                # swap: exchange planned players between two matches
+                j = rng.choice(targets)
+                if j == i:
+                    continue
+                from_i, from_j = movable(i), movable(j)
+                if not from_i or not from_j:
+                    continue
+                p, q = rng.choice(from_i), rng.choice(from_j)
+                if p == q or p in state.sets[j] or q in state.sets[i]:
+                    continue
+                state.remove(i, p)
+                state.remove(j, q)
+                if not (state.can_add(i, q) and state.can_add(j, p)):
+                    state.add(i, p)
+                    state.add(j, q)
+                    continue
+                state.add(i, q)
+                state.add(j, p)
+                undo += [('remove', i, q), ('remove', j, p), ('add', i, p), ('add', j, q)]
+
+            candidate = state.total()
+            delta = candidate - current
+            if delta <= 0 or rng.random() < math.exp(-delta / max(temperature, 1e-9)):
+                current = candidate
+                accepted += 1
+                if current < best - 1e-9:
+                    best = current
+                    best_lineups = {k: list(state.lineups[k]) for k in targets}
+            else:
+                for op, k, pid in undo:
+                    getattr(state, op)(k, pid)
+
+    return best_lineups, before, best, iterations, accepted
+
+
+def optimize_plan(result, plan_kwargs, season_matches, fixed_lineups=None,
+                  time_budget=1.0, rng=None, max_iterations=None,
+                  initial_temperature=2.0, final_temperature=0.01):
+    """
+    Improve a plan_season result with simulated annealing.
+
+    Args:
+        result: plan_season result (its 'assignments' are the starting point)
+        plan_kwargs: the plan_season keyword arguments used to create it
+        season_matches: match dicts in season order used for scoring
+        fixed_lineups: {match_id: [player_ids]} of matches outside the scope
+        time_budget: wall-clock budget in seconds
+        rng: random.Random-like source (use a seeded one for reproducible runs)
+        max_iterations: optional cap on the number of attempted moves; when set,
+            the cooling schedule follows the iterations instead of the clock so a
+            seeded rng gives a reproducible result (the time budget still applies)
+
+    Returns:
+        A copy of result with improved 'assignments', recomputed statistics,
+        'objective' and an 'optimizer' report (before, after, improvement,
+        iterations, accepted, elapsed).
+    """
+    start = time.monotonic()
+    target_matches = plan_kwargs['target_matches']
+    pinned = plan_kwargs['pinned_assignments']
+    players = plan_kwargs['active_players']
+    lineups = planner.build_lineups(target_matches, pinned, result['assignments'], fixed_lineups)
+    state = _build_state(season_matches, lineups, plan_kwargs)
+
+    targets = [state.index_by_id[m['id']] for m in target_matches if m['id'] in state.index_by_id]
+    locked = {state.index_by_id[mid]: set(pids) for mid, pids in pinned.items() if mid in state.index_by_id}
+    best_lineups, before, best, iterations, accepted = _anneal(
+        state, targets, locked, time_budget=time_budget, rng=rng, max_iterations=max_iterations,
+        initial_temperature=initial_temperature, final_temperature=final_temperature,
+    )
+
+    # Rebuild the result from the best plan found
+    improved = dict(result)
+    assignments = {}
+    for i in targets:
+        pins = locked.get(i, set())
+        assignments[state.matches[i]['id']] = [pid for pid in best_lineups[i] if pid not in pins]
+    improved['assignments'] = assignments
+    improved.update(planner.summarize_assignments(assignments, plan_kwargs))
+    final_lineups = planner.build_lineups(target_matches, pinned, assignments, fixed_lineups)
+    improved['objective'] = planner.evaluate_plan(season_matches, final_lineups, players)
+    before_total = round(before, 4)
+    improved['optimizer'] = {
+        'before': before_total,
+        'after': improved['objective']['total'],
+        'improvement': round(before_total - improved['objective']['total'], 4),
+        'iterations': iterations,
+        'accepted': accepted,
+        'elapsed': round(time.monotonic() - start, 3),
+    }
+    return improved
+
+
+
+def repair_plan(plan_kwargs, season_matches, lineups, changed_cells, neighbourhood=1,
+                time_budget=0.05, max_iterations=2000, rng=None):
+    """
+    Repair a season plan after a few (player, match) cells changed.
+
+    Only the changed matches whose lineup is now invalid (an unavailable or
+    double-booked player who is not pinned, or not exactly 4 players) are
+    touched, together with `neighbourhood` matches on either side of each in
+    season order. The invalid players are dropped, short lineups are filled
+    with the cheapest valid player and the affected matches get a short
+    annealing pass; fairness is scored over the whole season.
+
+    Args:
+        plan_kwargs: target_matches (matches that may change, e.g. all unplayed),
+            active_players, availability, pinned_assignments, date_bookings
+        season_matches: match dicts in season order
+        lineups: {match_id: [player_ids]} current lineups of the season matches
+        changed_cells: iterable of (player_id, match_id)
+        neighbourhood: number of neighbouring matches on each side to re-solve
+
+    Returns:
+        dict with 'lineups' ({match_id: [player_ids]} of the affected matches),
+        'invalid_matches', 'affected_matches', 'objective_before', 'objective_after'.
+    """
+    state = _build_state(season_matches, lineups, plan_kwargs)
+    pinned = plan_kwargs['pinned_assignments']
+    locked = {state.index_by_id[mid]: set(pids) for mid, pids in pinned.items() if mid in state.index_by_id}
+    repairable = {state.index_by_id[m['id']] for m in plan_kwargs['target_matches'] if m['id'] in state.index_by_id}
+    before = state.total()
+
+    # Matches whose lineup is now invalid
+    invalid = set()
+    for _, mid in changed_cells:
+        i = state.index_by_id.get(mid)
+        if i is None or i not in repairable:
+            continue
+        pins = locked.get(i, set())
+        date = state.dates[i]
+        drop = [
+            pid for pid in state.lineups[i]
+            if pid in state.counts and pid not in pins and (
+                not state.availability.get(pid, {}).get(mid, True)
+                or (date is not None and len(state.bookings.get((pid, date), ())) > 1)
+            )
+        ]
+        for pid in drop:
+            state.remove(i, pid)
+        if drop or len(state.lineups[i]) != planner.PLAYERS_PER_MATCH:
+            invalid.add(i)
+
+    affected = set()
+    for i in invalid:
+        for k in range(i - neighbourhood, i + neighbourhood + 1):
+            if k in repairable:
+                affected.add(k)
+
+    # Fill short lineups / trim overfull ones with the cheapest valid move
+    for i in sorted(invalid):
+        pins = locked.get(i, set())
+        while len(state.lineups[i]) < planner.PLAYERS_PER_MATCH:
+            options = [pid for pid in state.player_ids if state.can_add(i, pid)]
+            if not options:
+                break
+            costs = []
+            for pid in options:
+                state.add(i, pid)
+                costs.append((state.total(), pid))
+                state.remove(i, pid)
+            state.add(i, min(costs)[1])
+        while len(state.lineups[i]) > planner.PLAYERS_PER_MATCH:
+            options = [pid for pid in state.lineups[i] if pid not in pins and pid in state.counts]
+            if not options:
+                break
+            costs = []
+            for pid in options:
+                state.remove(i, pid)
+                costs.append((state.total(), pid))
+                state.add(i, pid)
+            state.remove(i, min(costs)[1])
+
+    targets = sorted(affected)
+    best_lineups, _, best, _, _ = _anneal(
+        state, targets, locked, time_budget=time_budget, rng=rng or random.Random(0),
+        max_iterations=max_iterations, initial_temperature=0.5,
+    )
+    return {
+        'lineups': {state.matches[i]['id']: best_lineups[i] for i in targets},
+        'invalid_matches': [state.matches[i]['id'] for i in sorted(invalid)],
+        'affected_matches': [state.matches[i]['id'] for i in targets],
+        'objective_before': round(before, 4),
+        'objective_after': round(best, 4),
+    }
+
+
+def rank_substitutes(plan_kwargs, season_matches, lineups, match_id, player_id, limit=5):
+    """
+    Rank the valid substitutes for player_id in match_id.
+
+    Every candidate (available, not in the lineup, not booked elsewhere on the
+    date) is scored by the change in the season objective when they take the
+    slot, using the per-season counters of _SeasonState (no extra queries).
+
+    Returns:
+        List of dicts (best first): player_id, name, objective_delta (vs. the
+        current plan), match_count, home_count, back_to_back, synergy,
+        partner_in_lineup.
+    """
+    state = _build_state(season_matches, lineups, plan_kwargs)
+    i = state.index_by_id.get(match_id)
+    if i is None or player_id not in state.sets[i]:
+        return []
+    # Deltas are relative to the current plan (leaving player still in the slot)
+    base = state.total()
+    if player_id in state.counts:
+        state.remove(i, player_id)
+    else:
+        # Inactive player: take them out of the lineup without touching the counters
+        state.lineups[i].remove(player_id)
+        state.sets[i].discard(player_id)
+        state.shortfall += 1
+    team = list(state.lineups[i])
+
+    ranked = []
+    for pid in state.player_ids:
+        if pid == player_id or not state.can_add(i, pid):
+            continue
+        player = state.players_by_id[pid]
+        neighbours = (i > 0 and pid in state.sets[i - 1]) + (i + 1 < len(state.sets) and pid in state.sets[i + 1])
+        synergy = sum(state.times_together(pid, other) for other in team
+                      if other in state.counts and not state.is_partner_pair(pid, other))
+        state.add(i, pid)
+        delta = state.total() - base
+        state.remove(i, pid)
+        ranked.append({
+            'player_id': pid,
+            'name': player.get('name'),
+            'objective_delta': round(delta, 4),
+            'match_count': state.counts[pid],
+            'home_count': state.home[pid],
+            'back_to_back': int(neighbours),
+            'synergy': synergy,
+            'partner_in_lineup': any(state.is_partner_pair(pid, other) for other in team if other in state.counts),
+        })
+    ranked.sort(key=lambda r: (r['objective_delta'], r['match_count'], r['player_id']))
+    return ranked[:limit] if limit else ranked
@@ -0,0 +1,117 @@
+"""
+Memoized planner results, keyed by a fingerprint of the planning input.
+
+The key hashes everything a regeneration depends on: the state fingerprint
+(matches, active players, availability, current planning incl. pins, see
+SinglePlanning._state_fingerprint) plus the run parameters (plan_mode, cutoff,
+seed, restarts, ...). Any input change gives a new key, so entries never have
+to be invalidated; old ones simply fall out of the LRU.
+
+Entries live in a small in-process LRU and, when PLAN_CACHE_DB is enabled, in
+the plan_cache table (created by init_database) so other app processes can
+reuse them too.
+"""
+import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from psycopg.types.json import Jsonb
+
+from config import Config
+
+# Bump when the planner changes in a way that makes cached plans outdated
+CACHE_VERSION = 1
+
+# Result fields keyed by match or player id (JSON turns those keys into strings)
+_ID_KEYED = ('assignments', 'match_counts', 'home_counts', 'away_counts')
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'db_hits': 0}
+
+
+def make_key(state_fingerprint, **params):
+    """Cache key for a state fingerprint and the run parameters."""
+    payload = json.dumps({'v': CACHE_VERSION, 'state': state_fingerprint, 'params': params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _from_json(result):
+    for field in _ID_KEYED:
+        if isinstance(result.get(field), dict):
+            result[field] = {int(k): v for k, v in result[field].items()}
+    return result
+
+
+def _remember(key, result):
+    with _lock:
+        _lru[key] = result
+        _lru.move_to_end(key)
+        while len(_lru) > max(0, Config.PLAN_CACHE_SIZE):
+            _lru.popitem(last=False)
+
+
+def get(key, cursor=None):
+    """
+    Cached result for key (a copy), or None.
+
+    Args:
+        cursor: optional cursor; with PLAN_CACHE_DB the plan_cache table is
+            consulted on an in-process miss
+    """
+    with _lock:
+        result = _lru.get(key)
+        if result is not None:
+            _lru.move_to_end(key)
+            _stats['hits'] += 1
+            return copy.deepcopy(result)
+    if cursor is not None and Config.PLAN_CACHE_DB:
+        cursor.execute('''
+            UPDATE plan_cache SET used_at = CURRENT_TIMESTAMP
+            WHERE key = %s
+            RETURNING result
+        ''', (key,))
+        row = cursor.fetchone()
+        if row is not None:
+            result = _from_json(row['result'])
+            _remember(key, result)
+            with _lock:
+                _stats['db_hits'] += 1
+            return copy.deepcopy(result)
+    with _lock:
+        _stats['misses'] += 1
+    return None
+
+
+def put(key, result, cursor=None):
+    """Store a result (a copy); with PLAN_CACHE_DB also in the plan_cache table."""
+    if Config.PLAN_CACHE_SIZE <= 0 and not Config.PLAN_CACHE_DB:
+        return
+    stored = copy.deepcopy(result)
+    _remember(key, stored)
+    if cursor is not None and Config.PLAN_CACHE_DB:
+        cursor.execute('''
+            INSERT INTO plan_cache (key, result) VALUES (%s, %s)
+            ON CONFLICT (key) DO UPDATE SET used_at = CURRENT_TIMESTAMP
+        ''', (key, Jsonb(stored, dumps=lambda obj: json.dumps(obj, default=str))))
+        cursor.execute('''
+            DELETE FROM plan_cache
+            WHERE key NOT IN (SELECT key FROM plan_cache ORDER BY used_at DESC LIMIT %s)
+        ''', (max(1, Config.PLAN_CACHE_DB_MAX_ENTRIES),))
+
+
+def clear():
+    """Empty the in-process cache."""
+    with _lock:
+        _lru.clear()
+        for k in _stats:
+            _stats[k] = 0
+
+
+def stats():
+    """Hit/miss counters and size of the in-process cache."""
+    with _lock:
+        return dict(_stats, size=len(_lru), max_size=Config.PLAN_CACHE_SIZE, db=Config.PLAN_CACHE_DB)
@@ -0,0 +1,704 @@
+"""
+Season planner core - pure, DB-free planning algorithm.
+Builds lineups for the matches in scope from plain data structures, so that
+SinglePlanning.regenerate_planning only has to load the data once and write
+the result once.
+"""
+import os
+import copy
+import time
+import random
+from collections import defaultdict, deque
+import multiprocessing
+import multiprocessing.connection
+
+from app.services import scoring
+
+PLAYERS_PER_MATCH = 4
+
+# Weights and bonuses (tunable)
+RECENT_WEIGHT = 0.5
+SPACING_WEIGHT = 1.2
+SYNERGY_WEIGHT = 0.8
+SYNERGY_WEIGHT_FOR_PARTNERS = 0.3   # a bit lighter to keep partners together more often
+PARTNER_PAIR_BONUS = 1.5            # stronger bonus for selecting a true partner pair
+PARTNER_WITH_SELECTED_BONUS = 0.8   # slightly stronger bonus when partner already present
+QUARTET_MEMORY_SIZE = 3             # consider last N lineups as recent
+
+# Season objective weights (lower total is better)
+OBJECTIVE_WEIGHTS = {
+    'shortfall': 100.0,        # missing or surplus players vs. 4 per match (hard rule)
+    'fairness_spread': 5.0,    # max - min matches per player
+    'fairness_variance': 1.0,  # sum of squared deviations from the mean
+    'home_away': 0.5,          # sum of |home - away| per player
+    'pair_cooccurrence': 0.2,  # sum of squared times each non-partner pair plays together
+    'spacing': 1.0,            # appearances in back-to-back matches
+    'partner_hits': -1.0,      # matches where preferring partners play together (bonus)
+}
+
+
+def _date_key(value):
+    """Normalize a match date (date, datetime or None) for same-date checks."""
+    if value is None:
+        return None
+    return value.date() if hasattr(value, 'date') else value
+
+
+def build_date_bookings(rows, match_date_by_id):
+    """Index existing assignments as {(player_id, date): set(match_ids)}.
+
+    Args:
+        rows: iterable of (match_id, player_id) tuples still present in the planning
+        match_date_by_id: {match_id: match_date}
+    """
+    bookings = defaultdict(set)
+    for match_id, player_id in rows:
+        mdate = _date_key(match_date_by_id.get(match_id))
+        if mdate is not None:
+            bookings[(player_id, mdate)].add(match_id)
+    return bookings
+
+
+def plan_season(target_matches, active_players, availability, pinned_assignments,
+                date_bookings=None, unplayed_matches=None, rng=None, verbose=False):
+    """
+    Plan the matches in scope following the planning rules.
+
+    BUSINESS RULES:
+    1. PRECIES 4 SPELERS PER WEDSTRIJD (harde regel)
+    2. ALLEEN BESCHIKBARE SPELERS (availability, default beschikbaar)
+    3. GEEN DUBBELE PLANNING (speler kan niet 2x op zelfde datum)
+    4. EERLIJKE VERDELING (spelers met minste wedstrijden krijgen prioriteit)
+    5. VASTGEPINDE SPELERS blijven op hun plek
+    6. PARTNER VOORKEUREN waar mogelijk
+    7. THUIS/UIT BALANS per speler
+
+    Args:
+        target_matches: match dicts in scope, in planning order (id, match_date, is_home, ...)
+        active_players: player dicts (id, name, partner_id, prefer_partner_together)
+        availability: {player_id: {match_id: is_available}}
+        pinned_assignments: {match_id: [player_id, ...]} of pinned players that stay
+        date_bookings: {(player_id, date): set(match_ids)} of assignments that remain
+            in the planning; updated in place with the new selections
+        unplayed_matches: all unplayed match dicts (pinned counts outside scope)
+        rng: random.Random-like source for variatie (defaults to the random module)
+        verbose: print per-match progress
+
+    Returns:
+        dict with 'assignments' ({match_id: [player_ids]} of new, non-pinned
+        selections), 'rule_violations', 'regenerated_count', 'total_assignments'
+        and the per-player 'match_counts', 'home_counts' and 'away_counts'.
+    """
+    rng = rng or random
+    log = print if verbose else (lambda *args, **kwargs: None)
+    if date_bookings is None:
+        date_bookings = defaultdict(set)
+    if unplayed_matches is None:
+        unplayed_matches = target_matches
+
+    players_by_id = {p['id']: p for p in active_players}
+    unplayed_by_id = {m['id']: m for m in unplayed_matches}
+
+    player_match_counts = {p['id']: 0 for p in active_players}
+    player_home_counts = {p['id']: 0 for p in active_players}
+    player_away_counts = {p['id']: 0 for p in active_players}
+
+    # Track recent matches for variatie (last 3 matches played by each player)
+    recent_matches_by_player = {p['id']: [] for p in active_players}
+
+    # Count pinned matches across alle ongespeelde wedstrijden (niet alleen scope)
+    for match_id, player_ids in pinned_assignments.items():
+        match_info = unplayed_by_id.get(match_id)
+        if match_info:
+            for player_id in player_ids:
+                if player_id in player_match_counts:
+                    player_match_counts[player_id] += 1
+                    if match_info.get('is_home', False):
+                        player_home_counts[player_id] += 1
+                    else:
+                        player_away_counts[player_id] += 1
+
+    # Fairness caps per speler (binnen scope)
+    total_slots_target = len(target_matches) * PLAYERS_PER_MATCH
+    num_players_active = max(1, len(active_players))
+    max_per_player_target = (total_slots_target + num_players_active - 1) // num_players_active
+    fairness_counts = {p['id']: 0 for p in active_players}
+    for m in target_matches:
+        for pid in pinned_assignments.get(m['id'], []):
+            if pid in fairness_counts:
+                fairness_counts[pid] += 1
+    log(f"   🎯 Target slots: {total_slots_target}, cap per speler: {max_per_player_target}")
+
+    last_play_idx = {p['id']: None for p in active_players}  # last index where player was assigned (pinned or selected)
+    pair_cooccur = scoring.PairCounter(players_by_id)  # players×players times played together so far in this regen
+    recent_quartets = deque(maxlen=QUARTET_MEMORY_SIZE)
+
+    def prefers_partner(a_id, b_id):
+        return players_by_id.get(a_id, {}).get('prefer_partner_together', True) and \
+            players_by_id.get(b_id, {}).get('prefer_partner_together', True)
+
+    def compute_score(c, team_ids):
+        """Fairness score including synergy with pinned/selected players (lower is better)."""
+        pid_c = c['player']['id']
+        synergy = pair_cooccur.synergy(pid_c, team_ids)
+        partner_bonus = 0
+        partner_id = players_by_id.get(pid_c, {}).get('partner_id')
+        for pid in team_ids:
+            if partner_id and pid == partner_id and prefers_partner(pid_c, partner_id):
+                partner_bonus += PARTNER_WITH_SELECTED_BONUS
+        effective_synergy_weight = SYNERGY_WEIGHT_FOR_PARTNERS if partner_id and partner_id in team_ids else SYNERGY_WEIGHT
+        return c['match_count'] + (c['recent_penalty'] * RECENT_WEIGHT) + (c.get('spacing_penalty', 0) * SPACING_WEIGHT) + (effective_synergy_weight * synergy) - partner_bonus
+
+    assignments = {}
+    regenerated_count = 0
+    total_assignments = 0
+    rule_violations = []
+
+    for idx, match in enumerate(target_matches):
+        match_id = match['id']
+        match_date = _date_key(match.get('match_date'))
+        is_home = match.get('is_home', False)
+        home_team = match.get('home_team', 'Unknown')
+        away_team = match.get('away_team', 'Unknown')
+
+        log(f"\n   🎯 Processing Match {match_id}: {home_team} vs {away_team}")
+        log(f"      📅 Date: {match_date} | {'🏠 Home' if is_home else '✈️ Away'}")
+
+        existing_pinned = pinned_assignments.get(match_id, [])
+        needed_players = PLAYERS_PER_MATCH - len(existing_pinned)
+        log(f"      📌 Pinned: {len(existing_pinned)} | Need: {needed_players} more")
+
+        # Progressive fairness cap up to this point (prevents front-loading the same players)
+        # Allowed max for now = ceil(4 * matches_processed_so_far / num_players)
+        matches_so_far_inclusive = idx + 1
+        allowed_now_cap = (PLAYERS_PER_MATCH * matches_so_far_inclusive + num_players_active - 1) // num_players_active
+
+        # Ensure pinned players count toward spacing tracking for subsequent matches
+        for pid in existing_pinned:
+            last_play_idx[pid] = idx
+
+        if needed_players <= 0:
+            regenerated_count += 1
+            continue
+
+        # === RULE 1: Filter available players ===
+        candidates = []
+        for player in active_players:
+            player_id = player['id']
+            if player_id in existing_pinned:
+                continue
+
+            # RULE 2: Check availability
+            is_available = availability.get(player_id, {}).get(match_id, True)  # Default available
+
+            # RULE 3: Check for date conflicts (no double bookings)
+            date_conflict = False
+            if match_date is not None:
+                booked = date_bookings.get((player_id, match_date))
+                date_conflict = bool(booked) and any(mid != match_id for mid in booked)
+
+            if is_available and not date_conflict:
+                recent_penalty = len(recent_matches_by_player[player_id])  # 0-3 penalty based on recent matches
+                lp = last_play_idx.get(player_id)
+                if lp is None:
+                    spacing_penalty = 0
+                else:
+                    gap = idx - lp
+                    # penalize if played very recently (gap 1->2, 2->1)
+                    spacing_penalty = 2 if gap <= 1 else (1 if gap == 2 else 0)
+                candidates.append({
+                    'player': player,
+                    'match_count': player_match_counts[player_id],
+                    'home_count': player_home_counts[player_id],
+                    'away_count': player_away_counts[player_id],
+                    'recent_penalty': recent_penalty,
+                    'spacing_penalty': spacing_penalty,
+                    'available': True
+                })
+            else:
+                log(f"         ❌ {player['name']}: {'unavailable' if not is_available else 'date conflict'}")
+
+        log(f"      ✅ Available candidates: {len(candidates)}")
+
+        # === PARTNER PRIORITY SELECTION ===
+        selected_candidates = []
+        selected_ids = set()
+        remaining_needed = needed_players
+        candidates_by_id = {c['player']['id']: c for c in candidates}
+
+        # 6a. Add partners of pinned players first (if both prefer together and partner is available)
+        for pinned_id in existing_pinned:
+            if remaining_needed <= 0:
+                break
+            pinned_player = players_by_id.get(pinned_id)
+            if not pinned_player:
+                continue
+            partner_id = pinned_player.get('partner_id')
+            if not partner_id or partner_id in existing_pinned:
+                continue
+            partner = players_by_id.get(partner_id)
+            if partner and prefers_partner(pinned_id, partner_id):
+                cand = candidates_by_id.get(partner_id)
+                # FAIRNESS FIRST: don't exceed cap (both global cap and progressive cap) and avoid back-to-back if possible
+                lp_partner = last_play_idx.get(partner_id)
+                gap_ok = (lp_partner is None) or ((idx - lp_partner) >= 2)
+                within_cap = fairness_counts.get(partner_id, 0) < max_per_player_target
+                within_progress = fairness_counts.get(partner_id, 0) < allowed_now_cap
+                if cand and partner_id not in selected_ids and within_cap and (within_progress or remaining_needed >= needed_players) and gap_ok:
+                    selected_candidates.append(cand)
+                    selected_ids.add(partner_id)
+                    remaining_needed -= 1
+                    fairness_counts[partner_id] = fairness_counts.get(partner_id, 0) + 1
+                    log(f"         🤝 Added partner of pinned: {partner.get('name')} (for {pinned_player.get('name')})")
+
+        # 6b. Form partner pairs among remaining candidates (both prefer together)
+        if remaining_needed > 0:
+            pairs = []  # each item: (combined_score, (cand_a, cand_b))
+            seen_pairs = set()
+            for cid, cand in candidates_by_id.items():
+                if cid in selected_ids:
+                    continue
+                partner_id = cand['player'].get('partner_id')
+                if not partner_id or partner_id in existing_pinned:
+                    continue
+                partner_cand = candidates_by_id.get(partner_id)
+                if not partner_cand or partner_id not in players_by_id:
+                    continue
+                if not prefers_partner(cid, partner_id):
+                    continue
+                # FAIRNESS FIRST: skip pairs that would break caps
+                if not (fairness_counts.get(cid, 0) < max_per_player_target and fairness_counts.get(partner_id, 0) < max_per_player_target):
+                    continue
+                # Progressive cap and spacing: avoid pairing if any of them just played last match
+                lp_a = last_play_idx.get(cid)
+                lp_b = last_play_idx.get(partner_id)
+                if (lp_a is not None and (idx - lp_a) <= 1) or (lp_b is not None and (idx - lp_b) <= 1):
+                    continue
+                if not (fairness_counts.get(cid, 0) < allowed_now_cap and fairness_counts.get(partner_id, 0) < allowed_now_cap):
+                    continue
+                pair_key = (cid, partner_id) if cid < partner_id else (partner_id, cid)
+                if pair_key in seen_pairs:
+                    continue
+                seen_pairs.add(pair_key)
+                combined_score = (
+                    cand['match_count'] + partner_cand['match_count'] +
+                    RECENT_WEIGHT * (cand['recent_penalty'] + partner_cand['recent_penalty']) +
+                    SPACING_WEIGHT * (cand.get('spacing_penalty', 0) + partner_cand.get('spacing_penalty', 0))
+                )
+                # Synergy penalty: how often A-B have been together + with currently pinned players
+                synergy = pair_cooccur.pair(cid, partner_id)
+                synergy += pair_cooccur.synergy(cid, existing_pinned) + pair_cooccur.synergy(partner_id, existing_pinned)
+                # Both sides are true partners here: lighter synergy penalty and apply bonus
+                combined_score += SYNERGY_WEIGHT_FOR_PARTNERS * synergy
+                combined_score -= PARTNER_PAIR_BONUS
+                pairs.append((combined_score, (cand, partner_cand)))
+
+            pairs.sort(key=lambda x: x[0])
+            for _, (cand_a, cand_b) in pairs:
+                if remaining_needed < 2:
+                    break
+                a_id = cand_a['player']['id']
+                b_id = cand_b['player']['id']
+                if a_id in selected_ids or b_id in selected_ids:
+                    continue
+                selected_candidates.extend([cand_a, cand_b])
+                selected_ids.update([a_id, b_id])
+                remaining_needed -= 2
+                fairness_counts[a_id] = fairness_counts.get(a_id, 0) + 1
+                fairness_counts[b_id] = fairness_counts.get(b_id, 0) + 1
+                log(f"         👥 Added partner pair: {cand_a['player']['name']} + {cand_b['player']['name']}")
+
+        # === RULE 4: Sort by fairness with VARIATIE! for remaining slots ===
+        remaining_candidates_all = [c for c in candidates if c['player']['id'] not in selected_ids]
+        # Apply fairness caps: strong preference to progressive cap, then global cap
+        under_progressive = [c for c in remaining_candidates_all if fairness_counts.get(c['player']['id'], 0) < allowed_now_cap]
+        under_global = [c for c in remaining_candidates_all if fairness_counts.get(c['player']['id'], 0) < max_per_player_target]
+        remaining_candidates = under_progressive if len(under_progressive) >= remaining_needed else (under_global if len(under_global) >= remaining_needed else remaining_candidates_all)
+
+        if len(remaining_candidates) > remaining_needed and remaining_needed > 0:
+            # Group candidates by combined score (match_count + recent_penalty + spacing + synergy)
+            team_ids = list(selected_ids) + list(existing_pinned)
+            candidates_by_score = {}
+            for c in remaining_candidates:
+                score_key = round(compute_score(c, team_ids), 1)
+                candidates_by_score.setdefault(score_key, []).append(c)
+
+            # Select with variatie: prioritize lower scores, add randomness
+            sorted_scores = sorted(candidates_by_score.keys())
+            log(f"         📊 Candidate distribution by score: {[(s, len(candidates_by_score[s])) for s in sorted_scores]}")
+
+            for score in sorted_scores:
+                group = candidates_by_score[score]
+                if remaining_needed <= 0:
+                    break
+
+                # Add variatie: shuffle within same score group
+                rng.shuffle(group)
+
+                if score == sorted_scores[0]:  # Best (lowest) score
+                    take = min(remaining_needed, len(group))
+                else:
+                    # Gradual reduction for higher scores (take 70% from higher score groups)
+                    max_take = max(1, int(remaining_needed * 0.7)) if remaining_needed > 1 else remaining_needed
+                    take = min(max_take, len(group), remaining_needed)
+
+                # Secondary sort: balance home/away, then random for variatie
+                group.sort(key=lambda c: (
+                    abs(c['home_count'] - c['away_count']) if is_home else -abs(c['home_count'] - c['away_count']),
+                    rng.random()
+                ))
+
+                selected_candidates.extend(group[:take])
+                selected_ids.update([x['player']['id'] for x in group[:take]])
+                for x in group[:take]:
+                    fairness_counts[x['player']['id']] = fairness_counts.get(x['player']['id'], 0) + 1
+                remaining_needed -= take
+                log(f"         🎲 From {len(group)} players with score {score}: selected {take}")
+        elif remaining_needed > 0:
+            # Not enough candidates or exact fit - take what's left up to remaining_needed
+            team_ids = list(selected_ids) + list(existing_pinned)
+            remaining_candidates.sort(key=lambda c: compute_score(c, team_ids))
+            take_from_under = min(remaining_needed, len(remaining_candidates))
+            chosen = remaining_candidates[:take_from_under]
+            selected_candidates.extend(chosen)
+            selected_ids.update([x['player']['id'] for x in chosen])
+            for x in chosen:
+                fairness_counts[x['player']['id']] = fairness_counts.get(x['player']['id'], 0) + 1
+            remaining_needed -= take_from_under
+            if remaining_needed > 0:
+                # Allow picking from all remaining ignoring cap, choose by lowest match_count
+                overflow_pool = [c for c in remaining_candidates_all if c['player']['id'] not in selected_ids]
+                team_ids = list(selected_ids) + list(existing_pinned)
+                overflow_pool.sort(key=lambda c: compute_score(c, team_ids))
+                take_overflow = min(remaining_needed, len(overflow_pool))
+                selected_candidates.extend(overflow_pool[:take_overflow])
+                selected_ids.update([x['player']['id'] for x in overflow_pool[:take_overflow]])
+                for x in overflow_pool[:take_overflow]:
+                    fairness_counts[x['player']['id']] = fairness_counts.get(x['player']['id'], 0) + 1
+                remaining_needed -= take_overflow
+
+        # FINAL BACKFILL: ensure we reach 4 if enough available candidates exist
+        missing = max(0, PLAYERS_PER_MATCH - (len(existing_pinned) + len(selected_candidates)))
+        if missing > 0:
+            leftovers = [c for c in candidates if c['player']['id'] not in selected_ids]
+            if len(leftovers) >= missing:
+                team_ids = list(selected_ids) + list(existing_pinned)
+                leftovers.sort(key=lambda c: compute_score(c, team_ids))
+                add = leftovers[:missing]
+                selected_candidates.extend(add)
+                selected_ids.update([x['player']['id'] for x in add])
+                for x in add:
+                    fairness_counts[x['player']['id']] = fairness_counts.get(x['player']['id'], 0) + 1
+
+        # Quartet diversity memory: avoid repeating exact same quartet as in last few matches
+        team_ids_preview = list(existing_pinned) + [c['player']['id'] for c in selected_candidates]
+        if len(team_ids_preview) == PLAYERS_PER_MATCH and frozenset(team_ids_preview) in recent_quartets:
+            log(f"         🔁 Quartet matches one of the last {QUARTET_MEMORY_SIZE} lineups; trying to diversify...")
+            leftovers = [c for c in candidates if c['player']['id'] not in selected_ids]
+            team_ids = list(selected_ids) + list(existing_pinned)
+
+            def _diversity_score(c):
+                pid_c = c['player']['id']
+                synergy = pair_cooccur.synergy(pid_c, team_ids)
+                return c['match_count'] + (c['recent_penalty'] * RECENT_WEIGHT) + (c.get('spacing_penalty', 0) * SPACING_WEIGHT) + (SYNERGY_WEIGHT * synergy)
+
+            leftovers.sort(key=_diversity_score)
+            swapped = False
+            for alt in leftovers:
+                alt_id = alt['player']['id']
+                # Respect caps when possible
+                if not (fairness_counts.get(alt_id, 0) < max_per_player_target and fairness_counts.get(alt_id, 0) < allowed_now_cap):
+                    continue
+                # Try swapping out one of the currently selected players
+                for i, rem in enumerate(selected_candidates):
+                    rem_id = rem['player']['id']
+                    new_selected_ids = (selected_ids - {rem_id}) | {alt_id}
+                    new_team_set = frozenset(list(existing_pinned) + list(new_selected_ids))
+                    if new_team_set not in recent_quartets:
+                        selected_candidates[i] = alt
+                        selected_ids.remove(rem_id)
+                        selected_ids.add(alt_id)
+                        fairness_counts[rem_id] = max(0, fairness_counts.get(rem_id, 0) - 1)
+                        fairness_counts[alt_id] = fairness_counts.get(alt_id, 0) + 1
+                        log(f"         🔄 Diversity swap: replaced {rem['player']['name']} with {alt['player']['name']}")
+                        swapped = True
+                        break
+                if swapped:
+                    break
+            if not swapped:
+                log("         ℹ️ Kept lineup (no safe swap found within caps)")
+
+        log(f"      ⭐ Selected {len(selected_candidates)} players:")
+
+        chosen_ids = []
+        for candidate in selected_candidates:
+            player = candidate['player']
+            player_id = player['id']
+            chosen_ids.append(player_id)
+
+            player_match_counts[player_id] += 1
+            if is_home:
+                player_home_counts[player_id] += 1
+            else:
+                player_away_counts[player_id] += 1
+
+            # Update recent matches tracking (keep last 3 matches)
+            recent_matches_by_player[player_id].append(match_id)
+            if len(recent_matches_by_player[player_id]) > 3:
+                recent_matches_by_player[player_id].pop(0)
+
+            last_play_idx[player_id] = idx
+            if match_date is not None:
+                date_bookings.setdefault((player_id, match_date), set()).add(match_id)
+
+            total_assignments += 1
+            log(f"         ✅ {player['name']} (total: {player_match_counts[player_id]}, recent: {len(recent_matches_by_player[player_id])})")
+        assignments[match_id] = chosen_ids
+
+        # Update pair co-occurrence counts for full team (pinned + selected)
+        team_ids = list(existing_pinned) + chosen_ids
+        pair_cooccur.add_team(team_ids)
+
+        if len(team_ids) == PLAYERS_PER_MATCH:
+            recent_quartets.append(frozenset(team_ids))
+
+        total_players = len(team_ids)
+        if total_players != PLAYERS_PER_MATCH:
+            rule_violations.append({
+                'match_id': match_id,
+                'match_name': f"{home_team} vs {away_team}",
+                'player_count': total_players,
+                'issue': f"{'Insufficient players' if total_players < PLAYERS_PER_MATCH else 'Too many players'}"
+            })
+            log(f"      ⚠️ RULE VIOLATION: {total_players} players (should be 4)")
+
+        regenerated_count += 1
+
+    return {
+        'assignments': assignments,
+        'rule_violations': rule_violations,
+        'regenerated_count': regenerated_count,
+        'total_assignments': total_assignments,
+        'match_counts': player_match_counts,
+        'home_counts': player_home_counts,
+        'away_counts': player_away_counts,
+    }
+
+
+def build_lineups(target_matches, pinned_assignments, assignments, fixed_lineups=None):
+    """Combine pinned players, new selections and untouched matches into full lineups.
+
+    Returns:
+        {match_id: [player_ids]}
+    """
+    lineups = {mid: list(pids) for mid, pids in (fixed_lineups or {}).items()}
+    for m in target_matches:
+        mid = m['id']
+        lineups[mid] = list(pinned_assignments.get(mid, [])) + list(assignments.get(mid, []))
+    return lineups
+
+
+def evaluate_plan(season_matches, lineups, players, scorer=None):
+    """
+    Score a season plan with the explicit season objective (lower is better).
+
+    Args:
+        season_matches: match dicts in season order (is_home used for balance)
+        lineups: {match_id: [player_ids]}
+        players: active player dicts (partner_id, prefer_partner_together)
+        scorer: optional scoring.SeasonScorer for these matches and players (reused across runs)
+
+    Returns:
+        dict with the raw components and the weighted 'total'.
+    """
+    scorer = scorer or scoring.SeasonScorer(season_matches, players)
+    A = scorer.matrix(lineups)
+    sizes = [len(lineups.get(mid, [])) for mid in scorer.match_ids]
+    return scorer.evaluate(A, lineup_sizes=sizes, weights=OBJECTIVE_WEIGHTS)
+
+def summarize_assignments(assignments, plan_kwargs):
+    """Recompute the plan_season statistics for a changed set of assignments."""
+    players = plan_kwargs['active_players']
+    pinned = plan_kwargs['pinned_assignments']
+    unplayed = plan_kwargs.get('unplayed_matches') or plan_kwargs['target_matches']
+    unplayed_by_id = {m['id']: m for m in unplayed}
+    match_counts = {p['id']: 0 for p in players}
+    home_counts = {p['id']: 0 for p in players}
+    away_counts = {p['id']: 0 for p in players}
+
+    def count(match_id, player_ids):
+        match_info = unplayed_by_id.get(match_id)
+        if not match_info:
+            return
+        for pid in player_ids:
+            if pid in match_counts:
+                match_counts[pid] += 1
+                if match_info.get('is_home', False):
+                    home_counts[pid] += 1
+                else:
+                    away_counts[pid] += 1
+
+    for match_id, player_ids in pinned.items():
+        count(match_id, player_ids)
+    for match_id, player_ids in assignments.items():
+        count(match_id, player_ids)
+
+    rule_violations = []
+    for m in plan_kwargs['target_matches']:
+        total_players = len(pinned.get(m['id'], [])) + len(assignments.get(m['id'], []))
+        if total_players != PLAYERS_PER_MATCH:
+            rule_violations.append({
+                'match_id': m['id'],
+                'match_name': f"{m.get('home_team', 'Unknown')} vs {m.get('away_team', 'Unknown')}",
+                'player_count': total_players,
+                'issue': f"{'Insufficient players' if total_players < PLAYERS_PER_MATCH else 'Too many players'}"
+            })
+
+    return {
+        'regenerated_count': len(plan_kwargs['target_matches']),
+        'match_counts': match_counts,
+        'home_counts': home_counts,
+        'away_counts': away_counts,
+        'total_assignments': sum(len(v) for v in assignments.values()),
+        'rule_violations': rule_violations,
+    }
+
+
+def new_seed():
+    """Draw a fresh seed for a planning run (recorded so the run can be reproduced)."""
+    return random.SystemRandom().randrange(2 ** 32)
+
+
+def derive_seeds(seed, count):
+    """
+    Derive the per-run seeds for a multi-start from one base seed.
+
+    The first run uses the base seed itself, so a single run with the same
+    seed reproduces it.
+    """
+    rng = random.Random(seed)
+    return [seed] + [rng.randrange(2 ** 32) for _ in range(count - 1)]
+
+
+def run_seeded(seed, plan_kwargs, season_matches, fixed_lineups=None, allocation='greedy'):
+    """
+    Run the planner once with its own random.Random(seed) and score the result.
+
+    allocation: 'greedy' (plan_season) or 'flow' (min-cost-flow allocation with
+    lineup refinement, see app.services.allocation)
+    """
+    if allocation == 'flow':
+        from app.services.allocation import plan_season_flow
+        result = plan_season_flow(plan_kwargs, season_matches, fixed_lineups, rng=random.Random(seed))
+        result['seed'] = seed
+        return result
+    kwargs = dict(plan_kwargs)
+    # plan_season updates the bookings in place; every run starts from the same state
+    kwargs['date_bookings'] = copy.deepcopy(kwargs.get('date_bookings'))
+    result = plan_season(rng=random.Random(seed), **kwargs)
+    lineups = build_lineups(kwargs['target_matches'], kwargs['pinned_assignments'], result['assignments'], fixed_lineups)
+    result['objective'] = evaluate_plan(season_matches, lineups, kwargs['active_players'])
+    result['seed'] = seed
+    return result
+
+
+def _run_seeded_child(conn, seed, plan_kwargs, season_matches, fixed_lineups, allocation):
+    """Child process: one seeded run, its result sent back over conn."""
+    try:
+        conn.send(run_seeded(seed, plan_kwargs, season_matches, fixed_lineups, allocation))
+    finally:
+        conn.close()
+
+
+def _run_in_processes(seeds, args, workers, deadline):
+    """
+    Run the seeded plans in at most `workers` child processes at a time.
+
+    The children come from a forkserver: the app process runs pool, listener
+    and job threads whose locks a plain fork could copy in a held state.
+    Once the deadline has passed and a run has finished, the children still
+    busy are terminated, so the budget also caps CPU use. A child that dies
+    (e.g. killed for memory) only loses its own run.
+
+    Returns:
+        The results of the finished runs.
+    """
+    ctx = multiprocessing.get_context('forkserver')
+    ctx.set_forkserver_preload([__name__])
+    todo = list(seeds)
+    running = {}
+    results = []
+    try:
+        while todo or running:
+            while todo and len(running) < workers:
+                reader, writer = ctx.Pipe(duplex=False)
+                process = ctx.Process(target=_run_seeded_child, args=(writer, todo.pop(0)) + args, daemon=True)
+                process.start()
+                writer.close()
+                running[reader] = process
+            if deadline is not None and results and time.monotonic() >= deadline:
+                break
+            # Without a finished run, wait for the first one even past the budget
+            timeout = max(0.0, deadline - time.monotonic()) if deadline is not None and results else None
+            for reader in multiprocessing.connection.wait(list(running), timeout=timeout):
+                process = running.pop(reader)
+                try:
+                    results.append(reader.recv())
+                except EOFError:
+                    process.join()
+                    print(f"   ⚠️ Planning run process died (exit code {process.exitcode})")
+                reader.close()
+                process.join()
+    finally:
+        for process in running.values():
+            process.terminate()
+        for reader, process in running.items():
+            process.join()
+            reader.close()
+    return results
+
+
+def plan_season_multistart(plan_kwargs, season_matches, fixed_lineups=None, restarts=4,
+                           time_budget=None, seed=None, max_workers=None, allocation='greedy'):
+    """
+    Run several independently seeded plans in child processes and keep the best.
+
+    Args:
+        plan_kwargs: keyword arguments for plan_season (without rng)
+        season_matches: match dicts in season order used for scoring
+        fixed_lineups: {match_id: [player_ids]} of matches outside the scope
+        restarts: number of seeded runs (K)
+        time_budget: wall-clock budget in seconds; runs still busy afterwards are
+            dropped (the best finished run wins, at least one run is awaited)
+        seed: base seed for the runs (see derive_seeds); a fresh seed when None
+        max_workers: runs in parallel (defaults to the CPU count)
+        allocation: 'greedy' | 'flow', see run_seeded
+
+    Returns:
+        The best plan_season result, extended with 'objective', 'seed',
+        'restarts_completed' and 'restarts_requested'.
+    """
+    restarts = max(1, int(restarts))
+    seeds = derive_seeds(new_seed() if seed is None else seed, restarts)
+    deadline = time.monotonic() + time_budget if time_budget else None
+    results = []
+
+    workers = max(1, min(len(seeds), max_workers or os.cpu_count() or 1))
+    if workers > 1:
+        try:
+            results = _run_in_processes(seeds, (plan_kwargs, season_matches, fixed_lineups, allocation),
+                                        workers, deadline)
+        except (OSError, NotImplementedError, ValueError) as e:
+            # No child processes available (e.g. restricted container): run in-process
+            print(f"   ⚠️ Child processes unavailable ({e}); running restarts sequentially")
+
+    if not results:
+        for seed in seeds:
+            results.append(run_seeded(seed, plan_kwargs, season_matches, fixed_lineups, allocation))
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+    best = min(results, key=lambda r: (r['objective']['total'], r['seed']))
+    best['restarts_completed'] = len(results)
+    best['restarts_requested'] = len(seeds)
+    return best
@@ -0,0 +1,94 @@
+"""
+Player statistics for many players at once.
+
+The dashboard, the player list and the player page used to run one to three
+queries per player (SinglePlanning.get_player_stats, Player.get_match_stats,
+Player.get_active_planning_stats, Player.get_availability_stats). get_stats()
+computes the same numbers for all requested players with one grouped query
+over match_planning, plus the shared availability matrix.
+"""
+from app.models.database import get_db_connection
+from app.services import availability
+
+
+def _empty(player_id, matrix):
+    available, unavailable = matrix.counts(player_id)
+    total = available + unavailable
+    return {
+        # Single planning (planning_version_id = 1), as SinglePlanning.get_player_stats
+        'planning': {
+            'matches_planned': 0,
+            'home_matches': 0,
+            'away_matches': 0,
+            'matches_played': 0,
+            'completed_matches': 0,
+        },
+        # Actually played in any planning, as Player.get_match_stats
+        'history': {
+            'played': 0,
+            'home_matches': 0,
+            'away_matches': 0,
+        },
+        # As Player.get_availability_stats
+        'availability': {
+            'total_matches': total,
+            'available': available,
+            'unavailable': unavailable,
+            'availability_rate': (available / total * 100) if total > 0 else 0,
+        },
+    }
+
+
+def get_stats(player_ids, cursor=None):
+    """
+    Statistics of the given players.
+
+    Returns:
+        {player_id: {'planning': {...}, 'history': {...}, 'availability': {...}}}
+        for every requested player (zeros when a player has no rows)
+    """
+    player_ids = list(player_ids)
+    own = cursor is None
+    if own:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+    try:
+        matrix = availability.get_matrix(cursor)
+        stats = {pid: _empty(pid, matrix) for pid in player_ids}
+        if not player_ids:
+            return stats
+        cursor.execute('''
+            SELECT
+                mp.player_id,
+                COUNT(*) FILTER (WHERE mp.planning_version_id = 1) AS matches_planned,
+                COUNT(*) FILTER (WHERE mp.planning_version_id = 1 AND m.is_home = true) AS home_matches,
+                COUNT(*) FILTER (WHERE mp.planning_version_id = 1 AND m.is_home = false) AS away_matches,
+                COUNT(*) FILTER (WHERE mp.planning_version_id = 1 AND mp.actually_played = true) AS matches_played,
+                COUNT(*) FILTER (WHERE mp.planning_version_id = 1 AND m.is_played = true) AS completed_matches,
+                COUNT(*) FILTER (WHERE mp.actually_played = true) AS played,
+                COUNT(*) FILTER (WHERE mp.actually_played = true AND m.is_home = true) AS played_home,
+                COUNT(*) FILTER (WHERE mp.actually_played = true AND m.is_home = false) AS played_away
+            FROM match_planning mp
+            JOIN matches m ON mp.match_id = m.id
+            WHERE mp.player_id = ANY(%s)
+            GROUP BY mp.player_id
+        ''', (player_ids,))
+        for row in cursor.fetchall():
+            entry = stats[row['player_id']]
+            entry['planning'] = {
+                'matches_planned': row['matches_planned'],
+                'home_matches': row['home_matches'],
+                'away_matches': row['away_matches'],
+                'matches_played': row['matches_played'],
+                'completed_matches': row['completed_matches'],
+            }
+            entry['history'] = {
+                'played': row['played'],
+                'home_matches': row['played_home'],
+                'away_matches': row['played_away'],
+            }
+        return stats
+    finally:
+        if own:
+            cursor.close()
+            conn.close()
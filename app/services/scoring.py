@@ -0,0 +1,151 @@
+"""
+Vectorized season-plan scoring.
+
+A plan is a boolean players×matches matrix A (A[i, j] = player i plays match j,
+matches in season order). Everything the planner, the optimizers and the
+statistics pages need follows from a few array operations:
+
+- match counts per player:     A.sum(axis=1)
+- home/away split:             A[:, home].sum(axis=1)
+- back-to-back appearances:    (A[:, 1:] & A[:, :-1]).sum(axis=1)
+- pair co-occurrence:          A·Aᵀ (diagonal = match counts)
+"""
+import numpy as np
+
+PLAYERS_PER_MATCH = 4
+
+
+def build_matrix(player_ids, match_ids, lineups):
+    """
+    Build the boolean players×matches matrix.
+
+    Args:
+        player_ids: row order
+        match_ids: column order (season order)
+        lineups: {match_id: [player_ids]} or an iterable of (match_id, player_id);
+            unknown players and matches are ignored
+    """
+    row = {pid: i for i, pid in enumerate(player_ids)}
+    col = {mid: j for j, mid in enumerate(match_ids)}
+    A = np.zeros((len(row), len(col)), dtype=bool)
+    pairs = lineups.items() if isinstance(lineups, dict) else ((mid, [pid]) for mid, pid in lineups)
+    for mid, pids in pairs:
+        j = col.get(mid)
+        if j is None:
+            continue
+        rows = [row[pid] for pid in pids if pid in row]
+        A[rows, j] = True
+    return A
+
+
+def home_mask(matches):
+    """Bool vector over the matches: True for home matches."""
+    return np.array([bool(m.get('is_home', False)) for m in matches], dtype=bool)
+
+
+def match_counts(A):
+    """Matches per player."""
+    return A.sum(axis=1)
+
+
+def home_away_counts(A, home_mask):
+    """(home, away) matches per player; home_mask is a bool vector over the matches."""
+    home = A[:, home_mask].sum(axis=1)
+    return home, A.sum(axis=1) - home
+
+
+def back_to_back(A):
+    """Appearances in two consecutive matches, per player."""
+    if A.shape[1] < 2:
+        return np.zeros(A.shape[0], dtype=np.int64)
+    return (A[:, 1:] & A[:, :-1]).sum(axis=1)
+
+
+def cooccurrence(A):
+    """Pair co-occurrence matrix A·Aᵀ (players×players, diagonal = match counts)."""
+    Ai = A.astype(np.int32)
+    return Ai @ Ai.T
+
+
+class SeasonScorer:
+    """
+    Precomputed masks for one season, so a full-plan evaluation is a handful
+    of array operations.
+
+    Args:
+        season_matches: match dicts in season order (id, is_home)
+        players: active player dicts (id, partner_id, prefer_partner_together)
+    """
+
+    def __init__(self, season_matches, players):
+        self.player_ids = [p['id'] for p in players]
+        self.match_ids = [m['id'] for m in season_matches]
+        self.home_mask = home_mask(season_matches)
+        row = {pid: i for i, pid in enumerate(self.player_ids)}
+        by_id = {p['id']: p for p in players}
+        n = len(self.player_ids)
+        self.partner_mask = np.zeros((n, n), dtype=bool)
+        self.prefer_mask = np.zeros((n, n), dtype=bool)
+        for p in players:
+            q = p.get('partner_id')
+            if q in row:
+                i, j = row[p['id']], row[q]
+                self.partner_mask[i, j] = self.partner_mask[j, i] = True
+                if p.get('prefer_partner_together', True) and by_id[q].get('prefer_partner_together', True):
+                    self.prefer_mask[i, j] = self.prefer_mask[j, i] = True
+        # Non-partner pairs, each counted once
+        self.pair_mask = np.triu(~self.partner_mask, k=1)
+
+    def matrix(self, lineups):
+        return build_matrix(self.player_ids, self.match_ids, lineups)
+
+    def evaluate(self, A, lineup_sizes=None, weights=None):
+        """
+        Season objective components (lower total is better).
+
+        Args:
+            A: players×matches bool matrix
+            lineup_sizes: players per match incl. players outside A (defaults to A's column sums)
+            weights: {component: weight}; the total is left out when None
+        """
+        counts = A.sum(axis=1)
+        home = A[:, self.home_mask].sum(axis=1)
+        sizes = A.sum(axis=0) if lineup_sizes is None else np.asarray(lineup_sizes)
+        C = cooccurrence(A)
+        components = {
+            'shortfall': int(np.abs(PLAYERS_PER_MATCH - sizes).sum()),
+            'fairness_spread': int(counts.max() - counts.min()) if counts.size else 0,
+            'fairness_variance': round(float(((counts - counts.mean()) ** 2).sum()), 4) if counts.size else 0.0,
+            'home_away': int(np.abs(2 * home - counts).sum()),
+            'pair_cooccurrence': int((C[self.pair_mask] ** 2).sum()),
+            'spacing': int(back_to_back(A).sum()),
+            'partner_hits': int(C[self.prefer_mask].sum() // 2),
+        }
+        if weights is not None:
+            components['total'] = round(sum(weights[k] * components[k] for k in weights), 4)
+        return components
+
+
+class PairCounter:
+    """Incremental pair co-occurrence matrix for the greedy planner."""
+
+    def __init__(self, player_ids):
+        self.index = {pid: i for i, pid in enumerate(player_ids)}
+        self.counts = np.zeros((len(self.index), len(self.index)), dtype=np.int32)
+
+    def add_team(self, team_ids):
+        idx = [self.index[pid] for pid in team_ids if pid in self.index]
+        self.counts[np.ix_(idx, idx)] += 1
+
+    def pair(self, a, b):
+        if a == b or a not in self.index or b not in self.index:
+            return 0
+        return int(self.counts[self.index[a], self.index[b]])
+
+    def synergy(self, pid, team_ids):
+        """Times pid has played with each of team_ids so far (summed)."""
+        i = self.index.get(pid)
+        if i is None:
+            return 0
+        idx = [self.index[t] for t in team_ids if t != pid and t in self.index]
+        return int(self.counts[i, idx].sum()) if idx else 0
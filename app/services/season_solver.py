@@ -0,0 +1,280 @@
+"""
+Exact season planning with a mixed-integer model (PuLP + the bundled CBC solver).
+
+The assignment rules are modelled directly:
+- exactly 4 players per match (shortfall only when not enough players can play)
+- only available players, pinned players stay
+- no player twice on the same date
+- fairness cap per player within the scope
+- partner preferences, home/away balance, spacing and pair spread in the objective
+
+CBC runs with a time limit. Without an integer solution, or when the solver is
+not installed, the greedy result is used instead; a solution (proven optimal
+for the model or not) is only kept when it scores better than the greedy plan
+under planner.evaluate_plan.
+"""
+import os
+import re
+import time
+import tempfile
+
+from app.services import planner
+
+try:
+    import pulp
+except ImportError:  # optional: 'solver' mode falls back to the greedy planner
+    pulp = None
+
+# Objective weights of the model (aligned with planner.OBJECTIVE_WEIGHTS)
+SHORTFALL_WEIGHT = 100.0
+SPREAD_WEIGHT = 5.0
+OVER_CAP_WEIGHT = 10.0
+HOME_AWAY_WEIGHT = 0.5
+SPACING_WEIGHT = 1.0
+PARTNER_WEIGHT = 1.0
+PAIR_MAX_WEIGHT = 2.0
+
+
+def is_available():
+    """True when PuLP and its CBC solver can be used."""
+    return pulp is not None and pulp.PULP_CBC_CMD().available()
+
+
+def _parse_cbc_log(path):
+    """Read the objective and best bound from a CBC log (PuLP does not expose the bound)."""
+    objective = bound = None
+    try:
+        with open(path) as f:
+            text = f.read()
+    except OSError:
+        return objective, bound
+    match = re.search(r'Objective value:\s+(-?[\d.eE+-]+)', text)
+    if match:
+        objective = float(match.group(1))
+    match = re.search(r'Lower bound:\s+(-?[\d.eE+-]+)', text)
+    if match:
+        bound = float(match.group(1))
+    return objective, bound
+
+
+def solve_season(plan_kwargs, season_matches, fixed_lineups=None, time_limit=10.0, gap_rel=None):
+    """
+    Solve the plan for plan_kwargs['target_matches'] as a MILP.
+
+    Args:
+        plan_kwargs: the plan_season keyword arguments (target_matches, active_players,
+            availability, pinned_assignments, date_bookings, unplayed_matches)
+        season_matches: match dicts in season order (spacing, fairness over the season)
+        fixed_lineups: {match_id: [player_ids]} of matches outside the scope
+        time_limit: solver time limit in seconds
+        gap_rel: optional relative gap at which the solver may stop
+
+    Returns:
+        (assignments, info) where assignments is {match_id: [player_ids]} of new
+        selections, or None without a usable solution, and info holds 'status',
+        'optimal', 'objective', 'bound', 'gap' and 'solve_time'.
+    """
+    if pulp is None:
+        return None, {'status': 'unavailable', 'optimal': False, 'objective': None,
+                      'bound': None, 'gap': None, 'solve_time': 0.0}
+
+    targets = plan_kwargs['target_matches']
+    players = plan_kwargs['active_players']
+    availability = plan_kwargs['availability']
+    pinned = plan_kwargs['pinned_assignments']
+    bookings = plan_kwargs.get('date_bookings') or {}
+    fixed_lineups = fixed_lineups or {}
+    player_ids = [p['id'] for p in players]
+    players_by_id = {p['id']: p for p in players}
+    target_ids = {m['id'] for m in targets}
+
+    prob = pulp.LpProblem('season_plan', pulp.LpMinimize)
+    x = {}
+    short = {}
+    for m in targets:
+        mid = m['id']
+        date = planner._date_key(m.get('match_date'))
+        pins = set(pinned.get(mid, []))
+        for pid in player_ids:
+            if pid in pins or not availability.get(pid, {}).get(mid, True):
+                continue
+            if date is not None and any(other != mid for other in bookings.get((pid, date), ())):
+                continue
+            x[pid, mid] = pulp.LpVariable(f'x_{pid}_{mid}', cat='Binary')
+        needed = planner.PLAYERS_PER_MATCH - len(pins)
+        chosen = [x[pid, mid] for pid in player_ids if (pid, mid) in x]
+        if needed <= 0:
+            for var in chosen:
+                prob += var == 0
+            continue
+        short[mid] = pulp.LpVariable(f'short_{mid}', lowBound=0, upBound=needed)
+        prob += pulp.lpSum(chosen) + short[mid] == needed
+
+    # No double booking on a date (bookings outside the scope were excluded above)
+    by_date = {}
+    for m in targets:
+        date = planner._date_key(m.get('match_date'))
+        if date is not None:
+            by_date.setdefault(date, []).append(m['id'])
+    for date, mids in by_date.items():
+        if len(mids) < 2:
+            continue
+        for pid in player_ids:
+            vars_on_date = [x[pid, mid] for mid in mids if (pid, mid) in x]
+            if len(vars_on_date) > 1:
+                prob += pulp.lpSum(vars_on_date) <= 1
+
+    # Presence of a player in a season match: constant (0/1) or a decision variable
+    def presence(pid, mid):
+        if mid in target_ids:
+            if pid in pinned.get(mid, ()):
+                return 1
+            return x.get((pid, mid), 0)
+        return 1 if pid in fixed_lineups.get(mid, ()) else 0
+
+    season_ids = [m['id'] for m in season_matches]
+    home_ids = {m['id'] for m in season_matches if m.get('is_home', False)}
+
+    counts = {pid: pulp.lpSum(presence(pid, mid) for mid in season_ids) for pid in player_ids}
+    homes = {pid: pulp.lpSum(presence(pid, mid) for mid in season_ids if mid in home_ids) for pid in player_ids}
+    cmax = pulp.LpVariable('count_max')
+    cmin = pulp.LpVariable('count_min')
+    dev = {}
+    over = {}
+    cap = -(-len(targets) * planner.PLAYERS_PER_MATCH // max(1, len(player_ids)))
+    for pid in player_ids:
+        prob += cmax >= counts[pid]
+        prob += cmin <= counts[pid]
+        dev[pid] = pulp.LpVariable(f'ha_{pid}', lowBound=0)
+        prob += dev[pid] >= 2 * homes[pid] - counts[pid]
+        prob += dev[pid] >= counts[pid] - 2 * homes[pid]
+        over[pid] = pulp.LpVariable(f'over_{pid}', lowBound=0)
+        prob += pulp.lpSum(presence(pid, m['id']) for m in targets) <= cap + over[pid]
+
+    # Back-to-back appearances
+    spacing = []
+    for a, b in zip(season_ids, season_ids[1:]):
+        if a not in target_ids and b not in target_ids:
+            continue
+        for pid in player_ids:
+            pa, pb = presence(pid, a), presence(pid, b)
+            if isinstance(pa, int) and isinstance(pb, int):
+                continue
+            if (isinstance(pa, int) and pa == 0) or (isinstance(pb, int) and pb == 0):
+                continue
+            s = pulp.LpVariable(f's_{pid}_{a}_{b}', lowBound=0)
+            prob += s >= pa + pb - 1
+            spacing.append(s)
+
+    # Partner hits (reward) and the most frequent non-partner pair (penalty)
+    partner_hits = []
+    pair_max = pulp.LpVariable('pair_max', lowBound=0)
+    for i, p in enumerate(player_ids):
+        for q in player_ids[i + 1:]:
+            is_partner = players_by_id[p].get('partner_id') == q or players_by_id[q].get('partner_id') == p
+            prefers = players_by_id[p].get('prefer_partner_together', True) and \
+                players_by_id[q].get('prefer_partner_together', True)
+            if is_partner and not prefers:
+                continue
+            together = []
+            for mid in season_ids:
+                pp, pq = presence(p, mid), presence(q, mid)
+                if isinstance(pp, int) and isinstance(pq, int):
+                    together.append(pp * pq)
+                    continue
+                if (isinstance(pp, int) and pp == 0) or (isinstance(pq, int) and pq == 0):
+                    continue
+                z = pulp.LpVariable(f'z_{p}_{q}_{mid}', lowBound=0, upBound=1)
+                if is_partner:
+                    prob += z <= pp
+                    prob += z <= pq
+                else:
+                    prob += z >= pp + pq - 1
+                together.append(z)
+            if is_partner:
+                partner_hits.extend(together)
+            else:
+                prob += pair_max >= pulp.lpSum(together)
+
+    prob += (
+        SHORTFALL_WEIGHT * pulp.lpSum(short.values())
+        + SPREAD_WEIGHT * (cmax - cmin)
+        + OVER_CAP_WEIGHT * pulp.lpSum(over.values())
+        + HOME_AWAY_WEIGHT * pulp.lpSum(dev.values())
+        + SPACING_WEIGHT * pulp.lpSum(spacing)
+        - PARTNER_WEIGHT * pulp.lpSum(partner_hits)
+        + PAIR_MAX_WEIGHT * pair_max
+    )
+
+    fd, log_path = tempfile.mkstemp(prefix='svdo-cbc-', suffix='.log')
+    os.close(fd)
+    solver = pulp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, gapRel=gap_rel, logPath=log_path)
+    start = time.monotonic()
+    try:
+        prob.solve(solver)
+    finally:
+        solve_time = round(time.monotonic() - start, 3)
+        log_objective, bound = _parse_cbc_log(log_path)
+        os.remove(log_path)
+
+    # LpStatus says 'Optimal' for any solution CBC returns on a time limit;
+    # the solution status tells a proven optimum from an incumbent
+    status = pulp.LpSolution.get(prob.sol_status, pulp.LpStatus[prob.status])
+    has_solution = prob.sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible)
+    objective = pulp.value(prob.objective) if has_solution else None
+    optimal = prob.sol_status == pulp.LpSolutionOptimal
+    if optimal:
+        gap = 0.0
+    elif objective is not None and bound is not None:
+        gap = round(abs(objective - bound) / max(1e-9, abs(objective)), 6)
+    else:
+        gap = None
+    info = {
+        'status': status,
+        'optimal': optimal,
+        'objective': round(objective, 4) if objective is not None else None,
+        'bound': round(bound, 4) if bound is not None else (round(objective, 4) if optimal else None),
+        'gap': gap,
+        'solve_time': solve_time,
+        'variables': len(prob.variables()),
+        'constraints': len(prob.constraints),
+    }
+    if not has_solution:
+        return None, info
+
+    assignments = {
+        m['id']: [pid for pid in player_ids if (pid, m['id']) in x and (x[pid, m['id']].value() or 0) > 0.5]
+        for m in targets
+    }
+    return assignments, info
+
+
+def plan_season_exact(plan_kwargs, season_matches, greedy_result, fixed_lineups=None,
+                      time_limit=10.0, gap_rel=None):
+    """
+    Solve the season exactly; fall back to the greedy result when that is better.
+
+    Returns:
+        A plan_season-style result with 'objective' and a 'solver' report
+        (status, optimal, gap, bound, solve_time, used: 'solver' | 'greedy').
+    """
+    assignments, info = solve_season(plan_kwargs, season_matches, fixed_lineups, time_limit, gap_rel)
+    greedy_objective = greedy_result.get('objective')
+    if greedy_objective is None:
+        lineups = planner.build_lineups(plan_kwargs['target_matches'], plan_kwargs['pinned_assignments'],
+                                        greedy_result['assignments'], fixed_lineups)
+        greedy_objective = planner.evaluate_plan(season_matches, lineups, plan_kwargs['active_players'])
+
+    result = dict(greedy_result, objective=greedy_objective)
+    info['used'] = 'greedy'
+    if assignments is not None:
+        lineups = planner.build_lineups(plan_kwargs['target_matches'], plan_kwargs['pinned_assignments'],
+                                        assignments, fixed_lineups)
+        objective = planner.evaluate_plan(season_matches, lineups, plan_kwargs['active_players'])
+        # 'optimal' holds for the model's objective only: the plans compete on evaluate_plan
+        if objective['total'] < greedy_objective['total']:
+            result = dict(greedy_result, assignments=assignments, objective=objective)
+            result.update(planner.summarize_assignments(assignments, plan_kwargs))
+            info['used'] = 'solver'
+    result['solver'] = info
+    return result
@@ -2,12 +2,120 @@
 Single Planning System - Issue #22
 Simplified planning system with one planning, pinning, regeneration and match tracking.
 """
-from app.models.database import get_db_connection
+from app.models.database import get_db_connection, insert_planning_rows
 from app.models.player import Player
 from app.models.match import Match
+from app.services import planner, local_search, season_solver, plan_cache, feasibility, availability, data_cache
+from config import Config
 from datetime import datetime
+from psycopg.types.json import Jsonb
+import hashlib
 import random
-from collections import defaultdict, deque
+import secrets
+
+# pg advisory lock key: one planning regeneration at a time (any process)
+REGENERATION_LOCK_KEY = 0x5644_4F01
+
+# One matrix click: lock the cell, apply the transition and return the new
+# counts. Data-modifying CTEs all see the snapshot from before the statement,
+# so the counts are the old counts corrected with the old and new cell.
+MATRIX_CELL_CYCLE_SQL = '''
+    WITH cur AS (
+        SELECT is_pinned, actually_played FROM match_planning
+        WHERE planning_version_id = 1 AND match_id = %(match_id)s AND player_id = %(player_id)s
+        FOR UPDATE
+    ),
+    ins AS (
+        INSERT INTO match_planning (planning_version_id, match_id, player_id, is_pinned, actually_played)
+        SELECT 1, %(match_id)s, %(player_id)s, FALSE, FALSE
+        WHERE NOT EXISTS (SELECT 1 FROM cur)
+        ON CONFLICT (planning_version_id, match_id, player_id) DO NOTHING
+        RETURNING is_pinned, actually_played
+    ),
+    upd AS (
+        UPDATE match_planning SET is_pinned = TRUE, actually_played = FALSE
+        WHERE planning_version_id = 1 AND match_id = %(match_id)s AND player_id = %(player_id)s
+          AND EXISTS (SELECT 1 FROM cur WHERE NOT is_pinned)
+        RETURNING is_pinned, actually_played
+    ),
+    del AS (
+        DELETE FROM match_planning
+        WHERE planning_version_id = 1 AND match_id = %(match_id)s AND player_id = %(player_id)s
+          AND EXISTS (SELECT 1 FROM cur WHERE is_pinned)
+        RETURNING is_pinned, actually_played
+    ),
+    new AS (
+        SELECT * FROM ins UNION ALL SELECT * FROM upd
+    ),
+    player AS (
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE is_pinned) AS pinned,
+               COUNT(*) FILTER (WHERE actually_played) AS played
+        FROM match_planning
+        WHERE planning_version_id = 1 AND player_id = %(player_id)s
+    )
+    SELECT
+        (SELECT COUNT(*) FROM new) = 1 AS assigned,
+        COALESCE((SELECT is_pinned FROM new), FALSE) AS is_pinned,
+        COALESCE((SELECT actually_played FROM new), FALSE) AS actually_played,
+        (SELECT COUNT(*) FROM match_planning
+         WHERE planning_version_id = 1 AND match_id = %(match_id)s)
+            - (SELECT COUNT(*) FROM cur) + (SELECT COUNT(*) FROM new) AS match_player_count,
+        player.total - (SELECT COUNT(*) FROM cur) + (SELECT COUNT(*) FROM new) AS total_matches,
+        player.pinned - (SELECT COUNT(*) FROM cur WHERE is_pinned)
+            + (SELECT COUNT(*) FROM new WHERE is_pinned) AS total_pinned,
+        player.played - (SELECT COUNT(*) FROM cur WHERE actually_played)
+            + (SELECT COUNT(*) FROM new WHERE actually_played) AS total_played,
+        (SELECT COUNT(*) FROM matches) AS total_possible
+    FROM player
+'''
+
+
+# Matrix edit actions: 'cycle' moves to the next state (niet -> wel -> pinned
+# -> niet), the others set a state
+MATRIX_ACTIONS = {
+    'cycle': None,
+    'assign': 'assigned',
+    'pin': 'pinned',
+    'remove': 'not_assigned',
+}
+_NEXT_CELL_STATE = {'not_assigned': 'assigned', 'assigned': 'pinned', 'pinned': 'not_assigned'}
+
+
+def _cell_state(row):
+    if row is None:
+        return 'not_assigned'
+    return 'pinned' if row['is_pinned'] else 'assigned'
+
+
+def _matrix_player_stats(row):
+    """Player stats of the matrix (totals row) from total_matches/total_pinned/total_played/total_possible."""
+    total_possible = row['total_possible']
+    return {
+        'total_matches': row['total_matches'],
+        'total_pinned': row['total_pinned'],
+        'total_played': row['total_played'],
+        'percentage': (row['total_matches'] / total_possible * 100) if total_possible > 0 else 0,
+    }
+
+
+def _matrix_cell_result(row):
+    """Response fields of edit_matrix_cell from a MATRIX_CELL_CYCLE_SQL row."""
+    if not row['assigned']:
+        state = 'not_assigned'
+    elif row['is_pinned']:
+        state = 'pinned'
+    else:
+        state = 'assigned'
+    return {
+        'assigned': row['assigned'],
+        'is_pinned': row['is_pinned'],
+        'actually_played': row['actually_played'],
+        'state': state,
+        'match_player_count': row['match_player_count'],
+        'rule_violation': row['match_player_count'] > 4,
+        'stats': _matrix_player_stats(row),
+    }
 
 class SinglePlanning:
     """
@@ -51,6 +159,21 @@ class SinglePlanning:
     @staticmethod
     def get_match_planning(match_id):
         """Get planning for a specific match."""
+        return SinglePlanning.get_planning_for_matches([match_id])[match_id]
+
+    @staticmethod
+    def get_planning_for_matches(match_ids):
+        """
+        Get the planning of many matches with one query.
+
+        Returns:
+            {match_id: [planning rows with player_name and role, by name]};
+            matches without planning map to an empty list
+        """
+        match_ids = list(match_ids)
+        planning = {match_id: [] for match_id in match_ids}
+        if not match_ids:
+            return planning
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('''
@@ -60,10 +183,11 @@ class SinglePlanning:
                 p.role
             FROM match_planning mp
             JOIN players p ON mp.player_id = p.id
-            WHERE mp.planning_version_id = 1 AND mp.match_id = %s
-            ORDER BY p.name
-        ''', (match_id,))
-        planning = cursor.fetchall()
+            WHERE mp.planning_version_id = 1 AND mp.match_id = ANY(%s)
+            ORDER BY mp.match_id, p.name
+        ''', (match_ids,))
+        for row in cursor.fetchall():
+            planning[row['match_id']].append(row)
         cursor.close()
         conn.close()
         return planning
@@ -95,14 +219,10 @@ class SinglePlanning:
                 WHERE planning_version_id = 1 AND match_id = %s AND is_pinned = false
             ''', (match_id,))
             
-            # Add new players (excluding already pinned ones)
-            for player_id in player_ids:
-                if player_id not in pinned_players:
-                    cursor.execute('''
-                        INSERT INTO match_planning (planning_version_id, match_id, player_id)
-                        VALUES (1, %s, %s)
-                        ON CONFLICT (planning_version_id, match_id, player_id) DO NOTHING
-                    ''', (match_id, player_id))
+            # Add new players (excluding already pinned ones) in one batch
+            insert_planning_rows(cursor, [
+                (match_id, player_id) for player_id in player_ids if player_id not in pinned_players
+            ])
         else:
             # Replace all players (ignore pinning)
             cursor.execute('''
@@ -110,13 +230,10 @@ class SinglePlanning:
                 WHERE planning_version_id = 1 AND match_id = %s
             ''', (match_id,))
             
-            for player_id in player_ids:
-                cursor.execute('''
-                    INSERT INTO match_planning (planning_version_id, match_id, player_id)
-                    VALUES (1, %s, %s)
-                ''', (match_id, player_id))
+            insert_planning_rows(cursor, [(match_id, player_id) for player_id in player_ids], on_conflict=None)
         
         conn.commit()
+        data_cache.invalidate('planning')
         cursor.close()
         conn.close()
     
@@ -131,6 +248,7 @@ class SinglePlanning:
             WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
         ''', (pinned, match_id, player_id))
         conn.commit()
+        data_cache.invalidate('planning')
         cursor.close()
         conn.close()
     
@@ -145,6 +263,7 @@ class SinglePlanning:
             WHERE planning_version_id = 1 AND match_id = %s
         ''', (pinned, match_id))
         conn.commit()
+        data_cache.invalidate('planning')
         cursor.close()
         conn.close()
     
@@ -159,9 +278,150 @@ class SinglePlanning:
             WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
         ''', (actually_played, match_id, player_id))
         conn.commit()
+        data_cache.invalidate('planning')
         cursor.close()
         conn.close()
     
+    @staticmethod
+    def cycle_matrix_cell(match_id, player_id, cursor=None):
+        """
+        Move a matrix cell to its next state (niet -> wel -> pinned -> niet).
+
+        The transition and the statistics the matrix shows afterwards are one
+        statement (MATRIX_CELL_CYCLE_SQL): a single round trip per click.
+
+        Returns:
+            dict with state, assigned, is_pinned, actually_played,
+            match_player_count and the player's stats
+        """
+        own = cursor is None
+        if own:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+        try:
+            cursor.execute(MATRIX_CELL_CYCLE_SQL, {'match_id': match_id, 'player_id': player_id})
+            row = cursor.fetchone()
+            if own:
+                conn.commit()
+        finally:
+            if own:
+                cursor.close()
+                conn.close()
+        data_cache.invalidate('planning')
+        return _matrix_cell_result(row)
+
+    @staticmethod
+    def apply_matrix_edits(edits):
+        """
+        Apply a batch of matrix edits atomically (one transaction).
+
+        Edits of the same cell are applied in order, so three 'cycle' clicks
+        leave a cell as it was. Only cells whose state changes are written,
+        and the player count of each touched match is checked once, after
+        all edits.
+
+        Args:
+            edits: iterable of (player_id, match_id, action) in click order,
+                action one of MATRIX_ACTIONS
+
+        Returns:
+            {'cells': [{player_id, match_id, state, assigned, is_pinned, actually_played}],
+             'players': {player_id: stats}, 'matches': {match_id: {match_player_count, rule_violation}}}
+        """
+        edits = [(int(player_id), int(match_id), action or 'cycle') for player_id, match_id, action in edits]
+        for _, _, action in edits:
+            if action not in MATRIX_ACTIONS:
+                raise ValueError(f"Unknown matrix action '{action}'")
+        cells = list(dict.fromkeys((match_id, player_id) for player_id, match_id, _ in edits))
+        if not cells:
+            return {'cells': [], 'players': {}, 'matches': {}}
+        player_ids = sorted({player_id for _, player_id in cells})
+        match_ids = sorted({match_id for match_id, _ in cells})
+
+        conn = get_db_connection(savepoint=True)
+        cursor = conn.cursor()
+        try:
+            # Lock the existing cells (in a fixed order) for the whole batch
+            cursor.execute('''
+                SELECT mp.match_id, mp.player_id, mp.is_pinned, mp.actually_played
+                FROM match_planning mp
+                JOIN unnest(%s::integer[], %s::integer[]) AS c(match_id, player_id)
+                  ON mp.match_id = c.match_id AND mp.player_id = c.player_id
+                WHERE mp.planning_version_id = 1
+                ORDER BY mp.match_id, mp.player_id
+                FOR UPDATE OF mp
+            ''', ([match_id for match_id, _ in cells], [player_id for _, player_id in cells]))
+            current = {(r['match_id'], r['player_id']): r for r in cursor.fetchall()}
+
+            states = {cell: _cell_state(current.get(cell)) for cell in cells}
+            for player_id, match_id, action in edits:
+                cell = (match_id, player_id)
+                states[cell] = MATRIX_ACTIONS[action] or _NEXT_CELL_STATE[states[cell]]
+            changed = [cell for cell in cells if states[cell] != _cell_state(current.get(cell))]
+
+            removed = [cell for cell in changed if states[cell] == 'not_assigned']
+            if removed:
+                cursor.execute('''
+                    DELETE FROM match_planning mp
+                    USING unnest(%s::integer[], %s::integer[]) AS c(match_id, player_id)
+                    WHERE mp.planning_version_id = 1
+                      AND mp.match_id = c.match_id AND mp.player_id = c.player_id
+                ''', ([match_id for match_id, _ in removed], [player_id for _, player_id in removed]))
+            insert_planning_rows(cursor, [
+                (match_id, player_id, states[(match_id, player_id)] == 'pinned', False)
+                for match_id, player_id in changed if states[(match_id, player_id)] != 'not_assigned'
+            ], on_conflict='update')
+
+            cursor.execute('''
+                SELECT p.id AS player_id,
+                       COUNT(mp.id) AS total_matches,
+                       COUNT(mp.id) FILTER (WHERE mp.is_pinned) AS total_pinned,
+                       COUNT(mp.id) FILTER (WHERE mp.actually_played) AS total_played,
+                       (SELECT COUNT(*) FROM matches) AS total_possible
+                FROM unnest(%s::integer[]) AS p(id)
+                LEFT JOIN match_planning mp ON mp.player_id = p.id AND mp.planning_version_id = 1
+                GROUP BY p.id
+            ''', (player_ids,))
+            players = {r['player_id']: _matrix_player_stats(r) for r in cursor.fetchall()}
+            cursor.execute('''
+                SELECT m.id AS match_id, COUNT(mp.id) AS match_player_count
+                FROM unnest(%s::integer[]) AS m(id)
+                LEFT JOIN match_planning mp ON mp.match_id = m.id AND mp.planning_version_id = 1
+                GROUP BY m.id
+            ''', (match_ids,))
+            matches = {
+                r['match_id']: {
+                    'match_player_count': r['match_player_count'],
+                    'rule_violation': r['match_player_count'] > 4,
+                }
+                for r in cursor.fetchall()
+            }
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        if changed:
+            data_cache.invalidate('planning')
+            print(f"✏️ Matrix batch: {len(edits)} edits, {len(changed)} cells changed")
+
+        result_cells = []
+        for match_id, player_id in cells:
+            state = states[(match_id, player_id)]
+            row = current.get((match_id, player_id))
+            unchanged = state == _cell_state(row)
+            result_cells.append({
+                'player_id': player_id,
+                'match_id': match_id,
+                'state': state,
+                'assigned': state != 'not_assigned',
+                'is_pinned': state == 'pinned',
+                'actually_played': bool(row and unchanged and row['actually_played']),
+            })
+        return {'cells': result_cells, 'players': players, 'matches': matches}
+
     @staticmethod
     def set_match_played(match_id, played=True):
         """Mark a match as played or not played."""
@@ -173,6 +433,7 @@ class SinglePlanning:
             WHERE id = %s
         ''', (played, match_id))
         conn.commit()
+        data_cache.invalidate('matches')
         cursor.close()
         conn.close()
     
@@ -213,10 +474,216 @@ class SinglePlanning:
         }
 
     @staticmethod
-    def regenerate_planning(exclude_pinned=True, plan_mode='all', cutoff_date=None):
+    def _parse_cutoff(cutoff_date):
+        """Parse a cutoff date (str YYYY-MM-DD or date); invalid values are ignored."""
+        if not cutoff_date:
+            return None
+        try:
+            if isinstance(cutoff_date, str):
+                return datetime.strptime(cutoff_date, '%Y-%m-%d').date()
+            return cutoff_date
+        except Exception as e:
+            print(f"   ⚠️ Invalid cutoff_date provided: {cutoff_date} ({e}) - ignoring")
+            return None
+
+    @staticmethod
+    def _load_planning_state(cursor):
+        """Load everything the planner needs with a handful of bulk queries."""
+        all_matches = Match.get_season(cursor)
+        active_players = Player.get_active(cursor)
+
+        # Alleen de niet-beschikbare cellen; geen antwoord telt als beschikbaar
+        unavailable = availability.get_matrix(cursor).planner_view()
+
+        cursor.execute('''
+            SELECT mp.match_id, mp.player_id, mp.is_pinned, mp.actually_played, p.is_active
+            FROM match_planning mp
+            JOIN players p ON mp.player_id = p.id
+            WHERE mp.planning_version_id = 1
+            ORDER BY mp.match_id, mp.player_id
+        ''')
+        planning_rows = cursor.fetchall()
+
+        return {
+            'all_matches': all_matches,
+            'active_players': active_players,
+            'availability': unavailable,
+            'planning_rows': planning_rows,
+        }
+
+    @staticmethod
+    def _prepare_scope(state, plan_mode='all', cutoff_date=None, exclude_pinned=True):
+        """
+        Bepaal de scope van een regeneratie: doel-wedstrijden, welke bestaande
+        toewijzingen verdwijnen of blijven, de pins en de plan_season argumenten.
+        """
+        all_matches = state['all_matches']
+        active_players = state['active_players']
+        unplayed_all = [m for m in all_matches if not m.get('is_played', False)]
+
+        if plan_mode not in ('all', 'until_date', 'from_date', 'rest', 'solver'):
+            print(f"   ⚠️ Unknown plan_mode '{plan_mode}', defaulting to 'all'")
+            plan_mode = 'all'
+        cutoff_dt = SinglePlanning._parse_cutoff(cutoff_date)
+
+        # Bepaal doel-wedstrijden op basis van plan_mode
+        def match_in_scope(m):
+            if not cutoff_dt:
+                return True
+            mdate_d = planner._date_key(m.get('match_date'))
+            if plan_mode in ('until_date',):
+                return mdate_d is None or (mdate_d <= cutoff_dt)
+            if plan_mode in ('from_date', 'rest'):
+                return mdate_d is None or (mdate_d >= cutoff_dt)
+            return True
+
+        target_matches = [m for m in unplayed_all if (plan_mode == 'all' or match_in_scope(m))]
+
+        # Bepaal wat verwijderd wordt en wat blijft
+        match_date_by_id = {m['id']: m.get('match_date') for m in all_matches}
+        target_match_ids = {m['id'] for m in target_matches}
+
+        def is_removed(row):
+            # until_date: alles na de grensdatum verdwijnt (inclusief pinnen)
+            if plan_mode == 'until_date' and cutoff_dt:
+                mdate_d = planner._date_key(match_date_by_id.get(row['match_id']))
+                if mdate_d is not None and mdate_d > cutoff_dt:
+                    return True
+            # Binnen scope: niet-gepinde (of alle, zonder exclude_pinned) toewijzingen
+            if row['match_id'] in target_match_ids:
+                return (not exclude_pinned) or (not row['is_pinned'])
+            return False
+
+        removed_rows = [r for r in state['planning_rows'] if is_removed(r)]
+        kept_rows = [r for r in state['planning_rows'] if not is_removed(r)]
+
+        # Pinned assignments
+        pinned_assignments = {}
+        if exclude_pinned:
+            for row in kept_rows:
+                if row['is_pinned'] and row['is_active']:
+                    pinned_assignments.setdefault(row['match_id'], []).append(row['player_id'])
+
+        date_bookings = planner.build_date_bookings(
+            ((r['match_id'], r['player_id']) for r in kept_rows), match_date_by_id
+        )
+        plan_kwargs = {
+            'target_matches': target_matches,
+            'active_players': active_players,
+            'availability': state['availability'],
+            'pinned_assignments': pinned_assignments,
+            'date_bookings': date_bookings,
+            'unplayed_matches': unplayed_all,
+        }
+        fixed_lineups = {}
+        for row in kept_rows:
+            if row['match_id'] not in target_match_ids and row['is_active']:
+                fixed_lineups.setdefault(row['match_id'], []).append(row['player_id'])
+        return {
+            'plan_mode': plan_mode,
+            'cutoff_dt': cutoff_dt,
+            'target_matches': target_matches,
+            'removed_rows': removed_rows,
+            'kept_rows': kept_rows,
+            'plan_kwargs': plan_kwargs,
+            'fixed_lineups': fixed_lineups,
+        }
+
+    @staticmethod
+    def check_feasibility(plan_mode='all', cutoff_date=None, exclude_pinned=True):
+        """
+        Snelle haalbaarheidscheck vóór een regeneratie (app.services.feasibility).
+
+        Gebruikt dezelfde scope als regenerate_planning en geeft direct terug welke
+        wedstrijden en datums niet gevuld kunnen worden en welke spelers hun
+        eerlijke aandeel of cap niet kunnen halen, zodat de captain eerst de
+        beschikbaarheid kan aanpassen.
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            state = SinglePlanning._load_planning_state(cursor)
+            scope = SinglePlanning._prepare_scope(state, plan_mode, cutoff_date, exclude_pinned)
+            report = feasibility.check_feasibility(scope['plan_kwargs'])
+            report.update({
+                'success': True,
+                'plan_mode': scope['plan_mode'],
+                'cutoff_date': scope['cutoff_dt'].isoformat() if scope['cutoff_dt'] else None,
+                'target_matches': len(scope['target_matches']),
+            })
+            return report
+        except Exception as e:
+            print(f"❌ Feasibility check failed: {e}")
+            return {'success': False, 'message': f'Feasibility check failed: {e}'}
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+
+    @staticmethod
+    def _compute_plan(plan_kwargs, unplayed_all, fixed_lineups, step, plan_mode='all', restarts=1,
+                      time_budget=None, seed=None, optimize_time=None, optimize_iterations=None,
+                      solver_time_limit=None, allocation='greedy'):
+        """Run the planner (multi-start, solver, local search) for one regeneration; no database access."""
+        if restarts > 1:
+            result = planner.plan_season_multistart(
+                plan_kwargs, unplayed_all, fixed_lineups,
+                restarts=restarts, time_budget=time_budget, seed=seed,
+                max_workers=Config.PLANNER_MAX_WORKERS, allocation=allocation,
+            )
+            print(f"   🎲 Best of {result['restarts_completed']}/{result['restarts_requested']} runs: seed={result['seed']} objective={result['objective']['total']}")
+        else:
+            result = planner.run_seeded(seed, plan_kwargs, unplayed_all, fixed_lineups, allocation)
+            print(f"   🎲 Seed {seed}: objective={result['objective']['total']}")
+        if result.get('allocation'):
+            report = result['allocation']
+            print(f"   🌊 Flow allocation: rounds {report['rounds']} → refined {result['objective']['total']}")
+
+        step(60, 'Planning gegenereerd')
+
+        if plan_mode == 'solver':
+            step(65, 'Solver draait...')
+            limit = float(solver_time_limit or Config.PLANNER_SOLVER_TIME_LIMIT)
+            limit = max(1.0, min(limit, Config.PLANNER_MAX_SOLVER_TIME_LIMIT))
+            seed_used = result['seed']
+            result = season_solver.plan_season_exact(
+                plan_kwargs, unplayed_all, result, fixed_lineups, time_limit=limit,
+            )
+            result['seed'] = seed_used
+            report = result['solver']
+            print(f"   🧮 Solver: {report['status']} in {report['solve_time']}s (gap={report['gap']}, used={report['used']}) objective={result['objective']['total']}")
+
+        if optimize_time or optimize_iterations:
+            step(75, 'Planning optimaliseren...')
+            optimize_time = min(float(optimize_time or Config.PLANNER_MAX_OPTIMIZE_TIME), Config.PLANNER_MAX_OPTIMIZE_TIME)
+            seed_used = result['seed']
+            result = local_search.optimize_plan(
+                result, plan_kwargs, unplayed_all, fixed_lineups,
+                time_budget=optimize_time,
+                max_iterations=int(optimize_iterations) if optimize_iterations else None,
+                rng=random.Random(seed_used),
+            )
+            result['seed'] = seed_used
+            report = result['optimizer']
+            print(f"   🔧 Local search: {report['before']} → {report['after']} ({report['iterations']} moves, {report['accepted']} accepted, {report['elapsed']}s)")
+
+        return result
+
+    @staticmethod
+    def regenerate_planning(exclude_pinned=True, plan_mode='all', cutoff_date=None,
+                            restarts=1, time_budget=None, seed=None,
+                            optimize_time=None, optimize_iterations=None, solver_time_limit=None,
+                            progress=None, dry_run=False, allocation=None):
         """
         🎯 KERNFUNCTIE: Volledige planning regeneratie volgens alle regels
-        
+
+        De planning zelf gebeurt in het geheugen (app.services.planner.plan_season);
+        hier wordt de data in één keer geladen en het resultaat in één transactie
+        weggeschreven.
+
         BUSINESS RULES:
         1. PRECIES 4 SPELERS PER WEDSTRIJD (harde regel)
         2. ALLEEN BESCHIKBARE SPELERS (check player_availability)
@@ -225,82 +692,170 @@ class SinglePlanning:
         5. VASTGEPINDE SPELERS blijven op hun plek
         6. PARTNER VOORKEUREN waar mogelijk
         7. THUIS/UIT BALANS per speler
-        
+
         Args:
             exclude_pinned: Als True, behoud vastgepinde spelers
-            plan_mode: 'all' | 'until_date' | 'from_date' (alias: 'rest')
+            plan_mode: 'all' | 'until_date' | 'from_date' (alias: 'rest') | 'solver'
+                ('solver' = alle wedstrijden, exact opgelost met app.services.season_solver;
+                de greedy planning is de fallback)
             cutoff_date: str of datetime.date (YYYY-MM-DD) als grensdatum
+            restarts: aantal parallelle runs met eigen seed (K); alleen de beste
+                planning volgens planner.evaluate_plan wordt opgeslagen
+            time_budget: maximale wandkloktijd in seconden voor de runs
+            seed: optionele seed; dezelfde seed op dezelfde data geeft exact dezelfde
+                planning. Zonder seed wordt er een gekozen; de seed van de opgeslagen
+                planning komt in de undo snapshot (opnieuw uitvoeren met restarts=1
+                en die seed levert dezelfde planning op); runs met een seed worden
+                gememoiseerd op een vingerafdruk van alle invoer (app.services.plan_cache)
+            optimize_time: optionele tijd (seconden) voor de local-search nabewerking
+                (simulated annealing, app.services.local_search) op de beste planning
+            optimize_iterations: optioneel maximum aantal zetten voor de nabewerking;
+                met een seed is het resultaat dan reproduceerbaar
+            solver_time_limit: tijdslimiet (seconden) voor de solver in 'solver' modus
+            progress: optionele callback progress(percent, message), bv. voor de
+                voortgang van een achtergrondtaak (app.services.jobs)
+            allocation: 'greedy' (plan_season) of 'flow' (min-cost-flow verdeling met
+                exacte eerlijkheid, app.services.allocation); default Config.PLANNER_ALLOCATION
+            dry_run: als True, wordt match_planning niet aangeraakt; het resultaat
+                bevat een compacte diff (toegevoegd/verwijderd per wedstrijd,
+                verschil in aantallen per speler) en een preview token waarmee
+                apply_preview precies deze diff kan doorvoeren
+
+        Er draait nooit meer dan één regeneratie tegelijk (advisory lock op de
+        transactie); een tweede aanroep geeft direct 'busy' terug.
         """
         print("=" * 80)
         print("🎯 STARTING COMPLETE PLANNING REGENERATION")
         print("=" * 80)
-        
+
+        def step(percent, message):
+            if progress is not None:
+                progress(percent, message)
+
+        conn = None
+        cursor = None
         try:
-            conn = get_db_connection()
+            conn = get_db_connection(savepoint=True)
             cursor = conn.cursor()
+            if not dry_run and not SinglePlanning._try_regeneration_lock(cursor):
+                print("   ⏳ Another regeneration is running")
+                return {'success': False, 'busy': True, 'message': 'Er loopt al een regeneratie, probeer het straks opnieuw'}
+            step(5, 'Gegevens laden...')
 
-            # Ensure undo tables exist and snapshot current planning before any changes
-            SinglePlanning._create_undo_tables(cursor)
-            SinglePlanning._create_undo_snapshot(cursor, plan_mode, cutoff_date)
-            conn.commit()
-            
-            # === STAP 1: DATA VERZAMELEN ===
+            # === STAP 1: DATA VERZAMELEN (bulk) ===
             print("\n📊 STEP 1: GATHERING DATA...")
-            
-            # Get alle matches
-            cursor.execute('SELECT * FROM matches ORDER BY match_date, id')
-            all_matches = cursor.fetchall()
+            state = SinglePlanning._load_planning_state(cursor)
+            all_matches = state['all_matches']
+            active_players = state['active_players']
             unplayed_all = [m for m in all_matches if not m.get('is_played', False)]
 
-            # Parse cutoff_date if provided
-            cutoff_dt = None
-            if cutoff_date:
-                try:
-                    if isinstance(cutoff_date, str):
-                        cutoff_dt = datetime.strptime(cutoff_date, '%Y-%m-%d').date()
-                    else:
-                        cutoff_dt = cutoff_date
-                except Exception as e:
-                    print(f"   ⚠️ Invalid cutoff_date provided: {cutoff_date} ({e}) - ignoring")
-                    cutoff_dt = None
-
-            # Bepaal doel-wedstrijden op basis van plan_mode
-            def match_in_scope(m):
-                if not cutoff_dt:
-                    return True
-                mdate = m.get('match_date')
-                try:
-                    # mdate kan datetime of date zijn; normaliseer naar date
-                    mdate_d = mdate.date() if hasattr(mdate, 'date') else mdate
-                except Exception:
-                    mdate_d = mdate
-                if plan_mode in ('until_date',):
-                    return mdate_d is None or (mdate_d <= cutoff_dt)
-                if plan_mode in ('from_date', 'rest'):
-                    return mdate_d is None or (mdate_d >= cutoff_dt)
-                return True
-
-            if plan_mode not in ('all', 'until_date', 'from_date', 'rest'):
-                print(f"   ⚠️ Unknown plan_mode '{plan_mode}', defaulting to 'all'")
-                plan_mode = 'all'
+            # === STAP 2-3: SCOPE, TE VERWIJDEREN/BEHOUDEN RIJEN EN PINS ===
+            scope = SinglePlanning._prepare_scope(state, plan_mode, cutoff_date, exclude_pinned)
+            plan_mode = scope['plan_mode']
+            cutoff_dt = scope['cutoff_dt']
+            target_matches = scope['target_matches']
+            target_match_ids = {m['id'] for m in target_matches}
+            kept_rows = scope['kept_rows']
+            plan_kwargs = scope['plan_kwargs']
+            fixed_lineups = scope['fixed_lineups']
 
-            target_matches = [m for m in unplayed_all if (plan_mode == 'all' or match_in_scope(m))]
-
-            # Get alle active players
-            cursor.execute('SELECT * FROM players WHERE is_active = TRUE ORDER BY name')
-            active_players = cursor.fetchall()
-            # Quick lookup by id for partner/preference checks
-            players_by_id = {p['id']: p for p in active_players}
-            
-            print(f"   � Total matches: {len(all_matches)} | Unplayed: {len(unplayed_all)} | In scope: {len(target_matches)} (mode={plan_mode}, cutoff={cutoff_dt})")
+            print(f"   📅 Total matches: {len(all_matches)} | Unplayed: {len(unplayed_all)} | In scope: {len(target_matches)} (mode={plan_mode}, cutoff={cutoff_dt})")
             print(f"   👥 Active players: {len(active_players)}")
-            
+            print(f"   📊 Unavailable entries: {sum(len(v) for v in state['availability'].values())}")
+
             if not target_matches or not active_players:
                 return {'success': False, 'message': 'Geen wedstrijden of actieve spelers gevonden'}
 
-            # === (OPTIONEEL) TUSSENSTAP: CLEAN AFTER CUTOFF FOR UNTIL_DATE MODE ===
+            print(f"\n📌 Pinned assignments: {sum(len(p) for p in plan_kwargs['pinned_assignments'].values())} | To clear: {len(scope['removed_rows'])}")
+
+            # === STAP 3b: HAALBAARHEID (snelle pre-check, vóór het zoeken) ===
+            feasibility_report = feasibility.check_feasibility(plan_kwargs)
+            if not feasibility_report['feasible']:
+                print(f"   ⚠️ Infeasible: {feasibility_report['total_shortfall']} slots cannot be filled "
+                      f"({len(feasibility_report['matches'])} problem matches, {len(feasibility_report['dates'])} dates)")
+
+            # === STAP 4: PLANNING IN HET GEHEUGEN ===
+            print("\n🎯 STEP 4: GENERATING COMPLETE PLANNING (in memory)...")
+            step(20, 'Planning genereren...')
+            restarts = max(1, min(int(restarts or 1), Config.PLANNER_MAX_RESTARTS))
+            if time_budget is not None:
+                time_budget = max(0.0, min(float(time_budget), Config.PLANNER_MAX_TIME_BUDGET))
+            if allocation not in ('greedy', 'flow'):
+                allocation = Config.PLANNER_ALLOCATION
+            seeded = seed is not None
+            if seed is None:
+                seed = planner.new_seed()
+            fingerprint = SinglePlanning._state_fingerprint(state)
+            run_params = {
+                'exclude_pinned': bool(exclude_pinned), 'plan_mode': plan_mode,
+                'cutoff_date': cutoff_dt, 'restarts': restarts, 'time_budget': time_budget,
+                'seed': seed, 'optimize_time': optimize_time,
+                'optimize_iterations': optimize_iterations, 'solver_time_limit': solver_time_limit,
+                'allocation': allocation,
+            }
+            # Only runs with an explicit seed are reproducible, and thus cacheable
+            cache_key = plan_cache.make_key(fingerprint, **run_params) if seeded else None
+            result = plan_cache.get(cache_key, cursor) if cache_key else None
+            cached = result is not None
+            if cached:
+                print(f"   ♻️ Cached plan for this input (seed={result['seed']}) objective={result['objective']['total']}")
+                step(80, 'Planning uit cache')
+            else:
+                result = SinglePlanning._compute_plan(
+                    plan_kwargs, unplayed_all, fixed_lineups, step,
+                    plan_mode=plan_mode, restarts=restarts, time_budget=time_budget, seed=seed,
+                    optimize_time=optimize_time, optimize_iterations=optimize_iterations,
+                    solver_time_limit=solver_time_limit, allocation=allocation,
+                )
+                if cache_key:
+                    plan_cache.put(cache_key, result, cursor)
+
+            # === STAP 5: IN ÉÉN TRANSACTIE WEGSCHRIJVEN ===
+            print("\n💾 STEP 5: WRITING PLANNING...")
+            step(90, 'Planning opslaan...')
+            new_rows = [
+                (match_id, player_id)
+                for match_id, player_ids in result['assignments'].items()
+                for player_id in player_ids
+            ]
+            before = {(r['match_id'], r['player_id']): (r['is_pinned'], r['actually_played']) for r in state['planning_rows']}
+            after = {(r['match_id'], r['player_id']): (r['is_pinned'], r['actually_played']) for r in kept_rows}
+            after.update({row: (False, False) for row in new_rows})
+            changes = SinglePlanning._diff_planning(before, after)
+
+            if dry_run:
+                season_ids = {m['id'] for m in unplayed_all}
+                current = {}
+                for row in state['planning_rows']:
+                    if row['match_id'] in season_ids and row['is_active']:
+                        current.setdefault(row['match_id'], []).append(row['player_id'])
+                preview = SinglePlanning._store_preview(cursor, fingerprint, plan_mode, cutoff_date, result['seed'], changes)
+                conn.commit()
+                print(f"👀 Preview {preview['token']}: {len(changes)} changes, nothing written")
+                return {
+                    'success': True,
+                    'dry_run': True,
+                    'message': f'Preview: {len(changes)} wijzigingen in {len(preview["matches"])} wedstrijden',
+                    'preview_token': preview['token'],
+                    'expires_at': preview['expires_at'],
+                    'changes': len(changes),
+                    'matches': preview['matches'],
+                    'player_deltas': SinglePlanning._player_deltas(before, after, all_matches, active_players),
+                    'objective_before': planner.evaluate_plan(unplayed_all, current, active_players),
+                    'objective': result['objective'],
+                    'rule_violations': result['rule_violations'],
+                    'seed': result['seed'],
+                    'optimizer': result.get('optimizer'),
+                    'solver': result.get('solver'),
+                    'cached': cached,
+                    'feasibility': feasibility_report,
+                    'allocation': result.get('allocation'),
+                }
+
+            SinglePlanning._create_undo_tables(cursor)
+            SinglePlanning._create_undo_snapshot(cursor, plan_mode, cutoff_date, changes, seed=result['seed'])
+
             if plan_mode == 'until_date' and cutoff_dt:
-                print("\n🧹 STEP 2b: CLEANING ASSIGNMENTS AFTER CUTOFF DATE (inclusive pinnen)...")
                 cursor.execute('''
                     DELETE FROM match_planning mp
                     USING matches m
@@ -308,625 +863,251 @@ class SinglePlanning:
                       AND mp.match_id = m.id
                       AND m.match_date > %s
                 ''', (cutoff_dt,))
-                cleaned = cursor.rowcount
-                conn.commit()
-                print(f"   🧹 Deleted {cleaned} assignments after {cutoff_dt}")
-            
-            # === STAP 2: VERZAMEL AVAILABILITY DATA ===
-            print("\n📋 STEP 2: COLLECTING AVAILABILITY...")
-            
-            # Get player availability per match
-            cursor.execute('''
-                SELECT player_id, match_id, is_available, notes 
-                FROM player_availability
-            ''')
-            availability_data = cursor.fetchall()
-            
-            # Build availability lookup
-            availability = {}
-            for avail in availability_data:
-                player_id = avail['player_id']
-                match_id = avail['match_id']
-                if player_id not in availability:
-                    availability[player_id] = {}
-                availability[player_id][match_id] = avail
-            
-            print(f"   📊 Availability entries: {len(availability_data)}")
-            
-            # === STAP 3: VERZAMEL PINNED ASSIGNMENTS ===
-            print("\n📌 STEP 3: COLLECTING PINNED ASSIGNMENTS...")
-            
-            pinned_assignments = {}
             if exclude_pinned:
                 cursor.execute('''
-                    SELECT match_id, player_id, player_id as pid
-                    FROM match_planning mp
-                    JOIN players p ON mp.player_id = p.id
-                    WHERE mp.planning_version_id = 1 AND mp.is_pinned = TRUE AND p.is_active = TRUE
-                ''')
-                pinned_data = cursor.fetchall()
-                
-                for pin in pinned_data:
-                    match_id = pin['match_id']
-                    player_id = pin['player_id']
-                    if match_id not in pinned_assignments:
-                        pinned_assignments[match_id] = []
-                    pinned_assignments[match_id].append(player_id)
-                
-                print(f"   📌 Pinned assignments: {sum(len(players) for players in pinned_assignments.values())}")
-                for match_id, players in pinned_assignments.items():
-                    print(f"      Match {match_id}: {len(players)} pinned players")
-            
-            # === STAP 4: CLEAR ALLE NON-PINNED ASSIGNMENTS ===
-            print("\n🗑️ STEP 4: CLEARING NON-PINNED ASSIGNMENTS...")
-            
-            # Beperk verwijdering tot doelwedstrijden om buiten scope niets te wijzigen
-            target_match_ids = [m['id'] for m in target_matches]
-            if target_match_ids:
-                if exclude_pinned:
-                    cursor.execute('''
-                        DELETE FROM match_planning 
-                        WHERE planning_version_id = 1 AND is_pinned = FALSE AND match_id = ANY(%s)
-                    ''', (target_match_ids,))
-                    deleted = cursor.rowcount
-                    print(f"   🗑️ Deleted {deleted} non-pinned assignments in scope")
-                else:
-                    cursor.execute('''
-                        DELETE FROM match_planning 
-                        WHERE planning_version_id = 1 AND match_id = ANY(%s)
-                    ''', (target_match_ids,))
-                    deleted = cursor.rowcount
-                    print(f"   🗑️ Deleted {deleted} total assignments in scope")
-                    pinned_assignments = {k: v for k, v in pinned_assignments.items() if k not in set(target_match_ids)}
-            
-            conn.commit()
-            
-            # === STAP 5: INITIALIZE PLAYER MATCH COUNTS & RECENT PLAY TRACKING ===
-            print("\n📈 STEP 5: INITIALIZING PLAYER COUNTERS...")
-            
-            player_match_counts = {p['id']: 0 for p in active_players}
-            player_home_counts = {p['id']: 0 for p in active_players}
-            player_away_counts = {p['id']: 0 for p in active_players}
-            
-            # Track recent matches for variatie (last 3 matches played by each player)
-            recent_matches_by_player = {p['id']: [] for p in active_players}
-            
-            # Count pinned matches across alle ongespeelde wedstrijden (niet alleen scope)
-            for match_id, player_ids in pinned_assignments.items():
-                # Find match info in alle ongespeelde
-                match_info = next((m for m in unplayed_all if m['id'] == match_id), None)
-                if match_info:
-                    for player_id in player_ids:
-                        if player_id in player_match_counts:
-                            player_match_counts[player_id] += 1
-                            if match_info.get('is_home', False):
-                                player_home_counts[player_id] += 1
-                            else:
-                                player_away_counts[player_id] += 1
-            
-            print(f"   � Initial match counts (from pinned): {dict(list(player_match_counts.items())[:3])}...")
-            
-            # === STAP 5b: FAIRNESS CAPS PER SPELER (BINNEN SCOPE) ===
-            print("\n⚖️ STEP 5b: COMPUTING FAIRNESS CAPS...")
-            total_slots_target = len(target_matches) * 4
-            pinned_in_target_total = sum(len(pinned_assignments.get(m['id'], [])) for m in target_matches)
-            # Maximalen per speler binnen scope (ceil)
-            num_players_active = max(1, len(active_players))
-            max_per_player_target = (total_slots_target + num_players_active - 1) // num_players_active
-            # Huidige tellers per speler voor scope (start met gepinden in scope)
-            fairness_counts = {p['id']: 0 for p in active_players}
-            for m in target_matches:
-                for pid in pinned_assignments.get(m['id'], []):
-                    if pid in fairness_counts:
-                        fairness_counts[pid] += 1
-            print(f"   🎯 Target slots: {total_slots_target}, pinned in scope: {pinned_in_target_total}, cap per speler: {max_per_player_target}")
-
-            # === STAP 6: GENERATE COMPLETE PLANNING ===
-            print("\n🎯 STEP 6: GENERATING COMPLETE PLANNING...")
-
-            # Index matches to balance spacing over time and avoid long streaks
-            match_index_by_id = {m['id']: i for i, m in enumerate(target_matches)}
-            last_play_idx = {p['id']: None for p in active_players}  # last index where player was assigned (pinned or selected)
-            pair_cooccur = defaultdict(int)  # unordered pair (min_id, max_id) -> times played together so far in this regen
-            # Keep short memory of recent full team quartets to increase diversity
-            quartet_memory_size = 3  # consider last N lineups as recent
-            recent_quartets = deque(maxlen=quartet_memory_size)
-            # Weights and bonuses (tunable)
-            recent_weight = 0.5
-            spacing_weight = 1.2
-            synergy_weight = 0.8
-            synergy_weight_for_partners = 0.3  # a bit lighter to keep partners together more often
-            partner_pair_bonus = 1.5           # stronger bonus for selecting a true partner pair
-            partner_with_selected_bonus = 0.8  # slightly stronger bonus when partner already present
-            
-            regenerated_count = 0
-            total_assignments = 0
-            rule_violations = []
-            
-            for idx, match in enumerate(target_matches):
-                match_id = match['id']
-                match_date = match.get('match_date')
-                is_home = match.get('is_home', False)
-                home_team = match.get('home_team', 'Unknown')
-                away_team = match.get('away_team', 'Unknown')
-                
-                print(f"\n   � Processing Match {match_id}: {home_team} vs {away_team}")
-                print(f"      📅 Date: {match_date} | {'🏠 Home' if is_home else '✈️ Away'}")
-                
-                # Get existing pinned players
-                existing_pinned = pinned_assignments.get(match_id, [])
-                needed_players = 4 - len(existing_pinned)
-                
-                print(f"      📌 Pinned: {len(existing_pinned)} | Need: {needed_players} more")
-
-                # Progressive fairness cap up to this point (prevents front-loading the same players)
-                # Allowed max for now = ceil(4 * matches_processed_so_far / num_players)
-                matches_so_far_inclusive = idx + 1
-                allowed_now_cap = (4 * matches_so_far_inclusive + num_players_active - 1) // num_players_active
-                print(f"      ⚖️ Progressive cap until now: {allowed_now_cap} per player")
-
-                # Ensure pinned players count toward spacing tracking for subsequent matches
-                for pid in existing_pinned:
-                    last_play_idx[pid] = idx
-                
-                if needed_players > 0:
-                    # === RULE 1: Filter available players ===
-                    candidates = []
-                    
-                    for player in active_players:
-                        player_id = player['id']
-                        
-                        # Skip if already pinned for this match
-                        if player_id in existing_pinned:
-                            continue
-                            
-                        # RULE 2: Check availability
-                        player_avail = availability.get(player_id, {}).get(match_id, {})
-                        is_available = player_avail.get('is_available', True)  # Default available
-                        
-                        # RULE 3: Check for date conflicts (no double bookings)
-                        date_conflict = False
-                        if match_date:
-                            # Check if player is already assigned to another match on same date
-                            cursor.execute('''
-                                SELECT COUNT(*) as conflicts FROM match_planning mp
-                                JOIN matches m ON mp.match_id = m.id
-                                WHERE mp.planning_version_id = 1 
-                                AND mp.player_id = %s 
-                                AND m.match_date = %s
-                                AND m.id != %s
-                            ''', (player_id, match_date, match_id))
-                            conflicts = cursor.fetchone()['conflicts']
-                            date_conflict = conflicts > 0
-                        
-                        if is_available and not date_conflict:
-                            # Calculate recent play penalty (more recent = higher penalty)
-                            recent_matches = recent_matches_by_player[player_id]
-                            recent_penalty = len(recent_matches)  # 0-3 penalty based on recent matches
-
-                            # Spacing penalty to avoid consecutive or near-consecutive appearances
-                            lp = last_play_idx.get(player_id)
-                            if lp is None:
-                                spacing_penalty = 0
-                            else:
-                                gap = idx - lp
-                                # penalize if played very recently (gap 1->2, 2->1)
-                                spacing_penalty = 2 if gap <= 1 else (1 if gap == 2 else 0)
-                            
-                            candidates.append({
-                                'player': player,
-                                'match_count': player_match_counts[player_id],
-                                'home_count': player_home_counts[player_id],
-                                'away_count': player_away_counts[player_id],
-                                'recent_penalty': recent_penalty,
-                                'spacing_penalty': spacing_penalty,
-                                'available': True
-                            })
-                        else:
-                            print(f"         ❌ {player['name']}: {'unavailable' if not is_available else 'date conflict'}")
-                    
-                    print(f"      ✅ Available candidates: {len(candidates)}")
-
-                    # === NEW: PARTNER PRIORITY SELECTION ===
-                    selected_candidates = []
-                    selected_ids = set()
-                    remaining_needed = needed_players
-
-                    # Build quick index by player id for candidates
-                    candidates_by_id = {c['player']['id']: c for c in candidates}
-
-                    # 6a. Add partners of pinned players first (if both prefer together and partner is available)
-                    for pinned_id in existing_pinned:
-                        if remaining_needed <= 0:
-                            break
-                        pinned_player = players_by_id.get(pinned_id)
-                        if not pinned_player:
-                            continue
-                        partner_id = pinned_player.get('partner_id')
-                        if not partner_id or partner_id in existing_pinned:
-                            continue
-                        partner = players_by_id.get(partner_id)
-                        # Both should prefer playing together
-                        if partner and pinned_player.get('prefer_partner_together', True) and partner.get('prefer_partner_together', True):
-                            # Partner must be an eligible candidate for this match
-                            cand = candidates_by_id.get(partner_id)
-                            # FAIRNESS FIRST: don't exceed cap (both global cap and progressive cap) and avoid back-to-back if possible
-                            lp_partner = last_play_idx.get(partner_id)
-                            gap_ok = (lp_partner is None) or ((idx - lp_partner) >= 2)  # prefer at least one match between
-                            within_cap = fairness_counts.get(partner_id, 0) < max_per_player_target
-                            within_progress = fairness_counts.get(partner_id, 0) < allowed_now_cap
-                            if cand and partner_id not in selected_ids and within_cap and (within_progress or remaining_needed >= (4 - len(existing_pinned))) and gap_ok:
-                                selected_candidates.append(cand)
-                                selected_ids.add(partner_id)
-                                remaining_needed -= 1
-                                fairness_counts[partner_id] = fairness_counts.get(partner_id, 0) + 1
-                                print(f"         🤝 Added partner of pinned: {partner.get('name')} (for {pinned_player.get('name')})")
-
-                    # 6b. Form partner pairs among remaining candidates (both prefer together)
-                    if remaining_needed > 0:
-                        # Collect pair options (avoid duplicates)
-                        pairs = []  # each item: (combined_score, (cand_a, cand_b))
-                        seen_pairs = set()
-                        for cid, cand in candidates_by_id.items():
-                            if cid in selected_ids:
-                                continue
-                            player = cand['player']
-                            partner_id = player.get('partner_id')
-                            if not partner_id:
-                                continue
-                            if partner_id in existing_pinned:
-                                # Partner already pinned; this case handled earlier
-                                continue
-                            # Both sides should be candidates and prefer together
-                            partner_cand = candidates_by_id.get(partner_id)
-                            partner_player = players_by_id.get(partner_id)
-                            if not partner_cand or not partner_player:
-                                continue
-                            if not (player.get('prefer_partner_together', True) and partner_player.get('prefer_partner_together', True)):
-                                continue
-                            # FAIRNESS FIRST: skip pairs that would break caps
-                            if not (fairness_counts.get(cid, 0) < max_per_player_target and fairness_counts.get(partner_id, 0) < max_per_player_target):
-                                continue
-                            # Progressive cap and spacing: avoid pairing if any of them just played last match
-                            lp_a = last_play_idx.get(cid)
-                            lp_b = last_play_idx.get(partner_id)
-                            if (lp_a is not None and (idx - lp_a) <= 1) or (lp_b is not None and (idx - lp_b) <= 1):
-                                continue
-                            if not (fairness_counts.get(cid, 0) < allowed_now_cap and fairness_counts.get(partner_id, 0) < allowed_now_cap):
-                                continue
-                            # Create an order-independent key to avoid duplicates
-                            pair_key = tuple(sorted([cid, partner_id]))
-                            if pair_key in seen_pairs:
-                                continue
-                            seen_pairs.add(pair_key)
-                            # Compute a fairness-oriented combined score (lower is better)
-                            combined_score = (
-                                cand['match_count'] + partner_cand['match_count'] +
-                                recent_weight * (cand['recent_penalty'] + partner_cand['recent_penalty']) +
-                                spacing_weight * (cand.get('spacing_penalty', 0) + partner_cand.get('spacing_penalty', 0))
-                            )
-                            # Add synergy penalty: how often A-B have been together + with currently pinned players
-                            a_id = cid
-                            b_id = partner_id
-                            key_ab = (a_id, b_id) if a_id < b_id else (b_id, a_id)
-                            synergy = pair_cooccur[key_ab]
-                            for pid in existing_pinned:
-                                k1 = (a_id, pid) if a_id < pid else (pid, a_id)
-                                k2 = (b_id, pid) if b_id < pid else (pid, b_id)
-                                synergy += pair_cooccur[k1] + pair_cooccur[k2]
-                            # Prefer true partners slightly more often: lighter synergy penalty and apply bonus
-                            combined_score += (synergy_weight_for_partners if players_by_id.get(a_id, {}).get('partner_id') == b_id else synergy_weight) * synergy
-                            if players_by_id.get(a_id, {}).get('partner_id') == b_id and \
-                               players_by_id.get(a_id, {}).get('prefer_partner_together', True) and \
-                               players_by_id.get(b_id, {}).get('prefer_partner_together', True):
-                                combined_score -= partner_pair_bonus
-                            pairs.append((combined_score, (cand, partner_cand)))
-
-                        # Sort pairs by best combined score
-                        pairs.sort(key=lambda x: x[0])
-
-                        for _, (cand_a, cand_b) in pairs:
-                            if remaining_needed < 2:
-                                break
-                            a_id = cand_a['player']['id']
-                            b_id = cand_b['player']['id']
-                            if a_id in selected_ids or b_id in selected_ids:
-                                continue
-                            selected_candidates.extend([cand_a, cand_b])
-                            selected_ids.update([a_id, b_id])
-                            remaining_needed -= 2
-                            fairness_counts[a_id] = fairness_counts.get(a_id, 0) + 1
-                            fairness_counts[b_id] = fairness_counts.get(b_id, 0) + 1
-                            print(f"         👥 Added partner pair: {cand_a['player']['name']} + {cand_b['player']['name']}")
-
-                    # === RULE 4: Sort by fairness with VARIATIE! for remaining slots ===
-                    remaining_candidates_all = [c for c in candidates if c['player']['id'] not in selected_ids]
-                    # Apply fairness caps: strong preference to progressive cap, then global cap
-                    under_progressive = [c for c in remaining_candidates_all if fairness_counts.get(c['player']['id'], 0) < allowed_now_cap]
-                    under_global = [c for c in remaining_candidates_all if fairness_counts.get(c['player']['id'], 0) < max_per_player_target]
-                    # Start with progressive set; if too small, use global; else fallback to all
-                    remaining_candidates = under_progressive if len(under_progressive) >= remaining_needed else (under_global if len(under_global) >= remaining_needed else remaining_candidates_all)
-
-                    if len(remaining_candidates) > remaining_needed and remaining_needed > 0:
-                        # Group candidates by combined score (match_count + recent_penalty + spacing + synergy)
-                        candidates_by_score = {}
-                        for c in remaining_candidates:
-                            # Combined score: total matches + recent + spacing + synergy; include partner bonus if partner already present
-                            pid_c = c['player']['id']
-                            synergy = 0
-                            partner_bonus = 0
-                            partner_id = players_by_id.get(pid_c, {}).get('partner_id')
-                            for pid in list(selected_ids) + list(existing_pinned):
-                                key = (pid_c, pid) if pid_c < pid else (pid, pid_c)
-                                synergy += pair_cooccur[key]
-                                if partner_id and pid == partner_id and \
-                                   players_by_id.get(pid_c, {}).get('prefer_partner_together', True) and \
-                                   players_by_id.get(partner_id, {}).get('prefer_partner_together', True):
-                                    partner_bonus += partner_with_selected_bonus
-                            # Lighter synergy penalty if the partner is present (true partners)
-                            effective_synergy_weight = synergy_weight_for_partners if partner_id and partner_id in (list(selected_ids) + list(existing_pinned)) else synergy_weight
-                            score = c['match_count'] + (c['recent_penalty'] * recent_weight) + (c.get('spacing_penalty', 0) * spacing_weight) + (effective_synergy_weight * synergy) - partner_bonus
-                            score_key = round(score, 1)
-                            
-                            if score_key not in candidates_by_score:
-                                candidates_by_score[score_key] = []
-                            candidates_by_score[score_key].append(c)
-                        
-                        # Select with variatie: prioritize lower scores, add randomness
-                        sorted_scores = sorted(candidates_by_score.keys())
-                        
-                        print(f"         📊 Candidate distribution by score: {[(s, len(candidates_by_score[s])) for s in sorted_scores]}")
-                        
-                        for score in sorted_scores:
-                            group = candidates_by_score[score]
-                            if remaining_needed <= 0:
-                                break
-                            
-                            # Add variatie: shuffle within same score group
-                            random.shuffle(group)
-                            
-                            # For lowest score: prefer more selections
-                            if score == sorted_scores[0]:  # Best (lowest) score
-                                take = min(remaining_needed, len(group))
-                            else:
-                                # Gradual reduction for higher scores
-                                reduction_factor = 0.7  # Take 70% from higher score groups
-                                max_take = max(1, int(remaining_needed * reduction_factor)) if remaining_needed > 1 else remaining_needed
-                                take = min(max_take, len(group), remaining_needed)
-                            
-                            # Secondary sort: balance home/away, then random for variatie
-                            group.sort(key=lambda c: (
-                                abs(c['home_count'] - c['away_count']) if is_home else -abs(c['home_count'] - c['away_count']),
-                                random.random()  # Extra randomness for variatie!
-                            ))
-                            
-                            selected_candidates.extend(group[:take])
-                            selected_ids.update([x['player']['id'] for x in group[:take]])
-                            for x in group[:take]:
-                                fairness_counts[x['player']['id']] = fairness_counts.get(x['player']['id'], 0) + 1
-                            remaining_needed -= take
-                            
-                            print(f"         🎲 From {len(group)} players with score {score}: selected {take}")
-                    else:
-                        # Not enough candidates or exact fit - take what's left up to remaining_needed
-                        if remaining_needed > 0:
-                            # Prefer under-cap, then if still needed, allow over-cap with best fairness
-                            # Sort remaining by score including synergy with pinned/selected
-                            def compute_score(c):
-                                pid_c = c['player']['id']
-                                synergy = 0
-                                partner_bonus = 0
-                                partner_id = players_by_id.get(pid_c, {}).get('partner_id')
-                                for pid in list(selected_ids) + list(existing_pinned):
-                                    key = (pid_c, pid) if pid_c < pid else (pid, pid_c)
-                                    synergy += pair_cooccur[key]
-                                    if partner_id and pid == partner_id and \
-                                       players_by_id.get(pid_c, {}).get('prefer_partner_together', True) and \
-                                       players_by_id.get(partner_id, {}).get('prefer_partner_together', True):
-                                        partner_bonus += partner_with_selected_bonus
-                                effective_synergy_weight = synergy_weight_for_partners if partner_id and partner_id in (list(selected_ids) + list(existing_pinned)) else synergy_weight
-                                return c['match_count'] + (c['recent_penalty'] * recent_weight) + (c.get('spacing_penalty', 0) * spacing_weight) + (effective_synergy_weight * synergy) - partner_bonus
-                            remaining_candidates.sort(key=compute_score)
-                            take_from_under = min(remaining_needed, len(remaining_candidates))
-                            chosen = remaining_candidates[:take_from_under]
-                            selected_candidates.extend(chosen)
-                            selected_ids.update([x['player']['id'] for x in chosen])
-                            for x in chosen:
-                                fairness_counts[x['player']['id']] = fairness_counts.get(x['player']['id'], 0) + 1
-                            remaining_needed -= take_from_under
-                            if remaining_needed > 0:
-                                # Allow picking from all remaining ignoring cap, choose by lowest match_count
-                                overflow_pool = [c for c in remaining_candidates_all if c['player']['id'] not in selected_ids]
-                                overflow_pool.sort(key=compute_score)
-                                take_overflow = min(remaining_needed, len(overflow_pool))
-                                selected_candidates.extend(overflow_pool[:take_overflow])
-                                selected_ids.update([x['player']['id'] for x in overflow_pool[:take_overflow]])
-                                for x in overflow_pool[:take_overflow]:
-                                    fairness_counts[x['player']['id']] = fairness_counts.get(x['player']['id'], 0) + 1
-                                remaining_needed -= take_overflow
-                    
-                    # FINAL BACKFILL: ensure we reach 4 if enough available candidates exist
-                    missing = max(0, 4 - (len(existing_pinned) + len(selected_candidates)))
-                    if missing > 0:
-                        # Take from any remaining eligible candidates (ignoring fairness/partner), best fairness-first
-                        leftovers = [c for c in candidates if c['player']['id'] not in selected_ids]
-                        if len(leftovers) >= missing:
-                            def compute_score(c):
-                                pid_c = c['player']['id']
-                                synergy = 0
-                                partner_bonus = 0
-                                partner_id = players_by_id.get(pid_c, {}).get('partner_id')
-                                for pid in list(selected_ids) + list(existing_pinned):
-                                    key = (pid_c, pid) if pid_c < pid else (pid, pid_c)
-                                    synergy += pair_cooccur[key]
-                                    if partner_id and pid == partner_id and \
-                                       players_by_id.get(pid_c, {}).get('prefer_partner_together', True) and \
-                                       players_by_id.get(partner_id, {}).get('prefer_partner_together', True):
-                                        partner_bonus += partner_with_selected_bonus
-                                effective_synergy_weight = synergy_weight_for_partners if partner_id and partner_id in (list(selected_ids) + list(existing_pinned)) else synergy_weight
-                                return c['match_count'] + (c['recent_penalty'] * recent_weight) + (c.get('spacing_penalty', 0) * spacing_weight) + (effective_synergy_weight * synergy) - partner_bonus
-                            leftovers.sort(key=compute_score)
-                            add = leftovers[:missing]
-                            selected_candidates.extend(add)
-                            selected_ids.update([x['player']['id'] for x in add])
-                            for x in add:
-                                fairness_counts[x['player']['id']] = fairness_counts.get(x['player']['id'], 0) + 1
-                            missing = 0
-
-                    # Quartet diversity memory: avoid repeating exact same quartet as in last few matches
-                    team_ids_preview = list(existing_pinned) + [c['player']['id'] for c in selected_candidates]
-                    if len(team_ids_preview) == 4:
-                        current_team_set = frozenset(team_ids_preview)
-                        if current_team_set in recent_quartets:
-                            print(f"         🔁 Quartet matches one of the last {quartet_memory_size} lineups; trying to diversify...")
-                            # Try a soft swap: replace one selected (non-pinned) with an alternative candidate
-                            leftovers = [c for c in candidates if c['player']['id'] not in selected_ids]
-
-                            # Scoring helper reused from fairness logic with synergy
-                            def _compute_score(c):
-                                pid_c = c['player']['id']
-                                synergy = 0
-                                for pid in list(selected_ids) + list(existing_pinned):
-                                    key = (pid_c, pid) if pid_c < pid else (pid, pid_c)
-                                    synergy += pair_cooccur[key]
-                                return c['match_count'] + (c['recent_penalty'] * 0.5) + (c.get('spacing_penalty', 0) * 1.2) + (0.8 * synergy)
-
-                            leftovers.sort(key=_compute_score)
-
-                            swapped = False
-                            # Iterate alternatives first to find a good new face
-                            for alt in leftovers:
-                                alt_id = alt['player']['id']
-                                # Respect caps when possible
-                                if not (fairness_counts.get(alt_id, 0) < max_per_player_target and fairness_counts.get(alt_id, 0) < allowed_now_cap):
-                                    continue
-                                # Try swapping out one of the currently selected players
-                                for i, rem in enumerate(selected_candidates):
-                                    rem_id = rem['player']['id']
-                                    # Propose new selected id set
-                                    new_selected_ids = (selected_ids - {rem_id}) | {alt_id}
-                                    new_team_set = frozenset(list(existing_pinned) + list(new_selected_ids))
-                                    if new_team_set not in recent_quartets:
-                                        # Apply swap
-                                        selected_candidates[i] = alt
-                                        selected_ids.remove(rem_id)
-                                        selected_ids.add(alt_id)
-                                        # Adjust fairness counters for cap accounting within scope
-                                        fairness_counts[rem_id] = max(0, fairness_counts.get(rem_id, 0) - 1)
-                                        fairness_counts[alt_id] = fairness_counts.get(alt_id, 0) + 1
-                                        current_team_set = new_team_set
-                                        print(f"         🔄 Diversity swap: replaced {rem['player']['name']} with {alt['player']['name']}")
-                                        swapped = True
-                                        break
-                                if swapped:
-                                    break
-                            if not swapped:
-                                print("         ℹ️ Kept lineup (no safe swap found within caps)")
-
-                    print(f"      ⭐ Selected {len(selected_candidates)} players:")
-                    
-                    # Add assignments to database
-                    for candidate in selected_candidates:
-                        player = candidate['player']
-                        player_id = player['id']
-                        
-                        cursor.execute('''
-                            INSERT INTO match_planning (planning_version_id, match_id, player_id, is_pinned, actually_played)
-                            VALUES (1, %s, %s, FALSE, FALSE)
-                        ''', (match_id, player_id))
-                        
-                        # Update counters
-                        player_match_counts[player_id] += 1
-                        if is_home:
-                            player_home_counts[player_id] += 1
-                        else:
-                            player_away_counts[player_id] += 1
-                        
-                        # Update recent matches tracking (keep last 3 matches)
-                        recent_matches_by_player[player_id].append(match_id)
-                        if len(recent_matches_by_player[player_id]) > 3:
-                            recent_matches_by_player[player_id].pop(0)  # Remove oldest
-                        
-                        # Update spacing tracker
-                        last_play_idx[player_id] = idx
-                        
-                        total_assignments += 1
-                        print(f"         ✅ {player['name']} (total: {player_match_counts[player_id]}, recent: {len(recent_matches_by_player[player_id])})")
-                    
-                    # Update pair co-occurrence counts for full team (pinned + selected)
-                    team_ids = list(existing_pinned) + [c['player']['id'] for c in selected_candidates]
-                    for i in range(len(team_ids)):
-                        for j in range(i + 1, len(team_ids)):
-                            a, b = team_ids[i], team_ids[j]
-                            key = (a, b) if a < b else (b, a)
-                            pair_cooccur[key] += 1
-
-                    # Add this quartet to the recent memory for diversity tracking
-                    if len(team_ids) == 4:
-                        recent_quartets.append(frozenset(team_ids))
-
-                    # Check for rule violations
-                    total_players = len(existing_pinned) + len(selected_candidates)
-                    if total_players != 4:
-                        rule_violations.append({
-                            'match_id': match_id,
-                            'match_name': f"{home_team} vs {away_team}",
-                            'player_count': total_players,
-                            'issue': f"{'Insufficient players' if total_players < 4 else 'Too many players'}"
-                        })
-                        print(f"      ⚠️ RULE VIOLATION: {total_players} players (should be 4)")
-                
-                regenerated_count += 1
-            
+                    DELETE FROM match_planning
+                    WHERE planning_version_id = 1 AND is_pinned = FALSE AND match_id = ANY(%s)
+                ''', (list(target_match_ids),))
+            else:
+                cursor.execute('''
+                    DELETE FROM match_planning
+                    WHERE planning_version_id = 1 AND match_id = ANY(%s)
+                ''', (list(target_match_ids),))
+
+            insert_planning_rows(cursor, new_rows, on_conflict=None)
             conn.commit()
-            
-            # === STAP 7: FINAL STATISTICS ===
+            data_cache.invalidate('planning')
+
+            # === STAP 6: FINAL STATISTICS ===
+            regenerated_count = result['regenerated_count']
+            total_assignments = result['total_assignments']
+            rule_violations = result['rule_violations']
+            player_match_counts = result['match_counts']
+
             print("\n" + "=" * 80)
             print("📊 REGENERATION COMPLETE - FINAL STATISTICS")
             print("=" * 80)
-            
             print(f"📈 Processed matches: {regenerated_count}")
             print(f"📈 Total new assignments: {total_assignments}")
             print(f"📈 Rule violations: {len(rule_violations)}")
-            
-            print(f"\n� Final player distribution:")
+
+            print("\n👥 Final player distribution:")
             for player in active_players:
                 player_id = player['id']
-                total = player_match_counts[player_id]
-                home = player_home_counts[player_id]
-                away = player_away_counts[player_id]
-                print(f"   {player['name']}: {total} total ({home}H/{away}A)")
-            
+                print(f"   {player['name']}: {player_match_counts[player_id]} total ({result['home_counts'][player_id]}H/{result['away_counts'][player_id]}A)")
+
             if rule_violations:
-                print(f"\n⚠️ RULE VIOLATIONS:")
+                print("\n⚠️ RULE VIOLATIONS:")
                 for violation in rule_violations:
                     print(f"   Match {violation['match_id']} ({violation['match_name']}): {violation['player_count']} players - {violation['issue']}")
-            
-            cursor.close()
-            conn.close()
-            
+
             print("=" * 80)
             print("✅ REGENERATION SUCCESSFULLY COMPLETED")
             print("=" * 80)
-            
+
             return {
                 'success': True,
                 'message': f'Complete planning regenerated! {regenerated_count} matches processed, {total_assignments} new assignments',
                 'regenerated_matches': regenerated_count,
                 'new_assignments': total_assignments,
                 'rule_violations': rule_violations,
-                'player_stats': {p['name']: player_match_counts[p['id']] for p in active_players}
+                'player_stats': {p['name']: player_match_counts[p['id']] for p in active_players},
+                'objective': result['objective'],
+                'restarts_completed': result.get('restarts_completed', 1),
+                'seed': result['seed'],
+                'optimizer': result.get('optimizer'),
+                'solver': result.get('solver'),
+                'cached': cached,
+                'feasibility': feasibility_report,
+                'allocation': result.get('allocation'),
             }
-            
+
         except Exception as e:
+            if conn is not None:
+                conn.rollback()
             print(f"\n❌ REGENERATION FAILED: {e}")
             import traceback
             traceback.print_exc()
             return {'success': False, 'message': f'Regeneration failed: {str(e)}'}
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+
+    @staticmethod
+    def _try_regeneration_lock(cursor):
+        """Take the regeneration lock for this transaction (False when another regeneration holds it)."""
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s) AS locked', (REGENERATION_LOCK_KEY,))
+        return cursor.fetchone()['locked']
+
+    @staticmethod
+    def _state_fingerprint(state):
+        """
+        Vingerafdruk van alle planning-invoer uit _load_planning_state: wedstrijden,
+        actieve spelers (met partnervoorkeur), beschikbaarheid en de huidige planning.
+        """
+        digest = hashlib.sha256()
+        for m in state['all_matches']:
+            digest.update(repr(('m', m['id'], str(m.get('match_date')), bool(m.get('is_home')),
+                                bool(m.get('is_played')), bool(m.get('is_cup_match')))).encode())
+        for p in state['active_players']:
+            digest.update(repr(('p', p['id'], p.get('partner_id'), p.get('prefer_partner_together'))).encode())
+        for pid in sorted(state['availability']):
+            for mid, available in sorted(state['availability'][pid].items()):
+                digest.update(repr(('a', pid, mid, bool(available))).encode())
+        for r in state['planning_rows']:
+            digest.update(repr(('r', r['match_id'], r['player_id'], bool(r['is_pinned']),
+                                bool(r['actually_played']), bool(r['is_active']))).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _player_deltas(before, after, matches, players):
+        """Per speler het aantal (thuis/uit) wedstrijden voor en na een wijziging; alleen spelers die veranderen."""
+        is_home = {m['id']: bool(m.get('is_home')) for m in matches}
+        names = {p['id']: p['name'] for p in players}
+
+        def counts(rows):
+            total, home = {}, {}
+            for mid, pid in rows:
+                total[pid] = total.get(pid, 0) + 1
+                if is_home.get(mid):
+                    home[pid] = home.get(pid, 0) + 1
+            return total, home
+
+        total_before, home_before = counts(before)
+        total_after, home_after = counts(after)
+        deltas = []
+        for pid in sorted(set(total_before) | set(total_after)):
+            tb, ta = total_before.get(pid, 0), total_after.get(pid, 0)
+            hb, ha = home_before.get(pid, 0), home_after.get(pid, 0)
+            if tb == ta and hb == ha:
+                continue
+            deltas.append({
+                'player_id': pid,
+                'name': names.get(pid),
+                'matches_before': tb,
+                'matches_after': ta,
+                'delta': ta - tb,
+                'home_delta': ha - hb,
+                'away_delta': (ta - ha) - (tb - hb),
+            })
+        return deltas
+
+    @staticmethod
+    def _create_preview_table(cursor):
+        """Create the regeneration preview table if it doesn't exist."""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS planning_previews (
+                token TEXT PRIMARY KEY,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                plan_mode TEXT,
+                cutoff_date DATE,
+                seed BIGINT,
+                fingerprint TEXT NOT NULL,
+                changes JSONB NOT NULL
+            )
+        ''')
+
+    @staticmethod
+    def _store_preview(cursor, fingerprint, plan_mode, cutoff_date, seed, changes):
+        """Bewaar de diff van een dry-run onder een nieuw token (verlopen previews worden opgeruimd)."""
+        SinglePlanning._create_preview_table(cursor)
+        cursor.execute(
+            'DELETE FROM planning_previews WHERE created_at < CURRENT_TIMESTAMP - make_interval(mins => %s)',
+            (Config.PREVIEW_MAX_AGE_MINUTES,)
+        )
+        token = secrets.token_urlsafe(16)
+        cursor.execute('''
+            INSERT INTO planning_previews (token, plan_mode, cutoff_date, seed, fingerprint, changes)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING created_at + make_interval(mins => %s) AS expires_at
+        ''', (token, plan_mode, SinglePlanning._parse_cutoff(cutoff_date), seed,
+              fingerprint, Jsonb([list(c) for c in changes]),
+              Config.PREVIEW_MAX_AGE_MINUTES))
+        expires_at = cursor.fetchone()['expires_at']
+
+        matches = {}
+        for change_type, match_id, player_id, *_ in changes:
+            entry = matches.setdefault(match_id, {'match_id': match_id, 'added': [], 'removed': [], 'changed': []})
+            entry[change_type].append(player_id)
+        return {
+            'token': token,
+            'expires_at': expires_at.isoformat(),
+            'matches': [matches[mid] for mid in sorted(matches)],
+        }
+
+    @staticmethod
+    def _write_changes(cursor, changes):
+        """Schrijf een diff (zie _diff_planning) naar match_planning."""
+        removed = [(c[1], c[2]) for c in changes if c[0] == 'removed']
+        if removed:
+            cursor.executemany('''
+                DELETE FROM match_planning
+                WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
+            ''', removed)
+        insert_planning_rows(
+            cursor, [(c[1], c[2], c[5], c[6]) for c in changes if c[0] in ('added', 'changed')],
+            on_conflict='update',
+        )
+
+    @staticmethod
+    def apply_preview(token):
+        """
+        Voer de diff van een eerdere dry-run (preview token) door.
+
+        De diff wordt alleen toegepast als de planning-invoer sinds de preview niet
+        is veranderd; anders is de preview verouderd en moet er een nieuwe komen.
+        De wijziging komt als undo-stap op de stack, net als een gewone regeneratie.
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = get_db_connection(savepoint=True)
+            cursor = conn.cursor()
+            if not SinglePlanning._try_regeneration_lock(cursor):
+                return {'success': False, 'busy': True, 'message': 'Er loopt al een regeneratie, probeer het straks opnieuw'}
+            SinglePlanning._create_preview_table(cursor)
+            cursor.execute('''
+                SELECT * FROM planning_previews
+                WHERE token = %s AND created_at >= CURRENT_TIMESTAMP - make_interval(mins => %s)
+                FOR UPDATE
+            ''', (token, Config.PREVIEW_MAX_AGE_MINUTES))
+            preview = cursor.fetchone()
+            if preview is None:
+                return {'success': False, 'not_found': True, 'message': 'Preview niet gevonden of verlopen'}
+
+            state = SinglePlanning._load_planning_state(cursor)
+            if SinglePlanning._state_fingerprint(state) != preview['fingerprint']:
+                cursor.execute('DELETE FROM planning_previews WHERE token = %s', (token,))
+                conn.commit()
+                return {'success': False, 'stale': True,
+                        'message': 'De planning of beschikbaarheid is sinds de preview gewijzigd; maak een nieuwe preview'}
+
+            changes = [tuple(c) for c in preview['changes']]
+            SinglePlanning._create_undo_tables(cursor)
+            SinglePlanning._create_undo_snapshot(cursor, preview['plan_mode'], preview['cutoff_date'], changes,
+                                                 seed=preview['seed'])
+            SinglePlanning._write_changes(cursor, changes)
+            cursor.execute('DELETE FROM planning_previews WHERE token = %s', (token,))
+            conn.commit()
+            data_cache.invalidate('planning')
+            print(f"✅ Preview {token} applied: {len(changes)} changes")
+            return {'success': True, 'changes': len(changes), 'seed': preview['seed']}
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            print(f"❌ Applying preview failed: {e}")
+            return {'success': False, 'message': f'Applying preview failed: {e}'}
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
 
     @staticmethod
     def _create_undo_tables(cursor):
-        """Create undo snapshot tables if they don't exist."""
+        """Create undo snapshot tables if they don't exist (and upgrade older ones)."""
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS planning_undo_stack (
                 id SERIAL PRIMARY KEY,
@@ -946,36 +1127,115 @@ class SinglePlanning:
                 UNIQUE (undo_id, match_id, player_id)
             )
         ''')
+        # Delta snapshots: 'full' entries (older installations) hold a complete copy,
+        # 'delta' entries only the rows a regeneration added, removed or changed.
+        cursor.execute("ALTER TABLE planning_undo_stack ADD COLUMN IF NOT EXISTS kind TEXT DEFAULT 'full'")
+        cursor.execute("ALTER TABLE planning_undo_stack ADD COLUMN IF NOT EXISTS undone_at TIMESTAMP WITHOUT TIME ZONE")
+        cursor.execute("ALTER TABLE planning_undo_stack ADD COLUMN IF NOT EXISTS changed_rows INTEGER")
+        cursor.execute("ALTER TABLE planning_undo_items ADD COLUMN IF NOT EXISTS change_type TEXT DEFAULT 'full'")
+        cursor.execute("ALTER TABLE planning_undo_items ADD COLUMN IF NOT EXISTS new_is_pinned BOOLEAN")
+        cursor.execute("ALTER TABLE planning_undo_items ADD COLUMN IF NOT EXISTS new_actually_played BOOLEAN")
+        # Seed of the planning run that created the entry (reproducible regeneration)
+        cursor.execute("ALTER TABLE planning_undo_stack ADD COLUMN IF NOT EXISTS seed BIGINT")
 
     @staticmethod
-    def _create_undo_snapshot(cursor, plan_mode, cutoff_date):
-        """Snapshot the entire current single planning (version_id=1) before changes."""
-        # Create stack entry
+    def _diff_planning(before, after):
+        """
+        Compute the changes between two planning states.
+
+        Args:
+            before, after: {(match_id, player_id): (is_pinned, actually_played)}
+
+        Returns:
+            List of (change_type, match_id, player_id, old_pinned, old_played, new_pinned, new_played)
+            with change_type 'added', 'removed' or 'changed'.
+        """
+        changes = []
+        for key, old in before.items():
+            new = after.get(key)
+            if new is None:
+                changes.append(('removed', key[0], key[1], old[0], old[1], None, None))
+            elif tuple(new) != tuple(old):
+                changes.append(('changed', key[0], key[1], old[0], old[1], new[0], new[1]))
+        for key, new in after.items():
+            if key not in before:
+                changes.append(('added', key[0], key[1], None, None, new[0], new[1]))
+        return changes
+
+    @staticmethod
+    def _create_undo_snapshot(cursor, plan_mode, cutoff_date, changes, seed=None):
+        """Store the changes a regeneration makes as a delta undo entry (with its seed)."""
+        # A new change invalidates anything that could still be redone
+        cursor.execute('DELETE FROM planning_undo_stack WHERE undone_at IS NOT NULL')
         cursor.execute('''
-            INSERT INTO planning_undo_stack (plan_mode, cutoff_date, note)
-            VALUES (%s, %s, %s)
+            INSERT INTO planning_undo_stack (plan_mode, cutoff_date, note, kind, changed_rows, seed)
+            VALUES (%s, %s, %s, 'delta', %s, %s)
             RETURNING id
-        ''', (plan_mode, cutoff_date if isinstance(cutoff_date, str) or cutoff_date is None else getattr(cutoff_date, 'isoformat', lambda: cutoff_date)(), 'Auto snapshot before regeneration'))
+        ''', (plan_mode, cutoff_date if isinstance(cutoff_date, str) or cutoff_date is None else getattr(cutoff_date, 'isoformat', lambda: cutoff_date)(), 'Auto snapshot before regeneration', len(changes), seed))
         undo_id = cursor.fetchone()['id']
-        # Copy all current assignments into items
-        cursor.execute('''
-            INSERT INTO planning_undo_items (undo_id, match_id, player_id, is_pinned, actually_played)
-            SELECT %s, mp.match_id, mp.player_id, mp.is_pinned, mp.actually_played
-            FROM match_planning mp
-            WHERE mp.planning_version_id = 1
-        ''', (undo_id,))
+        if changes:
+            cursor.executemany('''
+                INSERT INTO planning_undo_items
+                    (undo_id, change_type, match_id, player_id, is_pinned, actually_played, new_is_pinned, new_actually_played)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ''', [(undo_id,) + tuple(c) for c in changes])
+        SinglePlanning.compact_undo_stack(cursor)
         return undo_id
 
+    @staticmethod
+    def compact_undo_stack(cursor):
+        """Apply the undo retention (Config.UNDO_MAX_ENTRIES / UNDO_MAX_AGE_DAYS).
+
+        Each delta only depends on the state after the older entries, so dropping
+        the oldest entries never breaks undoing the newer ones.
+        """
+        cursor.execute('''
+            DELETE FROM planning_undo_stack
+            WHERE id NOT IN (SELECT id FROM planning_undo_stack ORDER BY id DESC LIMIT %s)
+               OR created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        ''', (max(1, Config.UNDO_MAX_ENTRIES), Config.UNDO_MAX_AGE_DAYS))
+        return cursor.rowcount
+
+    @staticmethod
+    def _apply_undo_delta(cursor, undo_id, direction):
+        """Apply a delta entry backwards ('undo') or forwards ('redo'); returns rows touched."""
+        drop_type, restore_types = ('added', ('removed', 'changed')) if direction == 'undo' else ('removed', ('added', 'changed'))
+        flags = 'ui.is_pinned, ui.actually_played' if direction == 'undo' else 'ui.new_is_pinned, ui.new_actually_played'
+        cursor.execute('''
+            DELETE FROM match_planning mp
+            USING planning_undo_items ui
+            WHERE ui.undo_id = %s AND ui.change_type = %s
+              AND mp.planning_version_id = 1
+              AND mp.match_id = ui.match_id AND mp.player_id = ui.player_id
+        ''', (undo_id, drop_type))
+        touched = cursor.rowcount
+        # Skip rows whose match or player has been deleted in the meantime
+        cursor.execute(f'''
+            INSERT INTO match_planning (planning_version_id, match_id, player_id, is_pinned, actually_played)
+            SELECT 1, ui.match_id, ui.player_id, {flags}
+            FROM planning_undo_items ui
+            JOIN matches m ON m.id = ui.match_id
+            JOIN players p ON p.id = ui.player_id
+            WHERE ui.undo_id = %s AND ui.change_type = ANY(%s)
+            ON CONFLICT (planning_version_id, match_id, player_id)
+            DO UPDATE SET is_pinned = EXCLUDED.is_pinned, actually_played = EXCLUDED.actually_played
+        ''', (undo_id, list(restore_types)))
+        return touched + cursor.rowcount
+
     @staticmethod
     def undo_last_snapshot():
-        """Restore the most recent snapshot of the single planning and pop it from the stack."""
+        """Undo the most recent regeneration by applying its delta backwards."""
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
             SinglePlanning._create_undo_tables(cursor)
 
-            # Get latest snapshot
-            cursor.execute('SELECT id FROM planning_undo_stack ORDER BY id DESC LIMIT 1')
+            # Get latest snapshot that has not been undone yet
+            cursor.execute('''
+                SELECT id, kind FROM planning_undo_stack
+                WHERE undone_at IS NULL
+                ORDER BY id DESC LIMIT 1
+            ''')
             row = cursor.fetchone()
             if not row:
                 cursor.close()
@@ -983,26 +1243,242 @@ class SinglePlanning:
                 return {'success': False, 'message': 'Geen undo beschikbaar'}
             undo_id = row['id']
 
-            # Clear current planning and restore from snapshot
-            cursor.execute('DELETE FROM match_planning WHERE planning_version_id = 1')
-            cursor.execute('''
-                INSERT INTO match_planning (planning_version_id, match_id, player_id, is_pinned, actually_played)
-                SELECT 1, match_id, player_id, is_pinned, actually_played
-                FROM planning_undo_items
-                WHERE undo_id = %s
-            ''', (undo_id,))
-            restored = cursor.rowcount
-
-            # Pop the snapshot
-            cursor.execute('DELETE FROM planning_undo_stack WHERE id = %s', (undo_id,))
+            if row['kind'] == 'delta':
+                restored = SinglePlanning._apply_undo_delta(cursor, undo_id, 'undo')
+                # Keep the entry for redo
+                cursor.execute('UPDATE planning_undo_stack SET undone_at = CURRENT_TIMESTAMP WHERE id = %s', (undo_id,))
+            else:
+                # Full snapshot from before delta undo: clear and restore, then pop it
+                cursor.execute('DELETE FROM match_planning WHERE planning_version_id = 1')
+                cursor.execute('''
+                    INSERT INTO match_planning (planning_version_id, match_id, player_id, is_pinned, actually_played)
+                    SELECT 1, match_id, player_id, is_pinned, actually_played
+                    FROM planning_undo_items
+                    WHERE undo_id = %s
+                ''', (undo_id,))
+                restored = cursor.rowcount
+                cursor.execute('DELETE FROM planning_undo_stack WHERE id = %s', (undo_id,))
             conn.commit()
+            data_cache.invalidate('planning')
             cursor.close()
             conn.close()
             return {'success': True, 'restored': restored}
         except Exception as e:
             return {'success': False, 'message': f'Undo failed: {e}'}
+
+    @staticmethod
+    def redo_last_undo():
+        """Re-apply the most recently undone regeneration."""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            SinglePlanning._create_undo_tables(cursor)
+
+            # Undone entries are always the newest ones; redo them oldest first
+            cursor.execute('''
+                SELECT id FROM planning_undo_stack
+                WHERE undone_at IS NOT NULL AND kind = 'delta'
+                ORDER BY id ASC LIMIT 1
+            ''')
+            row = cursor.fetchone()
+            if not row:
+                cursor.close()
+                conn.close()
+                return {'success': False, 'message': 'Geen redo beschikbaar'}
+            undo_id = row['id']
+
+            reapplied = SinglePlanning._apply_undo_delta(cursor, undo_id, 'redo')
+            cursor.execute('UPDATE planning_undo_stack SET undone_at = NULL WHERE id = %s', (undo_id,))
+            conn.commit()
+            data_cache.invalidate('planning')
+            cursor.close()
+            conn.close()
+            return {'success': True, 'reapplied': reapplied}
+        except Exception as e:
+            return {'success': False, 'message': f'Redo failed: {e}'}
+
+    @staticmethod
+    def _load_season_context(cursor):
+        """
+        Load the current season (unplayed matches) in the shape the local-search
+        functions expect: lineups, pinned players, row flags and plan_kwargs.
+        """
+        state = SinglePlanning._load_planning_state(cursor)
+        unplayed = [m for m in state['all_matches'] if not m.get('is_played', False)]
+        unplayed_ids = {m['id'] for m in unplayed}
+        match_date_by_id = {m['id']: m.get('match_date') for m in state['all_matches']}
+
+        lineups = {}
+        pinned_assignments = {}
+        flags = {}
+        for row in state['planning_rows']:
+            flags[(row['match_id'], row['player_id'])] = (row['is_pinned'], row['actually_played'])
+            if row['match_id'] not in unplayed_ids:
+                continue
+            lineups.setdefault(row['match_id'], []).append(row['player_id'])
+            if row['is_pinned'] and row['is_active']:
+                pinned_assignments.setdefault(row['match_id'], []).append(row['player_id'])
+
+        plan_kwargs = {
+            'target_matches': unplayed,
+            'active_players': state['active_players'],
+            'availability': state['availability'],
+            'pinned_assignments': pinned_assignments,
+            'date_bookings': planner.build_date_bookings(
+                ((r['match_id'], r['player_id']) for r in state['planning_rows']), match_date_by_id
+            ),
+        }
+        return {
+            'unplayed': unplayed,
+            'lineups': lineups,
+            'flags': flags,
+            'plan_kwargs': plan_kwargs,
+        }
+
+    @staticmethod
+    def repair_planning(changed_cells, neighbourhood=None, time_budget=None):
+        """
+        Herstel de planning incrementeel na gewijzigde (speler, wedstrijd) cellen.
+
+        Alleen wedstrijden waarvan de opstelling door de wijziging ongeldig is
+        (onbeschikbare of dubbel geboekte niet-gepinde speler, geen 4 spelers)
+        worden opnieuw ingevuld, samen met een kleine omgeving
+        (app.services.local_search.repair_plan). De eerlijke verdeling wordt over
+        het hele seizoen bewaakt. Wijzigingen komen als undo-stap op de stack.
+
+        Args:
+            changed_cells: iterable van (player_id, match_id)
+            neighbourhood: aantal buurwedstrijden aan elke kant (default Config.REPAIR_NEIGHBOURHOOD)
+            time_budget: maximale zoektijd in seconden (default Config.REPAIR_TIME_BUDGET)
+        """
+        changed_cells = [(int(pid), int(mid)) for pid, mid in changed_cells]
+        if not changed_cells:
+            return {'success': True, 'changes': 0, 'repaired_matches': [], 'affected_matches': []}
+        neighbourhood = Config.REPAIR_NEIGHBOURHOOD if neighbourhood is None else max(0, int(neighbourhood))
+        time_budget = Config.REPAIR_TIME_BUDGET if time_budget is None else float(time_budget)
+
+        conn = None
+        cursor = None
+        try:
+            conn = get_db_connection(savepoint=True)
+            cursor = conn.cursor()
+            season = SinglePlanning._load_season_context(cursor)
+            lineups = season['lineups']
+            flags = season['flags']
+            repair = local_search.repair_plan(
+                season['plan_kwargs'], season['unplayed'], lineups, changed_cells,
+                neighbourhood=neighbourhood, time_budget=time_budget,
+            )
+
+            before = {}
+            after = {}
+            for mid, new_lineup in repair['lineups'].items():
+                for pid in lineups.get(mid, []):
+                    before[(mid, pid)] = flags[(mid, pid)]
+                for pid in new_lineup:
+                    after[(mid, pid)] = flags.get((mid, pid), (False, False))
+            changes = SinglePlanning._diff_planning(before, after)
+
+            if changes:
+                SinglePlanning._create_undo_tables(cursor)
+                SinglePlanning._create_undo_snapshot(cursor, 'repair', None, changes)
+                SinglePlanning._write_changes(cursor, changes)
+            conn.commit()
+            if changes:
+                data_cache.invalidate('planning')
+
+            print(f"🩹 Repair: {len(repair['invalid_matches'])} invalid, {len(repair['affected_matches'])} re-solved, "
+                  f"{len(changes)} changes (objective {repair['objective_before']} → {repair['objective_after']})")
+            return {
+                'success': True,
+                'changes': len(changes),
+                'repaired_matches': repair['invalid_matches'],
+                'affected_matches': repair['affected_matches'],
+                'objective_before': repair['objective_before'],
+                'objective_after': repair['objective_after'],
+            }
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            print(f"❌ Repair failed: {e}")
+            return {'success': False, 'message': f'Repair failed: {e}'}
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
     
     
+    @staticmethod
+    def suggest_substitutes(match_id, player_id, limit=5, apply=False, substitute_id=None):
+        """
+        Rangschik vervangers voor een speler in een wedstrijd (en pas optioneel toe).
+
+        De ranking gebruikt dezelfde seizoensdoelfunctie als regenerate_planning
+        (eerlijkheid, thuis/uit, spacing, synergie en partners) op de tellers uit
+        één bulk-load (app.services.local_search.rank_substitutes).
+
+        Args:
+            match_id, player_id: de plek die vervangen moet worden
+            limit: aantal suggesties
+            apply: als True, vervang de speler direct door de beste (of substitute_id)
+            substitute_id: optionele gekozen vervanger bij apply
+        """
+        conn = None
+        cursor = None
+        try:
+            conn = get_db_connection(savepoint=True)
+            cursor = conn.cursor()
+            season = SinglePlanning._load_season_context(cursor)
+            if (match_id, player_id) not in season['flags']:
+                return {'success': False, 'message': 'Speler is niet ingepland voor deze wedstrijd'}
+            if match_id not in {m['id'] for m in season['unplayed']}:
+                return {'success': False, 'message': 'Wedstrijd is al gespeeld'}
+
+            suggestions = local_search.rank_substitutes(
+                season['plan_kwargs'], season['unplayed'], season['lineups'], match_id, player_id,
+                limit=None if (apply and substitute_id) else limit,
+            )
+            result = {'success': True, 'suggestions': suggestions[:limit] if limit else suggestions}
+            if not apply:
+                return result
+
+            if substitute_id is not None:
+                chosen = next((s for s in suggestions if s['player_id'] == int(substitute_id)), None)
+                if chosen is None:
+                    return {'success': False, 'message': 'Gekozen vervanger is niet beschikbaar of al ingepland'}
+            elif suggestions:
+                chosen = suggestions[0]
+            else:
+                return {'success': False, 'message': 'Geen geschikte vervanger gevonden', 'suggestions': []}
+
+            is_pinned, actually_played = season['flags'][(match_id, player_id)]
+            changes = [
+                ('removed', match_id, player_id, is_pinned, actually_played, None, None),
+                ('added', match_id, chosen['player_id'], None, None, is_pinned, False),
+            ]
+            SinglePlanning._create_undo_tables(cursor)
+            SinglePlanning._create_undo_snapshot(cursor, 'substitute', None, changes)
+            cursor.execute('''
+                DELETE FROM match_planning
+                WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
+            ''', (match_id, player_id))
+            insert_planning_rows(cursor, [(match_id, chosen['player_id'], is_pinned, False)])
+            conn.commit()
+            data_cache.invalidate('planning')
+            print(f"🔁 Substitute: match {match_id}: {player_id} → {chosen['player_id']} (Δ {chosen['objective_delta']})")
+            result['applied'] = chosen
+            return result
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            return {'success': False, 'message': f'Substitute failed: {e}'}
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+
     @staticmethod
     def _select_players_smart(available_players, player_match_counts, match, num_players):
         """
@@ -1018,14 +1494,12 @@ class SinglePlanning:
             return available_players
         
         # Rule 1: Check availability (if available)
-        available_for_match = []
-        for player in available_players:
+        matrix = availability.get_matrix()
+        available_for_match = [
+            player for player in available_players
             # Check if player has marked themselves as unavailable
-            availability = Player.get_availability(player['id'], match['id'])
-            is_available = not availability or availability.get('is_available', True)
-            
-            if is_available:
-                available_for_match.append(player)
+            if matrix.is_available(player['id'], match['id'])
+        ]
         
         # If not enough available players, use all available + some unavailable
         if len(available_for_match) < num_players:
@@ -10,7 +10,8 @@ def get_current_user():
         return None
     if getattr(g, '_current_user', None) and g._current_user.get('id') == pid:
         return g._current_user
-    user = Player.get_by_id(pid)
+    # Cached roster: checking the login costs no query on most requests
+    user = Player.get_by_id_cached(pid)
     g._current_user = user
     return user
 
@@ -26,6 +26,14 @@ class Config:
         'password': url.password
     }
     print(f"🔗 Database: PostgreSQL @ {url.hostname}:{url.port}/{url.path[1:]}")
+
+    # Connection pool (per process / gunicorn worker)
+    DB_POOL_ENABLED = os.environ.get('DB_POOL_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+    DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))  # seconds before a connection is recycled
+    DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
     
     TEAM_NAME = "Sorry voor de overlast"
     TEAM_URL = "https://feeds.teambeheer.nl/web/team?d=36&t=8723&s=25-26"
@@ -38,3 +46,41 @@ class Config:
     MIN_PLAYERS_PER_MATCH = 4
     MAX_PLAYERS_PER_MATCH = 6
     MATCHES_PER_PLAYER_TARGET = 12  # Ongeveer aantal wedstrijden per speler per seizoen
+
+    # Undo history for planning regenerations
+    UNDO_MAX_ENTRIES = int(os.environ.get('UNDO_MAX_ENTRIES', 25))
+    UNDO_MAX_AGE_DAYS = int(os.environ.get('UNDO_MAX_AGE_DAYS', 60))
+
+    # Multi-start regeneration (parallel seeded runs, best plan wins)
+    PLANNER_MAX_RESTARTS = int(os.environ.get('PLANNER_MAX_RESTARTS', 32))
+    PLANNER_MAX_TIME_BUDGET = float(os.environ.get('PLANNER_MAX_TIME_BUDGET', 30))
+    PLANNER_MAX_WORKERS = int(os.environ.get('PLANNER_MAX_WORKERS', 0)) or None  # None = CPU count
+    # Allocation stage: 'greedy' (plan_season) or, opt-in, 'flow' (min-cost flow, exact fairness)
+    PLANNER_ALLOCATION = os.environ.get('PLANNER_ALLOCATION', 'greedy')
+    # Local-search post-optimizer (simulated annealing) time cap in seconds
+    PLANNER_MAX_OPTIMIZE_TIME = float(os.environ.get('PLANNER_MAX_OPTIMIZE_TIME', 10))
+    # Exact 'solver' plan mode (MILP via PuLP/CBC) time limit in seconds
+    PLANNER_SOLVER_TIME_LIMIT = float(os.environ.get('PLANNER_SOLVER_TIME_LIMIT', 10))
+    PLANNER_MAX_SOLVER_TIME_LIMIT = float(os.environ.get('PLANNER_MAX_SOLVER_TIME_LIMIT', 60))
+    # Incremental repair after availability/pin changes
+    REPAIR_NEIGHBOURHOOD = int(os.environ.get('REPAIR_NEIGHBOURHOOD', 1))
+    REPAIR_TIME_BUDGET = float(os.environ.get('REPAIR_TIME_BUDGET', 0.05))
+    PLANNING_AUTO_REPAIR = os.environ.get('PLANNING_AUTO_REPAIR', 'false').lower() in ('1', 'true', 'yes', 'on')
+
+    # Background jobs (planning_jobs table): a worker thread per gunicorn worker
+    # (gunicorn.conf.py) or dev server (run.py); or run `python -m app.services.jobs`
+    # with JOBS_WORKER_ENABLED=false on the web processes
+    JOBS_WORKER_ENABLED = os.environ.get('JOBS_WORKER_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 2.0))
+    JOBS_STALE_AFTER = int(os.environ.get('JOBS_STALE_AFTER', 900))
+    # /planning/api/regenerate queues a job and returns its id (unless 'background': false)
+    PLANNING_BACKGROUND_JOBS = os.environ.get('PLANNING_BACKGROUND_JOBS', 'true').lower() in ('1', 'true', 'yes', 'on')
+    # Regeneration previews (dry run) can be applied with their token for this long
+    PREVIEW_MAX_AGE_MINUTES = int(os.environ.get('PREVIEW_MAX_AGE_MINUTES', 30))
+    # Memoized plans for seeded regenerations (in-process LRU, optionally shared via Postgres)
+    PLAN_CACHE_SIZE = int(os.environ.get('PLAN_CACHE_SIZE', 16))
+    PLAN_CACHE_DB = os.environ.get('PLAN_CACHE_DB', 'false').lower() in ('1', 'true', 'yes', 'on')
+    PLAN_CACHE_DB_MAX_ENTRIES = int(os.environ.get('PLAN_CACHE_DB_MAX_ENTRIES', 200))
+    # Read-through cache of matches and players (invalidated via LISTEN/NOTIFY on data_versions)
+    DATA_CACHE_ENABLED = os.environ.get('DATA_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes', 'on')
+    DATA_CACHE_LISTEN = os.environ.get('DATA_CACHE_LISTEN', 'true').lower() in ('1', 'true', 'yes', 'on')
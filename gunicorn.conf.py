@@ -0,0 +1,19 @@
+"""
+Gunicorn settings (loaded automatically from the working directory).
+
+The job worker thread (app.services.jobs) is started here, once per gunicorn
+worker process after it loaded the app, rather than in create_app(): scripts,
+tests and the gunicorn master that import the app then don't run jobs.
+"""
+
+
+def post_worker_init(worker):
+    from config import Config
+    if Config.JOBS_WORKER_ENABLED:
+        from app.services.jobs import start_worker
+        start_worker(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    from app.services.jobs import stop_worker
+    stop_worker()
@@ -1,5 +1,6 @@
 import os
 from app import create_app
+from config import Config
 
 def create_application():
     """Factory function to create Flask app for Gunicorn"""
@@ -12,4 +13,8 @@ app = create_application()
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('FLASK_ENV') != 'production'
+    # Queued jobs run in this process (only in the reloader's child in debug)
+    if Config.JOBS_WORKER_ENABLED and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        from app.services.jobs import start_worker
+        start_worker(app)
     app.run(debug=debug, host='0.0.0.0', port=port)
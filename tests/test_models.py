@@ -8,7 +8,13 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app.models.player import Player
 # Legacy planning imports removed - single planning system doesn't need these
 from app.models.match import Match
-from app.models.database import get_db_connection
+from app.models.database import get_db_connection, get_pool_stats, insert_planning_rows, init_database
+from app import create_app
+from config import Config
+import time
+from app.services import jobs, availability, data_cache, player_stats
+from app.services.jobs import JobQueue
+from app.services.single_planning import SinglePlanning, REGENERATION_LOCK_KEY
 
 class TestPlayer:
     """Test suite for Player model - PostgreSQL only"""
@@ -123,7 +129,7 @@ class TestDatabaseConnection:
         cursor = conn.cursor()
         
         # Check key tables exist
-        tables_to_check = ['players', 'matches', 'match_planning', 'player_availability']
+        tables_to_check = ['players', 'matches', 'match_planning', 'player_availability', 'data_versions', 'plan_cache']
         
         for table in tables_to_check:
             cursor.execute("""
@@ -135,10 +141,684 @@ class TestDatabaseConnection:
             result = cursor.fetchone()
             exists = result['exists']
             assert exists, f"Table {table} does not exist"
-        
+
         cursor.close()
         conn.close()
 
+    def test_concurrent_init_database(self):
+        """Test that workers booting together can all run the schema setup"""
+        import threading
+        errors = []
+
+        def boot():
+            try:
+                init_database()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=boot) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+
+    def test_pooled_connection_is_reused(self):
+        """Test that closing a pooled connection returns it to the pool"""
+        conn = get_db_connection()
+        conn.close()
+        assert conn.closed
+        before = get_pool_stats()
+        assert before['enabled'] is True
+        assert before['open'] is True
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 as test")
+        assert cursor.fetchone()['test'] == 1
+        cursor.close()
+        conn.close()
+
+        after = get_pool_stats()
+        # Served from the pool: no new connection had to be opened
+        assert after.get('connections_num', 0) == before.get('connections_num', 0)
+        assert after['requests_num'] == before['requests_num'] + 1
+
+    def test_insert_planning_rows_batch(self):
+        """Test the batched match_planning insert with conflict handling"""
+        player_id = Player.create(name="Test Batch Insert")
+        match_id = Match.create("Sorry voor de overlast", "Test Team", "2099-01-01")
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            sent = insert_planning_rows(cursor, [(match_id, player_id)])
+            assert sent == 1
+            # Duplicate with on_conflict='update' overwrites the flags
+            insert_planning_rows(cursor, [(match_id, player_id, True, False)], on_conflict='update')
+            cursor.execute('''
+                SELECT is_pinned FROM match_planning
+                WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
+            ''', (match_id, player_id))
+            rows = cursor.fetchall()
+            assert len(rows) == 1
+            assert rows[0]['is_pinned'] is True
+            assert insert_planning_rows(cursor, []) == 0
+        finally:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+            Match.delete(match_id)
+            Player.delete(player_id)
+
+
+class TestRequestScope:
+    """Test the per-request unit-of-work connection"""
+
+    @pytest.fixture(scope="class")
+    def app(self):
+        return create_app()
+
+    def test_request_shares_one_connection(self, app):
+        """All model calls in a request use one connection, committed with the response"""
+        with app.test_request_context('/'):
+            first = get_db_connection()
+            second = get_db_connection()
+            assert first is second
+            player_id = Player.create(name="Test Request Scope")
+            # Model-level close() is deferred to the teardown handler
+            assert not first.closed
+            # after_request commits the unit of work
+            assert app.process_response(app.response_class()).status_code == 200
+
+        player = Player.get_by_id(player_id)
+        assert player is not None
+        assert player['name'] == "Test Request Scope"
+        Player.delete(player_id)
+
+    def test_request_rolls_back_on_error(self, app):
+        """An unhandled error rolls back everything written during the request"""
+        player_id = None
+        with pytest.raises(RuntimeError):
+            with app.test_request_context('/'):
+                player_id = Player.create(name="Test Request Rollback")
+                raise RuntimeError("boom")
+
+        assert player_id is not None
+        assert Player.get_by_id(player_id) is None
+
+    def _names_like(self, prefix):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT name FROM players WHERE name LIKE %s ORDER BY name', (prefix + '%',))
+        names = [r['name'] for r in cursor.fetchall()]
+        cursor.execute('DELETE FROM players WHERE name LIKE %s', (prefix + '%',))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return names
+
+    def test_rollback_fails_the_request(self):
+        """After a model rolled back the request, the rest is not committed and the client gets an error"""
+        app = create_app()
+
+        @app.route('/_test/rollback')
+        def rollback_midway():
+            Player.create(name="Test Rollback Only A")
+            get_db_connection().rollback()
+            Player.create(name="Test Rollback Only B")
+            return 'ok'
+
+        assert app.test_client().get('/_test/rollback').status_code == 500
+        assert self._names_like("Test Rollback Only") == []
+
+    def test_savepoint_rollback_keeps_the_request(self):
+        """A service rolling back its savepoint only undoes its own work"""
+        app = create_app()
+
+        @app.route('/_test/savepoint')
+        def savepoint_rollback():
+            Player.create(name="Test Savepoint A")
+            conn = get_db_connection(savepoint=True)
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO players (name) VALUES ('Test Savepoint B')")
+            conn.rollback()
+            return 'ok'
+
+        assert app.test_client().get('/_test/savepoint').status_code == 200
+        assert self._names_like("Test Savepoint") == ["Test Savepoint A"]
+
+
+class TestJobQueue:
+    """Test the Postgres-backed background job queue"""
+
+    @pytest.fixture(autouse=True)
+    def no_worker(self):
+        # Claim jobs in the test itself, not in a worker thread
+        jobs.stop_worker()
+        JobQueue.ensure_table()
+        self._clear()
+        yield
+        self._clear()
+
+    def _clear(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM planning_jobs WHERE kind = 'import_players'")
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    def test_one_active_job_per_kind(self):
+        """A second job of the same kind returns the active one until it is finished"""
+        job, created = JobQueue.enqueue('import_players', {'source': 'test'})
+        assert created is True
+        assert job['status'] == 'queued'
+
+        again, created = JobQueue.enqueue('import_players')
+        assert created is False
+        assert again['id'] == job['id']
+
+        claimed = JobQueue.claim_next('test-worker')
+        assert claimed['id'] == job['id']
+        assert claimed['status'] == 'running'
+        assert JobQueue.claim_next('test-worker') is None
+
+        JobQueue.update_progress(job['id'], 40, 'Bezig')
+        assert JobQueue.get(job['id'])['progress'] == 40
+
+        JobQueue.finish(job['id'], result={'success': True, 'imported': 3})
+        done = JobQueue.get(job['id'])
+        assert done['status'] == 'done'
+        assert done['result']['imported'] == 3
+
+        _, created = JobQueue.enqueue('import_players')
+        assert created is True
+
+    def test_claim_skips_locked_jobs(self):
+        """A job locked by another worker's transaction is skipped, not waited on"""
+        job, _ = JobQueue.enqueue('import_players')
+        other = get_db_connection()
+        cursor = other.cursor()
+        try:
+            cursor.execute("SELECT id FROM planning_jobs WHERE id = %s FOR UPDATE", (job['id'],))
+            assert JobQueue.claim_next('test-worker') is None
+        finally:
+            other.rollback()
+            cursor.close()
+            other.close()
+        assert JobQueue.claim_next('test-worker')['id'] == job['id']
+
+    def test_regeneration_is_exclusive(self):
+        """A regeneration returns 'busy' while another one holds the lock"""
+        other = get_db_connection()
+        cursor = other.cursor()
+        try:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (REGENERATION_LOCK_KEY,))
+            result = SinglePlanning.regenerate_planning()
+            assert result['success'] is False
+            assert result['busy'] is True
+        finally:
+            other.rollback()
+            cursor.close()
+            other.close()
+
+    def test_create_app_starts_no_worker(self):
+        """Only gunicorn.conf.py or run.py start a job worker, not the app factory"""
+        create_app()
+        assert jobs._worker is None
+
+    def test_import_routes_queue_jobs(self):
+        """The import buttons queue a job instead of importing inside the request"""
+        app = create_app()
+        client = app.test_client()
+        captain_id = Player.create(name="Test Import Captain", role='captain')
+        try:
+            with client.session_transaction() as sess:
+                sess['player_id'] = captain_id
+            response = client.get('/import_players')
+            assert response.status_code == 302
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, created_by FROM planning_jobs WHERE kind = 'import_players'")
+            jobs_rows = cursor.fetchall()
+            cursor.close()
+            conn.close()
+            assert [(r['status'], r['created_by']) for r in jobs_rows] == [('queued', captain_id)]
+        finally:
+            Player.delete(captain_id)
+
+
+class TestAvailabilityMatrix:
+    """Test the shared, versioned availability matrix"""
+
+    def test_reflects_writes_and_is_cached(self):
+        """The cached matrix is reused until a write bumps the data version"""
+        player_id = Player.create(name="Test Availability Matrix")
+        match_id = Match.create("Sorry voor de overlast", "Test Team", "2099-02-01")
+        try:
+            Player.set_availability(player_id, match_id, True, "pas na 20:00")
+            matrix = availability.get_matrix()
+            assert matrix.status(player_id, match_id) is True
+            assert matrix.entry(player_id, match_id) == {'is_available': True, 'notes': "pas na 20:00"}
+            assert availability.get_matrix() is matrix
+
+            Player.set_availability(player_id, match_id, False)
+            updated = availability.get_matrix()
+            assert updated is not matrix
+            assert updated.version > matrix.version
+            assert Player.get_availability(player_id, match_id) == {'is_available': False, 'notes': None}
+            assert updated.planner_view()[player_id][match_id] is False
+            assert Player.get_availability_stats(player_id)['unavailable'] == 1
+        finally:
+            Match.delete(match_id)
+            Player.delete(player_id)
+
+    def test_bulk_read_and_write(self):
+        """A whole row is written in one statement and read back as a block"""
+        player_id = Player.create(name="Test Availability Bulk")
+        match_ids = [Match.create("Sorry voor de overlast", f"Test Team {i}", f"2099-03-0{i + 1}") for i in range(3)]
+        try:
+            written = Player.set_availability_bulk([
+                (player_id, match_ids[0], True, None),
+                (player_id, match_ids[1], True, "laat"),
+                (player_id, str(match_ids[1]), False, "toch niet"),
+            ])
+            assert written == 2
+            row = Player.get_availability_bulk([player_id], match_ids)[player_id]
+            assert row == {
+                match_ids[0]: {'is_available': True, 'notes': None},
+                match_ids[1]: {'is_available': False, 'notes': "toch niet"},
+                # Match.create seeds an 'unavailable' answer for active players
+                match_ids[2]: {'is_available': False, 'notes': None},
+            }
+            assert Player.set_availability_bulk([]) == 0
+        finally:
+            for match_id in match_ids:
+                Match.delete(match_id)
+            Player.delete(player_id)
+
+    def test_rolled_back_version_is_not_reused(self):
+        """A version seen in a rolled-back transaction never comes back with other data"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE player_availability SET notes = notes WHERE false")
+            inside = availability.get_matrix(cursor).version
+        finally:
+            conn.rollback()
+            cursor.close()
+            conn.close()
+        assert availability.get_matrix().version != inside
+
+    def test_rolled_back_request_does_not_replace_cache(self):
+        """A matrix built on a request's uncommitted availability writes is not shared"""
+        app = create_app()
+        player_id = Player.create(name="Test Matrix Rollback")
+        match = Match.get_all()[0]
+        try:
+            with pytest.raises(RuntimeError):
+                with app.test_request_context('/'):
+                    Player.set_availability(player_id, match['id'], False)
+                    assert availability.get_matrix().status(player_id, match['id']) is False
+                    raise RuntimeError("boom")
+            matrix = availability.get_matrix()
+            assert matrix.status(player_id, match['id']) is None
+            # The committed matrix is cached again
+            assert availability.get_matrix() is matrix
+        finally:
+            Player.delete(player_id)
+
+
+class TestDataCache:
+    """Test the read-through cache of matches and players"""
+
+    def _rename_elsewhere(self, player_id, name):
+        # A write that bypasses the models, like another worker process would
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('UPDATE players SET name = %s WHERE id = %s', (name, player_id))
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    def _names(self):
+        return {p['name'] for p in Player.get_all()}
+
+    def test_model_writes_invalidate(self, monkeypatch):
+        """Model writes are visible right away; unchanged reads come from the cache"""
+        # Version checks only: no notifications arriving in between
+        monkeypatch.setattr(Config, 'DATA_CACHE_LISTEN', False)
+        data_cache.stop_listener()
+        player_id = Player.create(name="Test Data Cache")
+        try:
+            assert "Test Data Cache" in self._names()
+            hits = data_cache.stats()['hits']
+            self._names()
+            assert data_cache.stats()['hits'] == hits + 1
+            Player.update(player_id, name="Test Data Cache 2")
+            assert "Test Data Cache 2" in self._names()
+        finally:
+            Player.delete(player_id)
+        assert "Test Data Cache 2" not in self._names()
+
+    def test_notification_invalidates(self):
+        """Writes from elsewhere reach the cache through LISTEN/NOTIFY"""
+        player_id = Player.create(name="Test Data Cache Notify")
+        try:
+            Player.get_all()
+            deadline = time.time() + 10
+            while not data_cache._listening() and time.time() < deadline:
+                time.sleep(0.05)
+            assert data_cache._listening()
+            assert "Test Data Cache Notify" in self._names()
+            self._rename_elsewhere(player_id, "Test Data Cache Notified")
+            deadline = time.time() + 5
+            while "Test Data Cache Notified" not in self._names() and time.time() < deadline:
+                time.sleep(0.05)
+            assert "Test Data Cache Notified" in self._names()
+        finally:
+            Player.delete(player_id)
+
+    def test_version_check_without_listener(self, monkeypatch):
+        """Without the listener every read checks the data version"""
+        monkeypatch.setattr(Config, 'DATA_CACHE_LISTEN', False)
+        data_cache.stop_listener()
+        player_id = Player.create(name="Test Data Cache Version")
+        try:
+            assert "Test Data Cache Version" in self._names()
+            self._rename_elsewhere(player_id, "Test Data Cache Versioned")
+            assert "Test Data Cache Versioned" in self._names()
+        finally:
+            Player.delete(player_id)
+
+    def test_uncommitted_request_writes_are_not_cached(self):
+        """A request reads its own writes, but a rollback leaves nothing in the cache"""
+        app = create_app()
+        with pytest.raises(RuntimeError):
+            with app.test_request_context('/'):
+                Player.create(name="Test Data Cache Rollback")
+                assert "Test Data Cache Rollback" in self._names()
+                raise RuntimeError("boom")
+        assert "Test Data Cache Rollback" not in self._names()
+
+    def test_versioned_value_follows_planning_writes(self, monkeypatch):
+        """A derived value is reused until one of its names changes"""
+        monkeypatch.setattr(Config, 'DATA_CACHE_LISTEN', False)
+        data_cache.stop_listener()
+        names = ('matches', 'planning')
+        loads = []
+
+        def loader(cursor):
+            loads.append(1)
+            return len(loads)
+
+        match = Match.get_all()[0]
+        player_id = Player.create(name="Test Data Cache Planning")
+        try:
+            version, value = data_cache.get_versioned(names, 'test_versioned', loader)
+            assert data_cache.get_versioned(names, 'test_versioned', loader) == (version, value)
+            assert len(loads) == 1
+
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            insert_planning_rows(cursor, [(match['id'], player_id)])
+            conn.commit()
+            cursor.close()
+            conn.close()
+            new_version, new_value = data_cache.get_versioned(names, 'test_versioned', loader)
+            assert new_version != version
+            assert new_value == 2
+        finally:
+            Player.delete(player_id)
+
+    def test_planning_writes_are_not_cached_in_request(self):
+        """Values read after an uncommitted planning write are not cached"""
+        match = Match.get_all()[0]
+        player_id = Player.create(name="Test Data Cache Pin")
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            insert_planning_rows(cursor, [(match['id'], player_id)])
+            conn.commit()
+            cursor.close()
+            conn.close()
+            Player.get_all()
+            deadline = time.time() + 10
+            while not data_cache._listening() and time.time() < deadline:
+                time.sleep(0.05)
+
+            def pinned(cursor):
+                cursor.execute('''
+                    SELECT is_pinned FROM match_planning
+                    WHERE planning_version_id = 1 AND match_id = %s AND player_id = %s
+                ''', (match['id'], player_id))
+                return cursor.fetchone()['is_pinned']
+
+            app = create_app()
+            with pytest.raises(RuntimeError):
+                with app.test_request_context('/'):
+                    SinglePlanning.pin_player(match['id'], player_id, True)
+                    assert data_cache.get_versioned(('planning',), 'test_pin', pinned)[1] is True
+                    raise RuntimeError("boom")
+            assert data_cache.get_versioned(('planning',), 'test_pin', pinned)[1] is False
+        finally:
+            Player.delete(player_id)
+
+
+class TestMatrixPage:
+    """Test the cached planning matrix with ETag / If-None-Match"""
+
+    def test_not_modified_until_availability_changes(self):
+        app = create_app()
+        client = app.test_client()
+        player_id = Player.create(name="Test Matrix ETag")
+        match = Match.get_all()[0]
+        try:
+            with client.session_transaction() as sess:
+                sess['player_id'] = player_id
+
+            first = client.get('/planning/matrix')
+            assert first.status_code == 200
+            etag = first.headers['ETag']
+            assert etag.startswith('W/')
+
+            again = client.get('/planning/matrix', headers={'If-None-Match': etag})
+            assert again.status_code == 304
+            assert again.headers['ETag'] == etag
+
+            Player.set_availability(player_id, match['id'], False)
+            changed = client.get('/planning/matrix', headers={'If-None-Match': etag})
+            assert changed.status_code == 200
+            assert changed.headers['ETag'] != etag
+        finally:
+            Player.delete(player_id)
+
+
+    def test_batch_edit_endpoint(self):
+        """Captains send coalesced clicks as one batch"""
+        app = create_app()
+        client = app.test_client()
+        match = Match.get_all()[0]
+        captain_id = Player.create(name="Test Matrix Batch Captain", role='captain')
+        try:
+            with client.session_transaction() as sess:
+                sess['player_id'] = captain_id
+            assert client.post('/planning/matrix/edit_batch', json={'edits': []}).status_code == 400
+            response = client.post('/planning/matrix/edit_batch', json={'edits': [
+                {'player_id': captain_id, 'match_id': match['id'], 'action': 'cycle'},
+            ]})
+            assert response.status_code == 200
+            data = response.get_json()
+            assert data['success']
+            assert data['cells'][0]['state'] == 'assigned'
+            assert data['players'][str(captain_id)]['total_matches'] == 1
+        finally:
+            Player.delete(captain_id)
+
+
+class TestPlayerStats:
+    """Test the bulk player statistics"""
+
+    def test_matches_per_player_queries(self):
+        """One grouped query gives the same numbers as the per-player queries"""
+        players = Player.get_all()
+        stats = player_stats.get_stats(p['id'] for p in players)
+        assert set(stats) == {p['id'] for p in players}
+        for p in players:
+            assert stats[p['id']]['planning'] == SinglePlanning.get_player_stats(p['id'])
+            assert stats[p['id']]['history'] == Player.get_match_stats(p['id'])
+            assert stats[p['id']]['availability'] == Player.get_availability_stats(p['id'])
+
+    def test_player_without_rows(self):
+        """Players without planning get zeros"""
+        player_id = Player.create(name="Test Player Stats")
+        try:
+            stats = player_stats.get_stats([player_id])[player_id]
+            assert stats['planning']['matches_planned'] == 0
+            assert stats['history']['played'] == 0
+        finally:
+            Player.delete(player_id)
+
+
+class TestPlanningQueries:
+    """Test the batched planning reads"""
+
+    def test_planning_for_matches(self):
+        """One query returns the lineups of many matches, empty lists included"""
+        match_ids = [m['id'] for m in Match.get_all()]
+        batch = SinglePlanning.get_planning_for_matches(match_ids + [-1])
+        assert batch[-1] == []
+        for match_id in match_ids:
+            rows = batch[match_id]
+            assert [r['player_id'] for r in rows] == [r['player_id'] for r in SinglePlanning.get_match_planning(match_id)]
+            assert all(r['match_id'] == match_id for r in rows)
+
+    def test_cycle_matrix_cell(self):
+        """One statement cycles niet -> wel -> pinned -> niet with matching counts"""
+        match = Match.get_all()[0]
+        player_id = Player.create(name="Test Matrix Cell")
+        try:
+            before = len(SinglePlanning.get_match_planning(match['id']))
+            expected = [('assigned', 1, 0), ('pinned', 1, 1), ('not_assigned', 0, 0)]
+            for state, total, pinned in expected:
+                result = SinglePlanning.cycle_matrix_cell(match['id'], player_id)
+                assert result['state'] == state
+                assert result['stats']['total_matches'] == total
+                assert result['stats']['total_pinned'] == pinned
+                assert result['stats']['total_played'] == 0
+                planning = SinglePlanning.get_match_planning(match['id'])
+                assert result['match_player_count'] == len(planning) == before + total
+                assert result['rule_violation'] == (len(planning) > 4)
+        finally:
+            Player.delete(player_id)
+
+    def test_matrix_edits_batch(self):
+        """A batch applies its edits in order and reports every touched player and match once"""
+        first, second = Match.get_all()[:2]
+        player_id = Player.create(name="Test Matrix Batch")
+        try:
+            result = SinglePlanning.apply_matrix_edits([
+                (player_id, first['id'], 'cycle'),
+                (player_id, first['id'], 'cycle'),
+                (player_id, second['id'], 'assign'),
+                (player_id, second['id'], 'cycle'),
+                (player_id, second['id'], 'cycle'),
+            ])
+            states = {c['match_id']: c['state'] for c in result['cells']}
+            assert states == {first['id']: 'pinned', second['id']: 'not_assigned'}
+            assert result['players'][player_id]['total_matches'] == 1
+            assert result['players'][player_id]['total_pinned'] == 1
+            for match in (first, second):
+                count = len(SinglePlanning.get_match_planning(match['id']))
+                assert result['matches'][match['id']]['match_player_count'] == count
+                assert result['matches'][match['id']]['rule_violation'] == (count > 4)
+        finally:
+            Player.delete(player_id)
+
+    def test_matrix_edits_batch_is_atomic(self):
+        """One bad edit leaves the whole batch unapplied"""
+        match = Match.get_all()[0]
+        player_id = Player.create(name="Test Matrix Batch Atomic")
+        try:
+            with pytest.raises(Exception):
+                SinglePlanning.apply_matrix_edits([
+                    (player_id, match['id'], 'assign'),
+                    (-1, match['id'], 'assign'),
+                ])
+            assert player_id not in [p['player_id'] for p in SinglePlanning.get_match_planning(match['id'])]
+            with pytest.raises(ValueError):
+                SinglePlanning.apply_matrix_edits([(player_id, match['id'], 'explode')])
+        finally:
+            Player.delete(player_id)
+
+    def test_upcoming_limit(self):
+        """The limit is applied in SQL and keeps the date order"""
+        upcoming = Match.get_upcoming()
+        assert Match.get_upcoming(limit=2) == upcoming[:2]
+
+
+class TestRegenerationPreview:
+    """Test the dry-run regeneration and applying its preview token"""
+
+    def _rows(self):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT match_id, player_id, is_pinned, actually_played FROM match_planning
+            WHERE planning_version_id = 1 ORDER BY match_id, player_id
+        ''')
+        rows = [tuple(r.values()) for r in cursor.fetchall()]
+        cursor.close()
+        conn.close()
+        return rows
+
+    def test_preview_then_apply(self):
+        """A dry run writes nothing; applying its token gives the regenerated planning"""
+        before = self._rows()
+        preview = SinglePlanning.regenerate_planning(seed=7, dry_run=True)
+        assert preview['success'] is True
+        assert preview['dry_run'] is True
+        assert self._rows() == before
+        added = sum(len(m['added']) for m in preview['matches'])
+        removed = sum(len(m['removed']) for m in preview['matches'])
+        assert sum(d['delta'] for d in preview['player_deltas']) == added - removed
+
+        applied = SinglePlanning.apply_preview(preview['preview_token'])
+        assert applied['success'] is True
+        assert applied['changes'] == preview['changes']
+        after = self._rows()
+        # A token can be used once
+        assert SinglePlanning.apply_preview(preview['preview_token'])['not_found'] is True
+
+        SinglePlanning.undo_last_snapshot()
+        assert self._rows() == before
+        SinglePlanning.regenerate_planning(seed=7)
+        assert self._rows() == after
+        SinglePlanning.undo_last_snapshot()
+        assert self._rows() == before
+
+    def test_seeded_preview_is_memoized(self):
+        """Repeating a seeded preview on unchanged input is served from the plan cache"""
+        first = SinglePlanning.regenerate_planning(seed=11, dry_run=True)
+        second = SinglePlanning.regenerate_planning(seed=11, dry_run=True)
+        assert second['cached'] is True
+        assert second['changes'] == first['changes']
+        assert second['objective'] == first['objective']
+        assert second['matches'] == first['matches']
+
+    def test_stale_preview_is_rejected(self):
+        """A preview is not applied after the planning input has changed"""
+        before = self._rows()
+        preview = SinglePlanning.regenerate_planning(dry_run=True)
+        player_id = Player.create(name="Test Preview Stale")
+        try:
+            result = SinglePlanning.apply_preview(preview['preview_token'])
+            assert result['success'] is False
+            assert result['stale'] is True
+            assert self._rows() == before
+        finally:
+            Player.delete(player_id)
+
 
 if __name__ == "__main__":
     # Run tests with verbose output
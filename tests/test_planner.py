@@ -0,0 +1,538 @@
+import pytest
+import sys
+import os
+import random
+import multiprocessing
+from datetime import date, timedelta
+
+# Add the app directory to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import planner, local_search, season_solver, scoring, plan_cache, feasibility, allocation
+from app.services.availability import AvailabilityMatrix
+from config import Config
+from app.services.single_planning import SinglePlanning
+
+
+def make_season(num_players=8, num_matches=12):
+    """Build a small in-memory season: weekly matches, alternating home/away."""
+    players = [
+        {'id': i, 'name': f'Speler {i}', 'partner_id': None, 'prefer_partner_together': True}
+        for i in range(1, num_players + 1)
+    ]
+    # Players 1 and 2 are partners
+    players[0]['partner_id'] = 2
+    players[1]['partner_id'] = 1
+    start = date(2025, 9, 5)
+    matches = [
+        {'id': 100 + i, 'match_date': start + timedelta(days=7 * i), 'is_home': i % 2 == 0,
+         'home_team': 'Thuis', 'away_team': 'Uit'}
+        for i in range(num_matches)
+    ]
+    return players, matches
+
+
+class TestPlanSeason:
+    """Test suite for the DB-free season planner"""
+
+    def test_four_players_per_match(self):
+        """Every match gets exactly 4 players when enough are available"""
+        players, matches = make_season()
+        result = planner.plan_season(matches, players, {}, {}, rng=random.Random(1))
+        assert result['rule_violations'] == []
+        for m in matches:
+            assert len(set(result['assignments'][m['id']])) == 4
+
+    def test_respects_availability(self):
+        """Unavailable players are never planned"""
+        players, matches = make_season()
+        availability = {3: {m['id']: False for m in matches}}
+        result = planner.plan_season(matches, players, availability, {}, rng=random.Random(2))
+        for player_ids in result['assignments'].values():
+            assert 3 not in player_ids
+
+    def test_pinned_players_are_kept(self):
+        """Pinned players count toward the lineup and are not planned twice"""
+        players, matches = make_season()
+        pinned = {matches[0]['id']: [5, 6]}
+        result = planner.plan_season(matches, players, {}, pinned, rng=random.Random(3))
+        first = result['assignments'][matches[0]['id']]
+        assert len(first) == 2
+        assert not set(first) & {5, 6}
+
+    def test_no_double_booking_on_same_date(self):
+        """A player is never planned for two matches on the same date"""
+        players, matches = make_season()
+        # Cup match on the same date as the first league match
+        matches.insert(1, dict(matches[0], id=999, is_home=True))
+        result = planner.plan_season(matches, players, {}, {}, rng=random.Random(4))
+        first = set(result['assignments'][matches[0]['id']])
+        cup = set(result['assignments'][999])
+        assert not first & cup
+
+    def test_existing_bookings_block_same_date(self):
+        """Assignments outside the scope still block players on that date"""
+        players, matches = make_season()
+        bookings = planner.build_date_bookings([(555, 1), (555, 2)], {555: matches[0]['match_date']})
+        result = planner.plan_season(matches, players, {}, {}, date_bookings=bookings, rng=random.Random(5))
+        assert not {1, 2} & set(result['assignments'][matches[0]['id']])
+
+    def test_fair_distribution(self):
+        """Matches are spread evenly over the available players"""
+        players, matches = make_season(num_players=8, num_matches=12)
+        result = planner.plan_season(matches, players, {}, {}, rng=random.Random(6))
+        counts = result['match_counts'].values()
+        assert max(counts) - min(counts) <= 2
+
+
+class TestSeasonObjective:
+    """Test the season objective and multi-start selection"""
+
+    def test_objective_penalizes_short_lineups(self):
+        players, matches = make_season(num_players=8, num_matches=2)
+        full = {matches[0]['id']: [1, 3, 4, 5], matches[1]['id']: [2, 6, 7, 8]}
+        short = {matches[0]['id']: [1, 3, 4], matches[1]['id']: [2, 6, 7, 8]}
+        full_score = planner.evaluate_plan(matches, full, players)
+        short_score = planner.evaluate_plan(matches, short, players)
+        assert full_score['shortfall'] == 0
+        assert short_score['shortfall'] == 1
+        assert short_score['total'] > full_score['total']
+
+    def test_objective_counts_spacing_and_partner_hits(self):
+        players, matches = make_season(num_players=8, num_matches=2)
+        lineups = {matches[0]['id']: [1, 2, 3, 4], matches[1]['id']: [1, 2, 5, 6]}
+        score = planner.evaluate_plan(matches, lineups, players)
+        assert score['spacing'] == 2
+        assert score['partner_hits'] == 2
+
+    def test_multistart_keeps_best_run(self):
+        players, matches = make_season(num_players=9, num_matches=10)
+        plan_kwargs = {
+            'target_matches': matches, 'active_players': players, 'availability': {},
+            'pinned_assignments': {}, 'date_bookings': None, 'unplayed_matches': matches,
+        }
+        seeds = planner.derive_seeds(11, 4)
+        best = planner.plan_season_multistart(plan_kwargs, matches, restarts=4, seed=11, max_workers=2)
+        assert best['restarts_completed'] == 4
+        singles = [planner.run_seeded(seed, plan_kwargs, matches) for seed in seeds]
+        assert best['objective']['total'] == min(r['objective']['total'] for r in singles)
+        # Same seed, same plan
+        same = [r for r in singles if r['seed'] == best['seed']][0]
+        assert same['assignments'] == best['assignments']
+
+    def test_multistart_budget_stops_workers(self):
+        players, matches = make_season(num_players=9, num_matches=10)
+        plan_kwargs = {
+            'target_matches': matches, 'active_players': players, 'availability': {},
+            'pinned_assignments': {}, 'date_bookings': None, 'unplayed_matches': matches,
+        }
+        # Budget over before any run finishes: the first finished run is awaited
+        best = planner.plan_season_multistart(plan_kwargs, matches, restarts=6, seed=3,
+                                              max_workers=2, time_budget=0.001)
+        assert best['restarts_completed'] >= 1
+        # No pool workers left running after the budget
+        assert multiprocessing.active_children() == []
+
+    def test_same_seed_reproduces_plan(self):
+        players, matches = make_season(num_players=9, num_matches=10)
+        plan_kwargs = {
+            'target_matches': matches, 'active_players': players, 'availability': {},
+            'pinned_assignments': {}, 'date_bookings': None, 'unplayed_matches': matches,
+        }
+        first = planner.run_seeded(42, plan_kwargs, matches)
+        second = planner.run_seeded(42, plan_kwargs, matches)
+        assert first['assignments'] == second['assignments']
+        assert first['objective'] == second['objective']
+        # A multi-start's first run uses the base seed itself
+        assert planner.derive_seeds(42, 3)[0] == 42
+
+
+class TestScoring:
+    """Test the vectorized players×matches scoring"""
+
+    def test_matrix_counts_and_cooccurrence(self):
+        players, matches = make_season(num_players=5, num_matches=3)
+        lineups = {100: [1, 2, 3, 4], 101: [1, 2, 5], 102: [3, 4, 5, 1]}
+        A = scoring.build_matrix([p['id'] for p in players], [m['id'] for m in matches], lineups)
+        assert A.shape == (5, 3)
+        assert list(scoring.match_counts(A)) == [3, 2, 2, 2, 2]
+        home, away = scoring.home_away_counts(A, scoring.home_mask(matches))
+        assert list(home) == [2, 1, 2, 2, 1] and list(away) == [1, 1, 0, 0, 1]
+        assert list(scoring.back_to_back(A)) == [2, 1, 0, 0, 1]
+        C = scoring.cooccurrence(A)
+        assert C[0, 1] == 2 and C[2, 3] == 2 and C[1, 2] == 1
+        assert list(C.diagonal()) == [3, 2, 2, 2, 2]
+
+    def test_scorer_matches_reference_objective(self):
+        players, matches = make_season(num_players=9, num_matches=10)
+        plan_kwargs = {
+            'target_matches': matches, 'active_players': players, 'availability': {},
+            'pinned_assignments': {}, 'date_bookings': None, 'unplayed_matches': matches,
+        }
+        result = planner.run_seeded(4, plan_kwargs, matches)
+        lineups = planner.build_lineups(matches, {}, result['assignments'])
+        state = local_search._SeasonState(matches, lineups, players, {})
+        assert planner.evaluate_plan(matches, lineups, players)['total'] == round(state.total(), 4)
+
+
+class TestLocalSearch:
+    """Test the simulated annealing post-optimizer"""
+
+    def _greedy(self, players, matches, availability=None, pinned=None):
+        plan_kwargs = {
+            'target_matches': matches, 'active_players': players, 'availability': availability or {},
+            'pinned_assignments': pinned or {}, 'date_bookings': None, 'unplayed_matches': matches,
+        }
+        return plan_kwargs, planner.run_seeded(5, plan_kwargs, matches)
+
+    def test_incremental_objective_matches_full_evaluation(self):
+        players, matches = make_season(num_players=9, num_matches=10)
+        plan_kwargs, result = self._greedy(players, matches)
+        lineups = planner.build_lineups(matches, {}, result['assignments'])
+        state = local_search._SeasonState(matches, lineups, players, {})
+        rng = random.Random(3)
+        for _ in range(200):
+            i = rng.randrange(len(matches))
+            p = rng.choice(state.lineups[i])
+            q = rng.choice(state.player_ids)
+            state.remove(i, p)
+            state.add(i, q if state.can_add(i, q) else p)
+        full = planner.evaluate_plan(matches, {m['id']: state.lineups[i] for i, m in enumerate(matches)}, players)
+        assert round(state.total(), 4) == full['total']
+        assert state.components() == {k: v for k, v in full.items() if k != 'total'}
+
+    def test_state_starts_from_scorer_components(self):
+        players, matches = make_season(num_players=9, num_matches=6)
+        plan_kwargs, result = self._greedy(players, matches)
+        lineups = planner.build_lineups(matches, {}, result['assignments'])
+        # An inactive player left in a lineup only counts towards the lineup size
+        lineups[matches[1]['id']].append(12345)
+        lineups[matches[2]['id']].append(12345)
+        state = local_search._SeasonState(matches, lineups, players, {})
+        full = planner.evaluate_plan(matches, lineups, players)
+        assert state.components() == {k: v for k, v in full.items() if k != 'total'}
+
+    def test_optimizer_improves_and_respects_rules(self):
+        players, matches = make_season(num_players=9, num_matches=12)
+        # Cup match on the same date as the third match
+        cup = dict(matches[2], id=999, is_home=False)
+        twin_id = matches[2]['id']
+        matches.append(cup)
+        matches.sort(key=lambda m: (m['match_date'], m['id']))
+        availability = {4: {matches[0]['id']: False, matches[5]['id']: False}}
+        pinned = {matches[1]['id']: [7]}
+        plan_kwargs, result = self._greedy(players, matches, availability, pinned)
+        improved = local_search.optimize_plan(
+            result, plan_kwargs, matches, time_budget=5, max_iterations=3000, rng=random.Random(1)
+        )
+        report = improved['optimizer']
+        assert report['after'] <= report['before']
+        assert report['improvement'] == round(report['before'] - report['after'], 4)
+        assert improved['rule_violations'] == []
+        assert 7 not in improved['assignments'][matches[1]['id']]
+        for mid in (matches[0]['id'], matches[5]['id']):
+            assert 4 not in improved['assignments'][mid]
+        lineups = planner.build_lineups(matches, pinned, improved['assignments'])
+        assert not set(lineups[999]) & set(lineups[twin_id])
+
+    def test_optimizer_is_reproducible_with_iteration_cap(self):
+        players, matches = make_season(num_players=9, num_matches=10)
+        plan_kwargs, result = self._greedy(players, matches)
+        runs = [
+            local_search.optimize_plan(result, plan_kwargs, matches, time_budget=10, max_iterations=1000, rng=random.Random(8))
+            for _ in range(2)
+        ]
+        assert runs[0]['assignments'] == runs[1]['assignments']
+
+
+    def test_repair_only_touches_invalid_match_and_neighbours(self):
+        players, matches = make_season(num_players=9, num_matches=10)
+        plan_kwargs, result = self._greedy(players, matches)
+        lineups = planner.build_lineups(matches, {}, result['assignments'])
+        broken = matches[5]['id']
+        dropped = lineups[broken][0]
+        plan_kwargs['availability'] = {dropped: {broken: False}}
+        repair = local_search.repair_plan(plan_kwargs, matches, lineups, [(dropped, broken)], neighbourhood=1)
+        assert repair['invalid_matches'] == [broken]
+        assert set(repair['affected_matches']) <= {matches[4]['id'], broken, matches[6]['id']}
+        assert dropped not in repair['lineups'][broken]
+        assert len(set(repair['lineups'][broken])) == 4
+
+    def test_repair_ignores_still_valid_cells(self):
+        players, matches = make_season(num_players=9, num_matches=6)
+        plan_kwargs, result = self._greedy(players, matches)
+        lineups = planner.build_lineups(matches, {}, result['assignments'])
+        repair = local_search.repair_plan(plan_kwargs, matches, lineups, [(lineups[matches[0]['id']][0], matches[0]['id'])])
+        assert repair['invalid_matches'] == []
+        assert repair['lineups'] == {}
+
+
+    def test_rank_substitutes_only_valid_candidates(self):
+        players, matches = make_season(num_players=9, num_matches=8)
+        plan_kwargs, result = self._greedy(players, matches)
+        lineups = planner.build_lineups(matches, {}, result['assignments'])
+        match_id = matches[3]['id']
+        leaving = lineups[match_id][0]
+        blocked = next(p['id'] for p in players if p['id'] not in lineups[match_id])
+        plan_kwargs['availability'] = {blocked: {match_id: False}}
+        ranked = local_search.rank_substitutes(plan_kwargs, matches, lineups, match_id, leaving, limit=None)
+        ids = [r['player_id'] for r in ranked]
+        assert ids and blocked not in ids and leaving not in ids
+        assert not set(ids) & set(lineups[match_id])
+        deltas = [r['objective_delta'] for r in ranked]
+        assert deltas == sorted(deltas)
+        assert local_search.rank_substitutes(plan_kwargs, matches, lineups, match_id, 12345) == []
+
+
+class TestSeasonSolver:
+    """Test the exact (MILP) plan mode"""
+
+    def _kwargs(self, players, matches, availability=None, pinned=None):
+        return {
+            'target_matches': matches, 'active_players': players, 'availability': availability or {},
+            'pinned_assignments': pinned or {}, 'date_bookings': None, 'unplayed_matches': matches,
+        }
+
+    @pytest.mark.skipif(not season_solver.is_available(), reason="PuLP/CBC not installed")
+    def test_solver_respects_rules(self):
+        players, matches = make_season(num_players=9, num_matches=6)
+        cup = dict(matches[2], id=999, is_home=False)
+        matches.append(cup)
+        matches.sort(key=lambda m: (m['match_date'], m['id']))
+        availability = {4: {matches[0]['id']: False}}
+        pinned = {matches[1]['id']: [7]}
+        plan_kwargs = self._kwargs(players, matches, availability, pinned)
+        greedy = planner.run_seeded(1, plan_kwargs, matches)
+        result = season_solver.plan_season_exact(plan_kwargs, matches, greedy, time_limit=2)
+        report = result['solver']
+        assert report['solve_time'] >= 0
+        assert report['used'] in ('solver', 'greedy')
+        assert result['objective']['total'] <= greedy['objective']['total']
+        assert result['rule_violations'] == []
+        assert 4 not in result['assignments'][matches[0]['id']]
+        assert 7 not in result['assignments'][matches[1]['id']]
+        lineups = planner.build_lineups(matches, pinned, result['assignments'])
+        for m in matches:
+            assert len(set(lineups[m['id']])) == 4
+        assert not set(lineups[999]) & set(lineups[cup_twin(matches)])
+
+    def test_keeps_greedy_unless_solver_scores_better(self, monkeypatch):
+        players, matches = make_season(num_players=6, num_matches=3)
+        plan_kwargs = self._kwargs(players, matches)
+        greedy = planner.run_seeded(2, plan_kwargs, matches)
+        # A proven-optimal model solution that scores no better than the greedy plan
+        monkeypatch.setattr(season_solver, 'solve_season', lambda *args: (
+            dict(greedy['assignments']), {'status': 'Optimal', 'optimal': True}))
+        result = season_solver.plan_season_exact(plan_kwargs, matches, greedy)
+        assert result['solver']['used'] == 'greedy'
+        assert result['solver']['optimal'] is True
+        assert result['objective']['total'] == greedy['objective']['total']
+
+    def test_falls_back_to_greedy_without_solver(self, monkeypatch):
+        players, matches = make_season(num_players=6, num_matches=3)
+        plan_kwargs = self._kwargs(players, matches)
+        greedy = planner.run_seeded(2, plan_kwargs, matches)
+        monkeypatch.setattr(season_solver, 'pulp', None)
+        result = season_solver.plan_season_exact(plan_kwargs, matches, greedy)
+        assert result['solver']['used'] == 'greedy'
+        assert result['solver']['status'] == 'unavailable'
+        assert result['assignments'] == greedy['assignments']
+
+
+def cup_twin(matches):
+    """The league match that shares its date with the cup match (id 999)."""
+    cup = [m for m in matches if m['id'] == 999][0]
+    return [m['id'] for m in matches if m['match_date'] == cup['match_date'] and m['id'] != 999][0]
+
+
+class TestFeasibility:
+    """Test the feasibility pre-check"""
+
+    def _kwargs(self, players, matches, availability=None, pinned=None):
+        return {
+            'target_matches': matches, 'active_players': players, 'availability': availability or {},
+            'pinned_assignments': pinned or {}, 'date_bookings': None, 'unplayed_matches': matches,
+        }
+
+    def test_match_short_of_players_matches_planner(self):
+        players, matches = make_season(num_players=6, num_matches=4)
+        availability = {pid: {100: False} for pid in (1, 2, 3)}
+        kwargs = self._kwargs(players, matches, availability)
+        report = feasibility.check_feasibility(kwargs)
+        assert report['feasible'] is False
+        assert report['total_shortfall'] == 1
+        assert [(m['match_id'], m['candidates'], m['status']) for m in report['matches']] == [(100, 3, 'infeasible')]
+        # The planner can do no better than the pre-check says
+        result = planner.run_seeded(1, kwargs, matches)
+        assert [v['match_id'] for v in result['rule_violations']] == [100]
+
+    def test_same_date_needs_distinct_players(self):
+        players, matches = make_season(num_players=7, num_matches=3)
+        matches.append(dict(matches[1], id=999, is_home=True))
+        report = feasibility.check_feasibility(self._kwargs(players, matches))
+        # Each match alone has 7 candidates, but the date needs 8 players
+        assert report['matches'] == []
+        assert report['total_shortfall'] == 1
+        assert report['dates'][0]['matches'] == [cup_twin(matches), 999]
+        assert report['dates'][0]['available_players'] == 7
+
+    def test_players_below_fair_share_and_pinned_over_cap(self):
+        players, matches = make_season(num_players=8, num_matches=8)
+        # Fair share is 4 matches; player 3 can only play two
+        availability = {3: {m['id']: False for m in matches[2:]}}
+        pinned = {m['id']: [4] for m in matches[:6]}
+        report = feasibility.check_feasibility(self._kwargs(players, matches, availability, pinned))
+        assert report['feasible'] is True
+        assert report['fairness']['fair_share'] == 4
+        issues = {p['player_id']: p['issues'] for p in report['players']}
+        assert issues == {3: ['below_fair_share'], 4: ['pinned_over_cap']}
+
+
+class TestAllocation:
+    """Test the min-cost-flow allocation stage"""
+
+    def _kwargs(self, players, matches, availability=None, pinned=None):
+        return {
+            'target_matches': matches, 'active_players': players, 'availability': availability or {},
+            'pinned_assignments': pinned or {}, 'date_bookings': None, 'unplayed_matches': matches,
+        }
+
+    def test_min_cost_flow(self):
+        graph = allocation.MinCostFlow(4)
+        cheap = graph.add_edge(0, 1, 2, 1)
+        graph.add_edge(0, 2, 2, 3)
+        graph.add_edge(1, 3, 1, 1)
+        graph.add_edge(2, 3, 3, -1)
+        graph.add_edge(1, 2, 1, 0)
+        flow, cost = graph.solve(0, 3)
+        assert flow == 4
+        assert cost == 6
+        assert graph.flow_on(cheap) == 2
+
+    def test_respects_rules_and_is_exactly_fair(self):
+        players, matches = make_season(num_players=9, num_matches=6)
+        matches.append(dict(matches[2], id=999, is_home=False))
+        matches.sort(key=lambda m: (m['match_date'], m['id']))
+        availability = {4: {matches[0]['id']: False}}
+        pinned = {matches[1]['id']: [7]}
+        result = allocation.plan_season_flow(
+            self._kwargs(players, matches, availability, pinned), matches, rng=random.Random(1))
+        assert result['rule_violations'] == []
+        assert 4 not in result['assignments'][matches[0]['id']]
+        lineups = planner.build_lineups(matches, pinned, result['assignments'])
+        for m in matches:
+            assert len(set(lineups[m['id']])) == 4
+        assert not set(lineups[999]) & set(lineups[cup_twin(matches)])
+        counts = [sum(pid in lineup for lineup in lineups.values()) for pid in range(1, 10)]
+        assert max(counts) - min(counts) <= 1
+        assert result['allocation']['best_round'] >= 1
+
+    def test_same_seed_same_plan(self):
+        players, matches = make_season()
+        kwargs = self._kwargs(players, matches)
+        first = planner.run_seeded(3, kwargs, matches, allocation='flow')
+        second = planner.run_seeded(3, kwargs, matches, allocation='flow')
+        assert first['assignments'] == second['assignments']
+        assert first['seed'] == 3
+
+    def test_fills_what_feasibility_allows(self):
+        players, matches = make_season(num_players=6, num_matches=4)
+        availability = {pid: {100: False} for pid in (1, 2, 3)}
+        kwargs = self._kwargs(players, matches, availability)
+        result = allocation.plan_season_flow(kwargs, matches, rng=random.Random(2), refine_iterations=0)
+        missing = sum(4 - len(pids) for pids in result['assignments'].values())
+        assert missing == feasibility.check_feasibility(kwargs)['total_shortfall']
+
+
+class TestAvailabilityBitsets:
+    """Test the bitset availability matrix (no database)"""
+
+    ROWS = [(1, 100, True, None), (2, 100, False, 'vakantie'), (1, 101, False, None), (3, 102, True, None)]
+
+    def test_lookups(self):
+        matrix = AvailabilityMatrix(5, self.ROWS)
+        assert matrix.match_ids == [100, 101, 102]
+        assert matrix.status(1, 100) is True
+        assert matrix.status(1, 101) is False
+        assert matrix.status(2, 101) is None
+        assert matrix.is_available(2, 101) is True
+        assert matrix.is_available(2, 101, default=False) is False
+        assert matrix.entry(2, 100) == {'is_available': False, 'notes': 'vakantie'}
+        assert matrix.for_player(1) == {100: True, 101: False}
+        assert matrix.for_match(100) == {1: True, 2: False}
+        assert matrix.counts(1) == (1, 1)
+        assert len(matrix) == 4
+
+    def test_template_and_planner_views(self):
+        matrix = AvailabilityMatrix(5, self.ROWS)
+        assert matrix.get(2, {}).get(100, {}).get('notes') == 'vakantie'
+        assert matrix.get(2, {}).get(102, {}) == {}
+        assert matrix.get(9, {}) == {}
+        # Only unavailable cells: the planner treats no answer as available
+        assert matrix.planner_view() == {1: {101: False}, 2: {100: False}}
+
+    def test_fingerprint_follows_content(self):
+        same = AvailabilityMatrix(6, self.ROWS)
+        assert same.fingerprint == AvailabilityMatrix(5, self.ROWS).fingerprint
+        changed = AvailabilityMatrix(7, self.ROWS[:-1] + [(3, 102, False, None)])
+        assert changed.fingerprint != same.fingerprint
+
+
+class TestPlanningDiff:
+    """Test the delta computation used for undo snapshots"""
+
+    def test_diff_only_contains_changed_rows(self):
+        before = {(1, 10): (True, False), (1, 11): (False, False), (2, 12): (False, False)}
+        after = {(1, 10): (True, False), (2, 12): (False, True), (2, 13): (False, False)}
+        changes = sorted(SinglePlanning._diff_planning(before, after))
+        assert changes == [
+            ('added', 2, 13, None, None, False, False),
+            ('changed', 2, 12, False, False, False, True),
+            ('removed', 1, 11, False, False, None, None),
+        ]
+
+    def test_diff_of_identical_states_is_empty(self):
+        state = {(1, 10): (False, False)}
+        assert SinglePlanning._diff_planning(state, dict(state)) == []
+
+
+class TestPlanCache:
+    """Test the memoized planner results"""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self, monkeypatch):
+        monkeypatch.setattr(Config, 'PLAN_CACHE_SIZE', 2)
+        monkeypatch.setattr(Config, 'PLAN_CACHE_DB', False)
+        plan_cache.clear()
+        yield
+        plan_cache.clear()
+
+    def test_key_depends_on_state_and_params(self):
+        key = plan_cache.make_key('abc', seed=1, plan_mode='all')
+        assert key == plan_cache.make_key('abc', plan_mode='all', seed=1)
+        assert key != plan_cache.make_key('abd', seed=1, plan_mode='all')
+        assert key != plan_cache.make_key('abc', seed=2, plan_mode='all')
+
+    def test_lru_returns_copies_and_evicts_oldest(self):
+        result = {'assignments': {1: [10, 11]}, 'seed': 5}
+        plan_cache.put('a', result)
+        cached = plan_cache.get('a')
+        assert cached == result
+        cached['assignments'][1].append(12)
+        assert plan_cache.get('a') == result
+
+        plan_cache.put('b', {'seed': 6})
+        plan_cache.get('a')  # 'a' is now the most recently used
+        plan_cache.put('c', {'seed': 7})
+        assert plan_cache.get('b') is None
+        assert plan_cache.get('a') is not None
+        assert plan_cache.stats()['size'] == 2
+
+    def test_json_round_trip_restores_int_keys(self):
+        restored = plan_cache._from_json({'assignments': {'3': [1, 2]}, 'match_counts': {'1': 4}, 'seed': 9})
+        assert restored['assignments'] == {3: [1, 2]}
+        assert restored['match_counts'] == {1: 4}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])